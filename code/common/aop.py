@@ -1,11 +1,14 @@
 #! /usr/bin/env python
 # -*- coding:utf8 -*-
 import time
-from common.log import get_logger
+from functools import wraps
+
+from common.metrics import get_metrics_collector
 
 def timing(func):
     """
-    自定义annotation用来给方法的执行时间计时
+    自定义annotation用来给方法的执行时间计时，
+    耗时记录到指标收集器中按方法名汇总，不再每次调用都输出日志
     Parameters
     ----------
     func
@@ -14,11 +17,16 @@ def timing(func):
     -------
 
     """
+    collector = get_metrics_collector()
+    method = func.__qualname__
+
+    @wraps(func)
     def fun(*args, **kwargs):
         t = time.perf_counter()
-        result = func(*args, **kwargs)
-        get_logger().info(f'Method-{func.__name__} cost time: {time.perf_counter() - t:.8f} s')
-        return result
+        try:
+            return func(*args, **kwargs)
+        finally:
+            collector.observe('method', time.perf_counter() - t, method=method)
     return fun
 
 def deamon(func):
@@ -20,6 +20,7 @@ STOCK_TICK_DATA_PATH = config.get('common', 'data_path') + '/original/stock/tick
 STOCK_TICK_TEMP_DATA_PATH = config.get('common', 'data_path') + '/temp/stock/tick/'
 STOCK_TICK_ORGANIZED_DATA_PATH = 'E:\\data\\' + 'organized' + os.path.sep + 'stock' + os.path.sep + 'tick' + os.path.sep
 STOCK_TICK_COMBINED_DATA_PATH = 'G:\\data\\' + 'organized' + os.path.sep + 'stock' + os.path.sep + 'tick' + os.path.sep
+STOCK_TICK_COLUMNAR_DATA_PATH = 'E:\\data\\' + 'columnar' + os.path.sep + 'stock' + os.path.sep + 'tick' + os.path.sep
 STOCK_TICK_COMPARE_DATA_PATH = 'E:\\data\\' + 'compare' + os.path.sep + 'stock' + os.path.sep + 'tick' + os.path.sep
 TEMP_PATH = config.get('common', 'data_path') + os.path.sep + 'temp' + os.path.sep
 # TEST_PATH = config.get('common', 'data_path') + os.path.sep + 'test' + os.path.sep
@@ -41,6 +42,11 @@ DB_CONNECTION = config.get('common', 'db_connection')
 
 #物理信息
 CPU_CORE_NUMBER = psutil.cpu_count()
+#跨天股票数据缓存的内存上限，一次因子计算中所有缓存共用，常驻进程池按进程数和缓存数平分
+STOCK_DATE_CACHE_MEMORY_BUDGET = 4 * 1024 * 1024 * 1024
+#是否后台预取下一个交易日的股票数据，以及最多预取数量
+STOCK_DATE_CACHE_PREFETCH = False
+STOCK_DATE_CACHE_MAX_PREFETCH = 16
 
 #时间信息
 OFF_TIME_IN_SECOND = 5400
@@ -80,6 +86,10 @@ FILE_TYPE_CSV = '.csv'
 
 FUTURE_TICK_FILE_PREFIX = 'CFFEX'
 FUTURE_TICK_SAMPLE_INTERVAL = 0.5
+#整理后的期货数据按3秒对齐，一个bar为一个tick
+FUTURE_TICK_ORGANIZED_INTERVAL = 3
+#股指期货每天交易4小时，按整理后的bar计算
+FUTURE_TICK_COUNT_PER_DAY = int(4 * 3600 / FUTURE_TICK_ORGANIZED_INTERVAL)
 
 STOCK_TICK_SAMPLE_INTERVAL = 3
 
@@ -0,0 +1,274 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# 耗时直方图的分桶上限，单位秒
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60, math.inf)
+
+# prometheus指标名前缀
+METRIC_PREFIX = 'quantitative_'
+
+# 当前上下文的指标标签，如factor，product，date
+metric_labels = ContextVar('metric_labels', default=())
+
+
+def get_metric_labels():
+    return dict(metric_labels.get())
+
+
+@contextmanager
+def metric_context(**labels):
+    """
+    在上下文中追加指标标签，之后记录的指标都带上这些标签
+
+    Examples
+    --------
+    >>> with metric_context(factor='SpreadFactor', product='IF'):
+    >>>     factor.caculate(data)
+
+    """
+    current_labels = dict(metric_labels.get())
+    current_labels.update(labels)
+    token = metric_labels.set(tuple(sorted(current_labels.items())))
+    try:
+        yield
+    finally:
+        metric_labels.reset(token)
+
+
+class MetricsCollector():
+    """
+    进程内的指标收集器，支持计数器和耗时统计，
+    耗时统计同时记录次数，总耗时，最小值，最大值和直方图，
+    指标按 名称 + 标签 区分，子进程的指标通过snapshot和merge合并到父进程
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timers = {}
+
+    def get_key(self, name, labels):
+        key_labels = dict(metric_labels.get())
+        key_labels.update(labels)
+        return name, tuple(sorted(key_labels.items()))
+
+    def increase(self, name, value=1, **labels):
+        key = self.get_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        记录一次耗时
+
+        Parameters
+        ----------
+        name: 指标名
+        value: 耗时，单位秒
+        labels: 额外的标签
+
+        Returns
+        -------
+
+        """
+        key = self.get_key(name, labels)
+        bucket = next(i for i, upper in enumerate(HISTOGRAM_BUCKETS) if value <= upper)
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                # [次数, 总耗时, 最小值, 最大值, 各分桶次数]
+                timer = [0, 0.0, math.inf, 0.0, [0] * len(HISTOGRAM_BUCKETS)]
+                self._timers[key] = timer
+            timer[0] += 1
+            timer[1] += value
+            timer[2] = min(timer[2], value)
+            timer[3] = max(timer[3], value)
+            timer[4][bucket] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'timers': {key: [timer[0], timer[1], timer[2], timer[3], list(timer[4])] for key, timer in self._timers.items()}
+            }
+
+    def merge(self, snapshot):
+        """
+        合并其他进程的指标
+
+        Parameters
+        ----------
+        snapshot: 其他收集器snapshot的结果
+
+        Returns
+        -------
+
+        """
+        with self._lock:
+            for key, value in snapshot['counters'].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, other in snapshot['timers'].items():
+                timer = self._timers.get(key)
+                if timer is None:
+                    self._timers[key] = [other[0], other[1], other[2], other[3], list(other[4])]
+                else:
+                    timer[0] += other[0]
+                    timer[1] += other[1]
+                    timer[2] = min(timer[2], other[2])
+                    timer[3] = max(timer[3], other[3])
+                    timer[4] = [a + b for a, b in zip(timer[4], other[4])]
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._timers = {}
+
+    def get_counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def get_summary(self):
+        """
+        json格式的汇总，按总耗时倒序
+
+        Returns
+        -------
+
+        """
+        snapshot = self.snapshot()
+        counters = [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in snapshot['counters'].items()]
+        timers = [{
+            'name': name,
+            'labels': dict(labels),
+            'count': timer[0],
+            'total': timer[1],
+            'mean': timer[1] / timer[0],
+            'min': timer[2],
+            'max': timer[3]
+        } for (name, labels), timer in snapshot['timers'].items()]
+        timers.sort(key=lambda timer: timer['total'], reverse=True)
+        return {'counters': counters, 'timers': timers}
+
+    def to_prometheus(self):
+        """
+        prometheus文本格式，计数器为counter，耗时为histogram
+
+        Returns
+        -------
+
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name in sorted(set(map(lambda key: key[0], snapshot['counters'].keys()))):
+            metric_name = METRIC_PREFIX + name + '_total'
+            lines.append('# TYPE {0} counter'.format(metric_name))
+            for (cur_name, labels), value in sorted(snapshot['counters'].items()):
+                if cur_name == name:
+                    lines.append('{0}{1} {2}'.format(metric_name, format_labels(labels), value))
+        for name in sorted(set(map(lambda key: key[0], snapshot['timers'].keys()))):
+            metric_name = METRIC_PREFIX + name + '_seconds'
+            lines.append('# TYPE {0} histogram'.format(metric_name))
+            for (cur_name, labels), timer in sorted(snapshot['timers'].items(), key=lambda item: item[0]):
+                if cur_name != name:
+                    continue
+                cumulative_count = 0
+                for upper, count in zip(HISTOGRAM_BUCKETS, timer[4]):
+                    cumulative_count += count
+                    le = '+Inf' if upper == math.inf else str(upper)
+                    lines.append('{0}_bucket{1} {2}'.format(metric_name, format_labels(labels + (('le', le),)), cumulative_count))
+                lines.append('{0}_sum{1} {2}'.format(metric_name, format_labels(labels), timer[1]))
+                lines.append('{0}_count{1} {2}'.format(metric_name, format_labels(labels), timer[0]))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """
+        输出 path.json 和 path.prom 两个文件
+
+        Parameters
+        ----------
+        path: 不带后缀的文件路径
+
+        Returns
+        -------
+
+        """
+        dir_name = os.path.dirname(path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+        with open(path + '.json', 'w') as file:
+            json.dump(self.get_summary(), file, indent=2)
+        with open(path + '.prom', 'w') as file:
+            file.write(self.to_prometheus())
+
+
+def format_labels(labels):
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join(map(lambda label: '{0}="{1}"'.format(label[0], str(label[1]).replace('\\', '\\\\').replace('"', '\\"')), labels)) + '}'
+
+
+metrics_collector = MetricsCollector()
+
+
+def get_metrics_collector():
+    return metrics_collector
+
+
+@contextmanager
+def stage_timer(stage, **labels):
+    """
+    统计一段代码的耗时，如io，enrich，merge，concat
+
+    Examples
+    --------
+    >>> with stage_timer('io'):
+    >>>     data = read_decompress(path)
+
+    """
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics_collector.observe('stage', time.perf_counter() - t, stage=stage, **labels)
+
+
+def run_with_metrics(task, labels, arg):
+    """
+    子进程中执行任务，返回结果和这次任务记录的指标，由父进程合并，
+    fork出的子进程会继承父进程已有的指标，所以执行前先清空
+
+    Parameters
+    ----------
+    task: 任务
+    labels: 父进程提交任务时的标签
+    arg: 任务参数
+
+    Returns
+    -------
+    result, snapshot
+
+    """
+    metrics_collector.reset()
+    token = metric_labels.set(tuple(sorted(labels.items())))
+    try:
+        result = task(arg)
+    finally:
+        metric_labels.reset(token)
+    snapshot = metrics_collector.snapshot()
+    metrics_collector.reset()
+    return result, snapshot
+
+
+if __name__ == '__main__':
+    # with metric_context(factor='SpreadFactor', product='IF'):
+    #     with stage_timer('io'):
+    #         time.sleep(0.1)
+    # get_metrics_collector().dump('E:\\data\\report\\metrics\\test')
+    pass
@@ -6,8 +6,18 @@ import numpy as np
 
 from common.persistence.dbutils import create_session
 from common.persistence.po import Test, FactorConfig, StockReversionConfig, IndexConstituentConfig
+from common.persistence.trading_calendar import get_trading_calendar
 
 class BaseDao():
+    """
+    DAO基类，每个DAO使用自己的会话，用完后关闭，连接归还连接池
+
+    Examples
+    --------
+    >>> with IndexConstituentConfigDao() as index_constituent_config_dao:
+    >>>     index_constituent_config_dao.query_trading_date_by_tscode('600519')
+
+    """
 
     def __init__(self):
         self._session = create_session()
@@ -15,6 +25,12 @@ class BaseDao():
     def close(self):
         self._session.close()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
 
 class IndexConstituentConfigDao(BaseDao):
 
@@ -71,9 +87,23 @@ class IndexConstituentConfigDao(BaseDao):
         Returns
         -------
 
+        """
+        return set(list(map(lambda invalid: invalid[0] + invalid[1], self.get_invalid_pair_list(invalid_status))))
+
+    def get_invalid_pair_list(self, invalid_status=[1, 2]):
+        """
+        获取非法数据，返回(日期, 股票)列表
+
+        Parameters
+        ----------
+        invalid_status
+
+        Returns
+        -------
+
         """
         invalid_list = self._session.execute('select distinct date, tscode from index_constituent_config where status in :status', {'status': invalid_status}).fetchall()
-        return set(list(map(lambda invalid: invalid[0] + invalid[1], invalid_list)))
+        return list(map(lambda invalid: (invalid[0], invalid[1]), invalid_list))
 
     def get_invalid_date_list(self, invalid_status=[1, 2]):
         """
@@ -130,58 +160,27 @@ class FutureConfigDao(BaseDao):
         return start_date, end_date
 
     def filter_date(self, start_date='', end_date=''):
-        if start_date == '':
-            result_list = self._session.execute(
-                'select distinct date from future_instrument_config where date >= :end_date order by date',
-                {'end_date': end_date}).fetchall()
-        elif end_date == '':
-            result_list = self._session.execute(
-                'select distinct date from future_instrument_config where date <= :start_date order by date',
-                {'start_date': start_date}).fetchall()
-        else:
-            result_list = self._session.execute('select distinct date from future_instrument_config where date <= :start_date or date >= :end_date order by date', {'start_date': start_date, 'end_date':end_date}).fetchall()
-        result_list = list(map(lambda item: item[0], result_list))
-        return result_list
+        return get_trading_calendar().filter_date(start_date, end_date)
 
     def get_main_instrument_by_product_and_date(self, product, date):
-        result_list = self._session.execute('select instrument from future_instrument_config where is_main = 0 and product = :product and date = :date', {'product': product, 'date':date}).fetchall()
-        result_list = list(map(lambda item: item[0], result_list))
-        if len(result_list) > 0:
-            return result_list[0]
-        else:
-            return ''
+        return get_trading_calendar().get_main_instrument(product, date)
 
 class FutureInstrumentConfigDao(BaseDao):
+    """
+    交易日查询，直接使用进程内的交易日历
+    """
 
     def get_next_n_transaction_date(self, current_date, n):
-        result_list = self._session.execute('select distinct date from future_instrument_config where date > :current_date order by date', {'current_date': current_date}).fetchall()
-        if len(result_list) > n:
-            return result_list[n-1][0]
-        else:
-            return ''
+        return get_trading_calendar().get_next_n_transaction_date(current_date, n)
 
     def get_next_n_transaction_date_list(self, current_date, n):
-        result_list = self._session.execute('select distinct date from future_instrument_config where date > :current_date order by date', {'current_date': current_date}).fetchall()
-        if len(result_list) > n:
-            return list(map(lambda item: item[0], result_list[:n]))
-        else:
-            return []
+        return get_trading_calendar().get_next_n_transaction_date_list(current_date, n)
 
     def get_last_n_transaction_date(self, current_date, n):
-        result_list = self._session.execute('select distinct date from future_instrument_config where date < :current_date order by date desc', {'current_date': current_date}).fetchall()
-        if len(result_list) > n:
-            return result_list[n-1][0]
-        else:
-            return ''
+        return get_trading_calendar().get_last_n_transaction_date(current_date, n)
 
     def get_last_n_transaction_date_list(self, current_date, n):
-        result_list = self._session.execute('select distinct date from future_instrument_config where date < :current_date order by date desc', {'current_date': current_date}).fetchall()
-        if len(result_list) > n:
-            result_list = list(map(lambda item: item[0], result_list[:n]))
-            result_list.reverse()
-            return result_list
-        else:
-            return []
+        return get_trading_calendar().get_last_n_transaction_date_list(current_date, n)
 
 class StockReversionConfigDao(BaseDao):
 
@@ -189,9 +188,9 @@ class StockReversionConfigDao(BaseDao):
         self._session.query(StockReversionConfig).filter(StockReversionConfig.tscode.in_(stocks)).delete()
 
 if __name__ == '__main__':
-    constituent_config_dao = IndexConstituentConfigDao()
-    # # print(constituent_config_dao.query_trading_date_by_tscode('600519'))
-    print(constituent_config_dao.query_trading_date_by_tscode_list(['600519', '000001'], '2022-01-01', '2022-08-09'))
+    with IndexConstituentConfigDao() as constituent_config_dao:
+        # # print(constituent_config_dao.query_trading_date_by_tscode('600519'))
+        print(constituent_config_dao.query_trading_date_by_tscode_list(['600519', '000001'], '2022-01-01', '2022-08-09'))
     # # constituent_config_dao.update_status('2018-11-02', '601200', 0)
     # print(constituent_config_dao.get_invalid_list([1,2]))
     # print(constituent_config_dao.get_invalid_date_list([2]))
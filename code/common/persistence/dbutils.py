@@ -1,17 +1,94 @@
 #! /usr/bin/env python
 # -*- coding:utf8 -*-
+import os
+import threading
+from contextlib import contextmanager
+
 import pymysql
 
 from common.constants import DB_CONNECTION
 
+# 每个进程一个engine和session工厂，按进程号区分，fork出的子进程第一次使用时重建，
+# 会话不共享，每次创建新的会话，连接从连接池中获取
+engine_registry = {}
+registry_lock = threading.Lock()
+
+
+def get_engine():
+    """获取当前进程的数据库engine，带连接池，同一个进程内复用
+
+    Returns
+    -------
+    engine
+
+    """
+    pid = os.getpid()
+    registry = engine_registry.get('registry')
+    if registry is not None and registry['pid'] == pid:
+        return registry['engine']
+    with registry_lock:
+        registry = engine_registry.get('registry')
+        if registry is None or registry['pid'] != pid:
+            if registry is not None:
+                # 继承自父进程的连接不能在子进程中使用，丢弃连接池但不关闭父进程的连接
+                registry['engine'].dispose(close=False)
+            pymysql.install_as_MySQLdb()
+            from sqlalchemy import create_engine
+            from sqlalchemy.orm import sessionmaker
+            engine = create_engine(DB_CONNECTION, pool_pre_ping=True, pool_recycle=3600)
+            registry = {
+                'pid': pid,
+                'engine': engine,
+                'session_factory': sessionmaker(bind=engine)
+            }
+            engine_registry['registry'] = registry
+        return registry['engine']
+
+
+def get_session_factory():
+    """当前进程的session工厂，绑定当前进程的engine
+
+    Returns
+    -------
+    sessionmaker
+
+    """
+    get_engine()
+    return engine_registry['registry']['session_factory']
+
 
 def create_session():
-    """创建一个数据库链接会话
+    """创建新的数据库会话，连接来自当前进程的连接池，DAO和各个调用方不再各自创建engine，
+    会话不和其他调用方共享，用完后由调用方关闭，关闭时连接归还连接池
+    """
+    return get_session_factory()()
+
+
+@contextmanager
+def session_scope():
+    """数据库会话上下文，正常结束时提交，异常时回滚，结束时关闭会话
+
+    Examples
+    --------
+    >>> with session_scope() as session:
+    >>>     session.execute('delete from future_instrument_config')
+
+    """
+    session = create_session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def dispose_engine():
+    """释放当前进程的连接池，一般在进程退出前调用
     """
-    pymysql.install_as_MySQLdb()
-    from sqlalchemy import create_engine
-    engine = create_engine(DB_CONNECTION)
-    from sqlalchemy.orm import sessionmaker
-    DbSession = sessionmaker(bind=engine)
-    session = DbSession()
-    return session
+    with registry_lock:
+        registry = engine_registry.pop('registry', None)
+        if registry is not None and registry['pid'] == os.getpid():
+            registry['engine'].dispose()
@@ -0,0 +1,190 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import numpy as np
+
+from common.persistence.dbutils import session_scope
+
+
+class TradingCalendar():
+    """
+    交易日历：从future_instrument_config一次性加载所有交易日和每个品种每天的主力合约，
+    交易日保存为排序后的数组，查询时二分查找，不再每次调用都执行SQL
+
+    Parameters
+    ----------
+    date_list: list 交易日
+    main_instrument_dict: dict (品种, 日期) -> 主力合约
+    """
+
+    def __init__(self, date_list=[], main_instrument_dict={}):
+        self._date_array = np.array(sorted(set(date_list)), dtype=object)
+        self._main_instrument_dict = dict(main_instrument_dict)
+
+    @classmethod
+    def load(cls):
+        with session_scope() as session:
+            date_list = session.execute('select distinct date from future_instrument_config order by date').fetchall()
+            main_instrument_list = session.execute('select product, date, instrument from future_instrument_config where is_main = 0').fetchall()
+        main_instrument_dict = {}
+        for product, date, instrument in main_instrument_list:
+            # 和原来的查询一致，有多条记录时取第一条
+            main_instrument_dict.setdefault((product, date), instrument)
+        return cls(list(map(lambda item: item[0], date_list)), main_instrument_dict)
+
+    def get_date_list(self):
+        return self._date_array.tolist()
+
+    def get_next_n_transaction_date(self, current_date, n):
+        """
+        current_date之后的第n个交易日，之后的交易日不超过n个时返回空
+
+        Parameters
+        ----------
+        current_date
+        n
+
+        Returns
+        -------
+
+        """
+        start = np.searchsorted(self._date_array, current_date, side='right')
+        if len(self._date_array) - start > n:
+            return self._date_array[start + n - 1]
+        else:
+            return ''
+
+    def get_next_n_transaction_date_list(self, current_date, n):
+        start = np.searchsorted(self._date_array, current_date, side='right')
+        if len(self._date_array) - start > n:
+            return self._date_array[start: start + n].tolist()
+        else:
+            return []
+
+    def get_last_n_transaction_date(self, current_date, n):
+        """
+        current_date之前的第n个交易日，之前的交易日不超过n个时返回空
+
+        Parameters
+        ----------
+        current_date
+        n
+
+        Returns
+        -------
+
+        """
+        end = np.searchsorted(self._date_array, current_date, side='left')
+        if end > n:
+            return self._date_array[end - n]
+        else:
+            return ''
+
+    def get_last_n_transaction_date_list(self, current_date, n):
+        end = np.searchsorted(self._date_array, current_date, side='left')
+        if end > n:
+            return self._date_array[end - n: end].tolist()
+        else:
+            return []
+
+    def shift(self, date_array, n):
+        """
+        向量化的按交易日平移，n为正时往后，为负时往前，
+        非交易日先对齐到之后（n为正）或者之前（n为负）的交易日，超出日历范围的返回空
+
+        Parameters
+        ----------
+        date_array: ndarray or Series 日期
+        n: int
+
+        Returns
+        -------
+        ndarray
+
+        """
+        date_array = np.asarray(date_array, dtype=object)
+        position = np.searchsorted(self._date_array, date_array, side='left')
+        if n > 0:
+            position = np.where(np.isin(date_array, self._date_array), position + n, position + n - 1)
+        else:
+            position = position + n
+        is_valid = (position >= 0) & (position < len(self._date_array))
+        result = np.full(len(date_array), '', dtype=object)
+        result[is_valid] = self._date_array[position[is_valid]]
+        return result
+
+    def filter_date(self, start_date='', end_date=''):
+        """
+        不在[start_date, end_date]区间内的交易日，区间端点本身也返回
+
+        Parameters
+        ----------
+        start_date
+        end_date
+
+        Returns
+        -------
+
+        """
+        if start_date == '':
+            return self._date_array[self._date_array >= end_date].tolist()
+        elif end_date == '':
+            return self._date_array[self._date_array <= start_date].tolist()
+        else:
+            return self._date_array[(self._date_array <= start_date) | (self._date_array >= end_date)].tolist()
+
+    def get_main_instrument(self, product, date):
+        return self._main_instrument_dict.get((product, date), '')
+
+
+trading_calendar = None
+
+
+def get_trading_calendar():
+    """
+    进程内共享的交易日历，第一次使用时加载。
+    fork出的子进程继承父进程创建子进程前已经加载的日历，spawn时（Windows默认）子进程第一次使用时重新加载，
+    常驻进程池通过initializer传入父进程的日历，见set_trading_calendar
+
+    Returns
+    -------
+
+    """
+    global trading_calendar
+    if trading_calendar is None:
+        trading_calendar = TradingCalendar.load()
+    return trading_calendar
+
+
+def set_trading_calendar(calendar):
+    """
+    使用已经加载的交易日历，子进程初始化时调用
+
+    Parameters
+    ----------
+    calendar: TradingCalendar，为None时第一次使用时再加载
+
+    Returns
+    -------
+
+    """
+    global trading_calendar
+    trading_calendar = calendar
+
+
+def reset_trading_calendar():
+    """
+    future_instrument_config更新后调用，下次使用时重新加载
+
+    Returns
+    -------
+
+    """
+    global trading_calendar
+    trading_calendar = None
+
+
+if __name__ == '__main__':
+    # print(get_trading_calendar().get_last_n_transaction_date_list('2017-01-03', 5))
+    # print(get_trading_calendar().shift(np.array(['2017-01-03', '2017-01-04']), 3))
+    # print(get_trading_calendar().get_main_instrument('IH', '2018-03-20'))
+    pass
@@ -154,8 +154,8 @@ def get_last_or_next_trading_date_by_stock(stock, date, range_num = 1, backword=
 
     """
     if len(date_list) == 0:
-        index_constituent_config_dao = IndexConstituentConfigDao()
-        date_list = index_constituent_config_dao.query_trading_date_by_tscode(stock)
+        with IndexConstituentConfigDao() as index_constituent_config_dao:
+            date_list = index_constituent_config_dao.query_trading_date_by_tscode(stock)
     if len(date_list) > 0 and date in date_list:
         index = date_list.index(date)
         for i in range(range_num):
@@ -186,9 +186,8 @@ def get_last_or_next_trading_date_list_by_stock(stock, date, range_num = 1, back
 
     """
     if len(date_list) == 0:
-        index_constituent_config_dao = IndexConstituentConfigDao()
-        date_list = index_constituent_config_dao.query_trading_date_by_tscode(stock)
-        index_constituent_config_dao.close()
+        with IndexConstituentConfigDao() as index_constituent_config_dao:
+            date_list = index_constituent_config_dao.query_trading_date_by_tscode(stock)
     if len(date_list) > 0 and date in date_list:
         index = date_list.index(date)
         for i in range(range_num):
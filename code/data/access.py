@@ -10,6 +10,7 @@ from common.localio import read_decompress, list_files_in_path
 from common.constants import CONFIG_PATH, STOCK_TICK_ORGANIZED_DATA_PATH, FACTOR_PATH, STOCK_TICK_DATA_PATH, STOCK_TICK_COMBINED_DATA_PATH, STOCK_FILE_PREFIX, FACTOR_STANDARD_FIELD_TYPE
 from common.aop import timing
 from common.stockutils import get_full_stockcode_for_stock
+from data.columnar import StockTickColumnarStore
 from framework.localconcurrent import ProcessRunner, ThreadRunner
 from common.log import get_logger
 
@@ -29,12 +30,16 @@ class StockDataAccess(DataAccess):
 
     """
 
-    def __init__(self, check_original=True, combined_file_enabled=False):
+    def __init__(self, check_original=True, combined_file_enabled=False, columnar_enabled=False):
         self._check_original = check_original
         if check_original:
             self._combined_file_enabled = False
+            self._columnar_enabled = False
         else:
             self._combined_file_enabled = combined_file_enabled
+            self._columnar_enabled = columnar_enabled
+        if self._columnar_enabled:
+            self._columnar_store = StockTickColumnarStore()
 
     def access(self, *args):
         """
@@ -44,6 +49,7 @@ class StockDataAccess(DataAccess):
         args: tuple
             args[0]: date
             args[1]: tscode
+            args[2]: list 需要的列，可选，为空时返回全部列
 
         Returns
         -------
@@ -51,13 +57,18 @@ class StockDataAccess(DataAccess):
         """
         date = args[0]
         stock = args[1]
+        columns = args[2] if len(args) > 2 else []
+        if self._columnar_enabled and self._columnar_store.has_date(date):
+            return self.field_mapping(self._columnar_store.read(date, stock, columns))
         file_path = self.create_stock_tick_data_path(date)
         if self._combined_file_enabled:
             data = read_date_combined_file(date, file_path)
             data = data[data['tscode'] == get_full_stockcode_for_stock(stock)]
-            return self.field_mapping(data)
         else:
-            return self.field_mapping(read_decompress(file_path + stock + '.pkl'))
+            data = read_decompress(file_path + stock + '.pkl')
+        if len(columns) > 0:
+            data = data.loc[:, columns]
+        return self.field_mapping(data)
 
     def create_stock_tick_data_path(self, date):
         file_prefix = STOCK_FILE_PREFIX
@@ -86,7 +97,7 @@ class StockDataAccess(DataAccess):
         -------
 
         """
-        if data.dtypes['amount'] != FACTOR_STANDARD_FIELD_TYPE:
+        if 'amount' in data.columns and data.dtypes['amount'] != FACTOR_STANDARD_FIELD_TYPE:
             data['amount'] = data['amount'].astype(FACTOR_STANDARD_FIELD_TYPE)
         return data
 
@@ -225,6 +236,9 @@ if __name__ == '__main__':
     #测试加载日期文件
     # print(len(StockDailyDataAccess().access('2020-09-22')))
 
+    #测试按列加载列式文件
+    # print(StockDataAccess(False, columnar_enabled=True).access('20171106', '000021', ['tscode', 'date', 'time', 'price']))
+
     #测试股票数据完整路径生成
     # print(create_stock_file_path('2022','01','15'))
     # print(create_stock_file_path('2022','01','15','000001'))
@@ -0,0 +1,226 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import os
+import json
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from common.constants import STOCK_TICK_ORGANIZED_DATA_PATH, STOCK_TICK_COLUMNAR_DATA_PATH, STOCK_FILE_PREFIX, FACTOR_STANDARD_FIELD_TYPE
+from common.localio import read_decompress, list_files_in_path
+from common.exception.exception import InvalidValue
+from common.aop import timing
+from common.log import get_logger
+
+MANIFEST_FILE_NAME = 'manifest.json'
+COLUMN_FILE_SUFFIX = '.npy'
+NULL_MASK_FILE_SUFFIX = '.null.npy'
+
+
+def create_day_path(root_path, date):
+    """
+    生成按天存储的目录，和整理后的股票数据目录结构保持一致
+
+    Parameters
+    ----------
+    root_path
+    date
+
+    Returns
+    -------
+
+    """
+    date = date.replace('-', '')
+    year = date[0:4]
+    month = date[4:6]
+    return root_path + STOCK_FILE_PREFIX + year + os.path.sep + STOCK_FILE_PREFIX + year + month + os.path.sep + date + os.path.sep
+
+
+@lru_cache(maxsize=32)
+def read_manifest(day_path):
+    """
+    读取一天的清单文件，清单包含：
+    rows: 总行数
+    columns: 列名 -> 保存的类型
+    dtypes: 列名 -> 原始类型
+    nulls: 有空值掩码的字符串列
+    stocks: 股票 -> [起始行, 结束行)
+
+    Parameters
+    ----------
+    day_path
+
+    Returns
+    -------
+
+    """
+    with open(day_path + MANIFEST_FILE_NAME, 'r') as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=256)
+def open_column(file_path):
+    """
+    以mmap方式打开一个列文件，同一个文件只打开一次，不同股票的读取共用
+
+    Parameters
+    ----------
+    file_path
+
+    Returns
+    -------
+
+    """
+    return np.load(file_path, mmap_mode='r')
+
+
+class StockTickColumnarStore():
+    """
+    股票tick列式存储：
+    每天一个目录，所有股票按行拼接，每列保存为一个npy文件，读取时通过mmap只加载需要的列和行
+
+    """
+
+    def __init__(self, root_path=STOCK_TICK_COLUMNAR_DATA_PATH):
+        self._root_path = root_path
+
+    def get_day_path(self, date):
+        return create_day_path(self._root_path, date)
+
+    def has_date(self, date):
+        return os.path.exists(self.get_day_path(date) + MANIFEST_FILE_NAME)
+
+    def get_stock_list(self, date):
+        return list(read_manifest(self.get_day_path(date))['stocks'].keys())
+
+    def read(self, date, stock, columns=[]):
+        """
+        读取单个股票一天的数据
+
+        Parameters
+        ----------
+        date
+        stock
+        columns: list 需要的列，为空时读取全部列
+
+        Returns
+        -------
+
+        """
+        day_path = self.get_day_path(date)
+        manifest = read_manifest(day_path)
+        if stock not in manifest['stocks']:
+            raise FileNotFoundError('Stock {0} is missing in columnar file for date: {1}'.format(stock, date))
+        start, end = manifest['stocks'][stock]
+        if len(columns) == 0:
+            columns = list(manifest['columns'].keys())
+        dtypes = manifest.get('dtypes', {})
+        nulls = manifest.get('nulls', [])
+        data = {}
+        for column in columns:
+            if column not in manifest['columns']:
+                raise InvalidValue('Column {0} is missing in columnar file for date: {1}'.format(column, date))
+            values = open_column(day_path + column + COLUMN_FILE_SUFFIX)[start:end]
+            if dtypes.get(column) == 'object':
+                values = values.astype(object)
+            if column in nulls:
+                null_mask = open_column(day_path + column + NULL_MASK_FILE_SUFFIX)[start:end]
+                if null_mask.any():
+                    values = values.astype(object)
+                    values[null_mask] = np.nan
+            data[column] = values
+        return pd.DataFrame(data, columns=columns)
+
+    def write(self, date, stock_data_dict):
+        """
+        保存一天的数据
+
+        Parameters
+        ----------
+        date
+        stock_data_dict: dict 股票 -> dataframe
+
+        Returns
+        -------
+
+        """
+        day_path = self.get_day_path(date)
+        if not os.path.exists(day_path):
+            os.makedirs(day_path)
+        stocks = {}
+        data_list = []
+        rows = 0
+        for stock, data in stock_data_dict.items():
+            stocks[stock] = [rows, rows + len(data)]
+            rows = rows + len(data)
+            data_list.append(data.reset_index(drop=True))
+        data = pd.concat(data_list, ignore_index=True)
+        columns = {}
+        dtypes = {}
+        nulls = []
+        for column in data.columns:
+            values = data[column]
+            dtypes[column] = str(values.dtype)
+            if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_dtype(values):
+                values = values.to_numpy()
+            else:
+                # 字符串列转为定长unicode，才能被mmap，空值单独保存掩码，读取时还原
+                null_mask = values.isnull().to_numpy()
+                if null_mask.any():
+                    np.save(day_path + column + NULL_MASK_FILE_SUFFIX, null_mask)
+                    nulls.append(column)
+                values = np.array(values.astype(str).tolist(), dtype=str)
+                values[null_mask] = ''
+            np.save(day_path + column + COLUMN_FILE_SUFFIX, values)
+            columns[column] = str(values.dtype)
+        with open(day_path + MANIFEST_FILE_NAME, 'w') as f:
+            json.dump({'rows': rows, 'columns': columns, 'dtypes': dtypes, 'nulls': nulls, 'stocks': stocks}, f)
+        read_manifest.cache_clear()
+        open_column.cache_clear()
+
+
+class StockTickColumnarConverter():
+    """
+    把整理后的股票数据（每个股票一个gzip pickle文件）转换为列式存储
+
+    """
+
+    def __init__(self, source_path=STOCK_TICK_ORGANIZED_DATA_PATH, target_path=STOCK_TICK_COLUMNAR_DATA_PATH):
+        self._source_path = source_path
+        self._store = StockTickColumnarStore(target_path)
+
+    @timing
+    def convert(self, date):
+        source_day_path = create_day_path(self._source_path, date)
+        if not os.path.exists(source_day_path):
+            get_logger().warning('Stock data is missing for date: {0}'.format(date))
+            return
+        stock_data_dict = {}
+        file_list = list_files_in_path(source_day_path)
+        file_list.sort()
+        for file in file_list:
+            if not file.endswith('.pkl'):
+                continue
+            data = read_decompress(source_day_path + file)
+            if len(data) == 0:
+                continue
+            if 'amount' in data.columns and data.dtypes['amount'] != FACTOR_STANDARD_FIELD_TYPE:
+                data['amount'] = data['amount'].astype(FACTOR_STANDARD_FIELD_TYPE)
+            stock_data_dict[file.split('.')[0]] = data
+        if len(stock_data_dict) > 0:
+            self._store.write(date, stock_data_dict)
+
+    def convert_by_date_list(self, date_list):
+        for date in date_list:
+            get_logger().info('Convert stock data to columnar file for date: {0}'.format(date))
+            self.convert(date)
+
+
+if __name__ == '__main__':
+    # 转换一天的数据
+    # StockTickColumnarConverter().convert('20171106')
+
+    # 按列读取
+    # print(StockTickColumnarStore().read('20171106', '000021', ['tscode', 'date', 'time', 'price']))
+    pass
@@ -0,0 +1,144 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import os
+from bisect import bisect_right
+
+import numpy as np
+import pandas as pd
+
+from common.constants import CONFIG_PATH
+
+# 品种对应的成分股摘要文件
+STOCKS_ABSTRACT_FILE_DICT = {
+    'IC': '500_stocks_abstract.pkl',
+    'IH': '50_stocks_abstract.pkl',
+    'IF': '300_stocks_abstract.pkl'
+}
+
+
+def normalize_date(date):
+    return date.replace('-', '')
+
+
+class ConstituentIndex():
+    """
+    股指成分股索引：
+    每个品种的成分股区间按开始日期排序，查询时二分查找，不再每次遍历并拆分摘要的key，
+    停牌和数据有问题的股票保存为(日期 x 股票)的布尔矩阵，过滤时按行查找
+
+    Parameters
+    ----------
+    stocks_abstract_dict: dict 品种 -> 成分股摘要 {'开始日期_结束日期': 股票列表}，区间之间不重叠
+    invalid_list: list [(日期, 股票)]
+    """
+
+    def __init__(self, stocks_abstract_dict, invalid_list=[]):
+        self._interval_dict = {}
+        stock_set = set()
+        for product, stocks_abstract in stocks_abstract_dict.items():
+            interval_list = sorted(map(lambda item: item[0].split('_') + [item[1]], stocks_abstract.items()), key=lambda interval: interval[0])
+            self._interval_dict[product] = (
+                list(map(lambda interval: interval[0], interval_list)),
+                list(map(lambda interval: interval[1], interval_list)),
+                list(map(lambda interval: interval[2], interval_list))
+            )
+            for stock_list in stocks_abstract.values():
+                stock_set.update(stock_list)
+        invalid_list = list(map(lambda invalid: (normalize_date(invalid[0]), invalid[1]), invalid_list))
+        stock_set.update(map(lambda invalid: invalid[1], invalid_list))
+        self._stock_column_dict = {stock: i for i, stock in enumerate(sorted(stock_set))}
+        self._date_row_dict = {date: i for i, date in enumerate(sorted(set(map(lambda invalid: invalid[0], invalid_list))))}
+        self._validity_matrix = np.ones((len(self._date_row_dict), len(self._stock_column_dict)), dtype=bool)
+        if len(invalid_list) > 0:
+            rows = np.array(list(map(lambda invalid: self._date_row_dict[invalid[0]], invalid_list)))
+            columns = np.array(list(map(lambda invalid: self._stock_column_dict[invalid[1]], invalid_list)))
+            self._validity_matrix[rows, columns] = False
+
+    def get_stock_list(self, product, date):
+        """
+        获取某一天的成分股，不在任何区间内时返回None
+
+        Parameters
+        ----------
+        product： 品种
+        date： 日期，支持yyyy-mm-dd和yyyymmdd
+
+        Returns
+        -------
+
+        """
+        start_date_list, end_date_list, stock_list = self._interval_dict[product]
+        date = normalize_date(date)
+        index = bisect_right(start_date_list, date) - 1
+        if index >= 0 and date <= end_date_list[index]:
+            return stock_list[index]
+        return None
+
+    def is_valid(self, date, stock):
+        row = self._date_row_dict.get(normalize_date(date))
+        column = self._stock_column_dict.get(stock)
+        return row is None or column is None or bool(self._validity_matrix[row, column])
+
+    def filter_valid_stock_list(self, date, stock_list):
+        """
+        过滤掉停牌和数据有问题的股票
+
+        Parameters
+        ----------
+        date
+        stock_list
+
+        Returns
+        -------
+
+        """
+        row = self._date_row_dict.get(normalize_date(date))
+        if row is None:
+            return list(stock_list)
+        validity = self._validity_matrix[row]
+        return list(filter(lambda stock: stock not in self._stock_column_dict or validity[self._stock_column_dict[stock]], stock_list))
+
+
+constituent_index = None
+
+
+def get_constituent_index():
+    """
+    进程内共享的成分股索引，第一次使用时加载，只读。
+    子进程是否已有索引取决于启动方式：fork时继承父进程创建子进程前已经加载的索引，
+    spawn时（Windows默认）子进程重新导入模块，第一次使用时会再加载一次，
+    常驻进程池通过initializer传入父进程加载好的索引，见set_constituent_index
+
+    Returns
+    -------
+
+    """
+    global constituent_index
+    if constituent_index is None:
+        from common.persistence.dao import IndexConstituentConfigDao
+        stocks_abstract_dict = {product: pd.read_pickle(CONFIG_PATH + os.path.sep + file_name) for product, file_name in STOCKS_ABSTRACT_FILE_DICT.items()}
+        with IndexConstituentConfigDao() as index_constituent_config_dao:
+            constituent_index = ConstituentIndex(stocks_abstract_dict, index_constituent_config_dao.get_invalid_pair_list())
+    return constituent_index
+
+
+def set_constituent_index(index):
+    """
+    使用已经加载的成分股索引，子进程初始化时调用，不再从文件和数据库重新加载
+
+    Parameters
+    ----------
+    index: ConstituentIndex
+
+    Returns
+    -------
+
+    """
+    global constituent_index
+    constituent_index = index
+
+
+if __name__ == '__main__':
+    # print(get_constituent_index().get_stock_list('IF', '2022-06-20'))
+    # print(get_constituent_index().filter_valid_stock_list('2018-11-02', ['601200', '600519']))
+    pass
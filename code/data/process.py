@@ -7,12 +7,13 @@ import pandas as pd
 import sys
 from abc import abstractmethod, ABCMeta
 from datetime import datetime, timedelta, time
+from functools import lru_cache
 from pandas import DataFrame
 
 from common import constants
 from common.aop import timing
 from common.constants import OFF_TIME_IN_SECOND, OFF_TIME_IN_MORNING, STOCK_TRANSACTION_START_TIME, \
-    STOCK_VALID_DATA_STARTTIME, CONFIG_PATH, RET_PERIOD
+    STOCK_VALID_DATA_STARTTIME, CONFIG_PATH, RET_PERIOD, STOCK_TICK_SAMPLE_INTERVAL, STOCK_TRANSACTION_NOON_START_TIME
 from common.localio import read_decompress, save_compress
 from common.timeutils import datetime_advance, date_alignment, time_carry, time_advance, add_milliseconds_suffix
 from data.analysis import FutureTickerHandler, StockTickerHandler
@@ -79,30 +80,24 @@ class StockTickDataCleaner(DataCleaner):
         super().process(data)
         # 清除多余的列
         data = data.drop(columns=self._ignore_columns)
-        # 按时间清除 小于09:15:00，11：30到13：00，大于15：00的数据
-        data = data.drop(data.index[data['time'] < constants.STOCK_START_TIME + '.000'])
-        # 清除盘后交易数据
-        data = data.drop(data.index[(data['time'] > constants.STOCK_TRANSACTION_END_TIME + '.000') & (data['price'] == 0)])
-        data = data.drop(data.index[(data['time'] > constants.STOCK_TRANSACTION_END_TIME + '.000') & (data['transaction_number'] == 0)])
-        data = data.drop(data.index[(data['time'] > constants.STOCK_TRANSACTION_NOON_END_TIME + '.000') & (data['time'] < constants.STOCK_TRANSACTION_NOON_START_TIME + '.000')])
+        # 按时间清除 小于09:15:00，11：30到13：00，大于15：00的数据，清除盘后交易数据，
         # 清除000028.SZ               28  2017-01-05         0::.0    0.0       0
-        data = data.drop(data.index[data['time'] == '0::.0'])
+        time = data['time']
+        is_after_close = time > constants.STOCK_TRANSACTION_END_TIME + '.000'
+        is_invalid = (time < constants.STOCK_START_TIME + '.000') \
+                     | (is_after_close & ((data['price'] == 0) | (data['transaction_number'] == 0))) \
+                     | ((time > constants.STOCK_TRANSACTION_NOON_END_TIME + '.000') & (time < constants.STOCK_TRANSACTION_NOON_START_TIME + '.000')) \
+                     | (time == '0::.0')
+        data = data[~is_invalid]
         # 清除股票的重复成交量为0的数据，如果多行的成交量都为0，保留一行
+        is_duplicated = (data.groupby(['time'])['time'].transform('count') > 1) & (data['time'] >= constants.STOCK_OPEN_CALL_AUACTION_2ND_STAGE_END_TIME)
+        # 处理有成交量记录不为0的数据：同一时间有成交量不为0的记录时，删除所有成交量为0的记录
+        served_time = data.loc[is_duplicated & (data['volume'] > 0), 'time'].unique()
+        data = data[~(data['time'].isin(served_time) & (data['volume'] == 0))].copy()
+        # 处理没有成交量记录不为0的数据：每个时间删除第一条成交量为0的记录
         data['count'] = data.groupby(['time'])['time'].transform('count')
-        # 处理有成交量记录不为0的数据
-        index_to_be_serverd = data.index[(data['count'] > 1) & (data['volume'] > 0) & (data['time'] >= constants.STOCK_OPEN_CALL_AUACTION_2ND_STAGE_END_TIME)]
-        for index in index_to_be_serverd:
-            time_to_handled = data.loc[index]['time']
-            data = data.drop(data.index[(data['time'] == time_to_handled) & (data['volume'] == 0)])
-        # 处理没有成交量记录不为0的数据
-        data['count'] = data.groupby(['time'])['time'].transform('count')
-        index_to_be_removed = data.index[(data['count'] > 1) & (data['volume'] == 0) & ( data['time'] >= constants.STOCK_OPEN_CALL_AUACTION_2ND_STAGE_END_TIME)]
-        handled_time_set = set()
-        for index in index_to_be_removed:
-            cur_time = data.loc[index]['time']
-            if cur_time not in handled_time_set:
-                data = data.drop(index)
-                handled_time_set.add(cur_time)
+        to_be_removed = data[(data['count'] > 1) & (data['volume'] == 0) & (data['time'] >= constants.STOCK_OPEN_CALL_AUACTION_2ND_STAGE_END_TIME)]
+        data = data.drop(to_be_removed.index[to_be_removed.groupby(['time']).cumcount() == 0])
         return data
 
 
@@ -224,42 +219,22 @@ class StockTickDataEnricher(DataProcessor):
     def process(self, data):
         pre_data = data[data['time'] < STOCK_TRANSACTION_START_TIME]
 
-        print(data[['time', 'price', 'open', 'high', 'low', 'close']])
         #处理开盘数据缺失，用昨日收盘价补齐
         last_close = data[data['close'] > 0].iloc[0]['close']
-        if len(data[(data['time'] >= add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)) & (data['time'] <= add_milliseconds_suffix(
-                STOCK_VALID_DATA_STARTTIME)) & (data['price'] == 0)]) > 0:
-            data.loc[(data['time'] >= add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)) & (data['time'] <= add_milliseconds_suffix(
-                STOCK_VALID_DATA_STARTTIME)) & (data['price'] == 0), 'price'] = last_close
-        if len(data[(data['time'] >= add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)) & (data['time'] <= add_milliseconds_suffix(
-                STOCK_VALID_DATA_STARTTIME)) & (data['open'] == 0)]) > 0:
-            data.loc[(data['time'] >= add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)) & (data['time'] <= add_milliseconds_suffix(
-                STOCK_VALID_DATA_STARTTIME)) & (data['open'] == 0), 'open'] = last_close
-        if len(data[(data['time'] >= add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)) & (data['time'] <= add_milliseconds_suffix(
-                STOCK_VALID_DATA_STARTTIME)) & (data['high'] == 0)]) > 0:
-            data.loc[(data['time'] >= add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)) & (data['time'] <= add_milliseconds_suffix(
-                STOCK_VALID_DATA_STARTTIME)) & (data['high'] == 0), 'high'] = last_close
-        if len(data[(data['time'] >= add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)) & (data['time'] <= add_milliseconds_suffix(
-                STOCK_VALID_DATA_STARTTIME)) & (data['low'] == 0)]) > 0:
-            data.loc[(data['time'] >= add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)) & (data['time'] <= add_milliseconds_suffix(
-                STOCK_VALID_DATA_STARTTIME)) & (data['low'] == 0), 'low'] = last_close
-
-        #对齐
-        data = data[data['time'] >= STOCK_TRANSACTION_START_TIME]
-        to_be_removed_index = []
-        for index, row_data in data.iterrows():
-            cur_time = datetime.strptime(row_data['time'], '%H:%M:%S.%f')
-            if cur_time.second % 3 == 0:
-                continue
-            else:
-                new_hour, new_minute, new_second = time_carry(cur_time.hour, cur_time.minute, (int((cur_time.second + 3) / 3)) * 3)
-                new_time = datetime(year=cur_time.year, month=cur_time.month, day=cur_time.day, hour=new_hour, minute=new_minute, second=new_second)
-                if len(data[data['time'] == datetime.strftime(new_time, '%H:%M:%S') + '.000']) == 0:
-                    data['time'][index] = datetime.strftime(new_time, '%H:%M:%S') + '.000'
-                else:
-                    to_be_removed_index.append(index)
-            # if len(to_be_removed_index) > 0: # 这种数据有可能包含有用信息，所以应该保留
-            #     data.drop(to_be_removed_index)
+        opening = (data['time'] >= add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)) & (data['time'] <= add_milliseconds_suffix(STOCK_VALID_DATA_STARTTIME))
+        for column in ['price', 'open', 'high', 'low']:
+            data.loc[opening & (data[column] == 0), column] = last_close
+
+        #对齐：不在3秒整数倍上的tick对齐到下一个3秒，
+        # 如果目标时间已经有tick或者已经有更早的tick对齐过去，保留原来的时间，这种数据有可能包含有用信息
+        data = data[data['time'] >= STOCK_TRANSACTION_START_TIME].copy()
+        time = data['time'].to_numpy(dtype=object)
+        second = get_second_of_time_series(data['time'])
+        is_aligned = second % STOCK_TICK_SAMPLE_INTERVAL == 0
+        target_time = pd.Series(create_time_series((second // STOCK_TICK_SAMPLE_INTERVAL + 1) * STOCK_TICK_SAMPLE_INTERVAL), index=data.index)
+        candidate = ~is_aligned & ~target_time.isin(time[is_aligned]).to_numpy()
+        candidate_index = target_time[candidate].drop_duplicates().index
+        data.loc[candidate_index, 'time'] = target_time[candidate_index]
 
         #处理收盘集中竞价
         temp_data = data[data['volume'] > 0]
@@ -273,28 +248,26 @@ class StockTickDataEnricher(DataProcessor):
                 data = data.drop(data.index[data['time'] > constants.STOCK_TRANSACTION_END_TIME + '.000'])
 
         #插值
-        miss_data = pd.DataFrame(columns=data.columns.tolist())
-        data['realtime'] = data.apply(
-            lambda item: datetime.strptime(item['time'], "%H:%M:%S.%f"), axis=1)
-        data['delta_time'] = data.shift(-1)['realtime'] - data['realtime']
-        data['delta_time_sec'] = data.apply(
-            lambda item: self.handle_off_time(item), axis=1)
-        issued_data = data[data['delta_time_sec'] > constants.STOCK_TICK_SAMPLE_INTERVAL]
-        for index, row_data in issued_data.iterrows():
-            delta_time_sec = row_data[64]
-            step = constants.STOCK_TICK_SAMPLE_INTERVAL
-            item = data.loc[index]
-            str_cur_time = item['time']
-            while step < delta_time_sec:
-                item['time'] = time_advance(str_cur_time, step)
-                item['volume'] = 0
-                item['amount'] = 0
-                miss_data = miss_data.append(item)
-                step = step + constants.STOCK_TICK_SAMPLE_INTERVAL
-        data = data.append(miss_data)
-        data = pd.concat([pre_data, data])
-
-        data = data.sort_values(by=['time'])
+        data['realtime'] = pd.to_datetime(data['time'], format='%H:%M:%S.%f')
+        data['delta_time'] = data['realtime'].shift(-1) - data['realtime']
+        delta_time_sec = data['delta_time'].dt.total_seconds()
+        data['delta_time_sec'] = delta_time_sec.where(delta_time_sec < OFF_TIME_IN_SECOND, delta_time_sec - OFF_TIME_IN_SECOND)
+        # 去掉午休后的连续交易时间，在这个时间上按3秒网格找出缺失的时间点，用之前最近的tick填充
+        session_time = get_session_time(get_second_of_time_series(data['time']) + data['realtime'].dt.microsecond.to_numpy() / 1000000)
+        sorted_position = np.argsort(session_time, kind='stable')
+        sorted_session_time = session_time[sorted_position]
+        if len(sorted_session_time) > 1:
+            grid = np.arange(math.floor(sorted_session_time[0] / STOCK_TICK_SAMPLE_INTERVAL) + 1, math.ceil(sorted_session_time[-1] / STOCK_TICK_SAMPLE_INTERVAL)) * STOCK_TICK_SAMPLE_INTERVAL
+            grid = grid[~np.isin(grid, np.floor(sorted_session_time))]
+        else:
+            grid = np.array([], dtype='int64')
+        miss_data = data.iloc[sorted_position[np.searchsorted(sorted_session_time, grid, side='left') - 1]].copy()
+        miss_data['time'] = create_time_series(np.where(grid > get_second_of_time(OFF_TIME_IN_MORNING), grid + OFF_TIME_IN_SECOND, grid))
+        miss_data['volume'] = 0
+        miss_data['amount'] = 0
+        data = pd.concat([pre_data, data, miss_data])
+
+        data = data.sort_values(by=['time'], kind='stable')
         data = data.reset_index(drop=True)
         return data
 
@@ -390,8 +363,115 @@ class FutureTickDataEnricher(DataProcessor):
             return seconds
 
 
+def get_second_of_time(time):
+    """
+    HH:MM:SS转为当天的秒数
+
+    Parameters
+    ----------
+    time
+
+    Returns
+    -------
+
+    """
+    return int(time[0:2]) * 3600 + int(time[3:5]) * 60 + int(time[6:8])
+
+
+def get_second_of_time_series(time_series):
+    """
+    HH:MM:SS.fff格式的时间序列转为当天的秒数，忽略毫秒
+
+    Parameters
+    ----------
+    time_series: Series
+
+    Returns
+    -------
+    ndarray
+
+    """
+    return (time_series.str[0:2].astype('int64') * 3600 + time_series.str[3:5].astype('int64') * 60 + time_series.str[6:8].astype('int64')).to_numpy()
+
+
+def create_time_series(seconds):
+    """
+    当天的秒数转为HH:MM:SS.000格式
+
+    Parameters
+    ----------
+    seconds: ndarray
+
+    Returns
+    -------
+    ndarray
+
+    """
+    seconds = np.asarray(seconds, dtype='int64')
+    hour = pd.Series(seconds // 3600).astype(str).str.zfill(2)
+    minute = pd.Series(seconds % 3600 // 60).astype(str).str.zfill(2)
+    second = pd.Series(seconds % 60).astype(str).str.zfill(2)
+    return (hour + ':' + minute + ':' + second + '.000').to_numpy(dtype=object)
+
+
+def get_session_time(seconds):
+    """
+    去掉午休的连续交易时间，13:00:00和11:30:00对应同一个时间点
+
+    Parameters
+    ----------
+    seconds: ndarray 当天的秒数
+
+    Returns
+    -------
+    ndarray
+
+    """
+    seconds = np.asarray(seconds, dtype='float64')
+    return np.where(seconds >= get_second_of_time(STOCK_TRANSACTION_NOON_START_TIME), seconds - OFF_TIME_IN_SECOND, seconds)
+
+
+@lru_cache(maxsize=8)
+def create_future_bar_grid(open_time, end_time, open_interval, interval):
+    """
+    生成一天的k线时间网格，和datetime_advance的步进规则一致：
+    开盘第一根k线包含集合竞价，中午停盘时跳过休市时间
+
+    Parameters
+    ----------
+    open_time: string 开始时间 HH:MM:SS
+    end_time: string 结束时间 HH:MM:SS
+    open_interval: int 开盘第一根k线的长度 单位：s
+    interval: int k线长度 单位：s
+
+    Returns
+    -------
+    starts: ndarray 每根k线的开始时间 单位：ns
+    labels: list 每根k线的结束时间 HH:MM:SS，作为k线的时间
+
+    """
+    cur_time = get_second_of_time(open_time)
+    end_time = get_second_of_time(end_time)
+    off_time = get_second_of_time(OFF_TIME_IN_MORNING)
+    starts = []
+    ends = []
+    is_open = True
+    while cur_time < end_time:
+        next_time = cur_time + (open_interval if is_open else interval)
+        is_open = False
+        if cur_time == off_time:
+            next_time = next_time + OFF_TIME_IN_SECOND
+        starts.append(cur_time)
+        ends.append(next_time)
+        cur_time = next_time
+    labels = list(map(lambda second: '{0:02d}:{1:02d}:{2:02d}'.format(second // 3600, second % 3600 // 60, second % 60), ends))
+    return np.array(starts, dtype='int64') * 1000000000, labels
+
+
 class FutureTickDataProcessorPhase1(DataProcessor):
     """Tick处理，3秒为一个时间间隔对齐，生成临时文件
+    每个tick一次性映射到所在的k线，再按k线分组聚合，没有成交的k线用上一根k线的收盘价填充，
+    可以一次处理多天的数据
 
     Parameters
     ----------
@@ -400,66 +480,60 @@ class FutureTickDataProcessorPhase1(DataProcessor):
     """
 
     _columns = ['datetime', 'open', 'close', 'high', 'low', 'volume', 'interest']
+    # 股指期货包含集合竞价，开盘从9：29：00 - 9：30：03时间间隔是63秒
+    _open_time = '09:29:00'
+    _end_time = '15:00:00'
+    _open_interval = 63
+    _interval = 3
 
     @timing
     def process(self, data):
-        date = data.iloc[1]['date']
-        # 将数据对齐到0.5s的整数倍
-        data['datetime'] = data.apply(lambda item: date_alignment(str(item['datetime'])), axis=1)
-        # 只取有成交的记录
-        data['delta_volume'] = data['volume'] - data['volume'].shift(1)
-        first_index = data.head(1).index.tolist()[0]
-        data.loc[first_index, 'delta_volume'] = data.loc[first_index, 'volume']  # 这里要处理边界情况，主要是第一个值的delta_volume为空
-        # data['cur_price'] = data['last_price'].shift(-1) #对于last_price有点误解，这个就是当前时间
-        data['cur_price'] = data['last_price']
-        data = data[data['delta_volume'] > 0]
-        cur_time = date + ' 09:29:00.000000000' #股指期货包含集合竞价
-        end_time = date + ' 15:00:00.000000000'
-        is_open = True
-        organized_data = pd.DataFrame(columns=self._columns)
-        while cur_time < end_time:
-            if is_open: #判断是否开盘, 如果是开盘从9：29：00 - 9：30：03时间间隔是63秒
-                next_time = datetime_advance(cur_time, 63)
-                is_open = False
-            else:
-                next_time = datetime_advance(cur_time, 3)
-            temp_data = data[(data['datetime'] >= cur_time) & (data['datetime'] < next_time)]
-            last_record = None
-            # 该时间区间内无交易处理
-            if len(temp_data) == 0:
-                if len(organized_data) > 0:
-                    last_record = organized_data.iloc[-1]
-                    last_record['datetime'] = next_time
-                    last_record['volume'] = 0
-                    close = last_record['close']
-                    last_record['open'] = close
-                    last_record['low'] = close
-                    last_record['high'] = close
-            # 该时间区间内有交易处理
-            else:
-                min_index = temp_data.index.min()
-                max_index = temp_data.index.max()
-                open = temp_data.loc[min_index]['cur_price']
-                close = temp_data.loc[max_index]['cur_price']
-                high = temp_data['cur_price'].max()
-                low = temp_data['cur_price'].min()
-                volume = temp_data['delta_volume'].sum()
-                interest = temp_data.loc[max_index]['open_interest']
-                last_record = pd.Series({'datetime': next_time,
-                                         'open': open,
-                                         'close': close,
-                                         'high': high,
-                                         'low': low,
-                                         'volume': volume,
-                                         'interest': interest})
-            if last_record is not None:
-                if len(organized_data) == 0:
-                    cur_index = 1
-                else:
-                    cur_index = organized_data.index.max() + 1
-                delta_data = pd.DataFrame([last_record], [cur_index])
-                organized_data = pd.concat([organized_data, delta_data])
-            cur_time = next_time
+        starts, labels = create_future_bar_grid(self._open_time, self._end_time, self._open_interval, self._interval)
+        bar_count = len(starts)
+        str_datetime = data['datetime'].astype(str)
+        date = str_datetime.str[0:10]
+        # 将数据对齐到0.5s的整数倍，转为当天的纳秒数
+        second = str_datetime.str[11:13].astype('int64') * 3600 + str_datetime.str[14:16].astype('int64') * 60 + str_datetime.str[17:19].astype('int64')
+        nanosecond = second.to_numpy() * 1000000000 + np.where(str_datetime.str[20].astype('int64').to_numpy() > 4, 500000000, 0)
+        # 只取有成交的记录，每天的第一条记录直接用累计成交量
+        delta_volume = data['volume'] - data['volume'].shift(1)
+        is_first = (date != date.shift(1)).to_numpy()
+        delta_volume = np.where(is_first, data['volume'], delta_volume)
+        valid = (delta_volume > 0) & (nanosecond >= starts[0]) & (nanosecond < starts[-1] + self._interval * 1000000000)
+        date_list, date_index = np.unique(date.to_numpy()[valid], return_inverse=True)
+        bar_index = np.searchsorted(starts, nanosecond[valid], side='right') - 1
+        key = date_index * bar_count + bar_index
+        # 按原始索引排序后分组，保证开盘价和收盘价取的是区间内第一条和最后一条记录
+        order = np.lexsort((data.index.to_numpy()[valid], key))
+        key = key[order]
+        price = data['last_price'].to_numpy()[valid][order]
+        interest = data['open_interest'].to_numpy()[valid][order]
+        volume = delta_volume[valid][order]
+        bar_key, first_position = np.unique(key, return_index=True)
+        last_position = np.append(first_position[1:], len(key)) - 1
+        grouped_price = pd.Series(price).groupby(key)
+        bar_data = pd.DataFrame({
+            'open': price[first_position],
+            'close': price[last_position],
+            'high': grouped_price.max().to_numpy(),
+            'low': grouped_price.min().to_numpy(),
+            'volume': pd.Series(volume).groupby(key).sum().to_numpy(),
+            'interest': interest[last_position]
+        }, index=bar_key)
+        # 每天从第一根有成交的k线开始，之后没有成交的k线用上一根k线填充
+        first_bar_key = bar_data.index.to_series().groupby(bar_key // bar_count).min()
+        all_key = np.concatenate([np.arange(first_key, (first_key // bar_count + 1) * bar_count) for first_key in first_bar_key.tolist()]) \
+            if len(first_bar_key) > 0 else np.array([], dtype='int64')
+        bar_data = bar_data.reindex(all_key)
+        is_empty = bar_data['open'].isnull().to_numpy()
+        bar_data['close'] = bar_data['close'].ffill()
+        bar_data['interest'] = bar_data['interest'].ffill()
+        for column in ['open', 'high', 'low']:
+            bar_data.loc[is_empty, column] = bar_data.loc[is_empty, 'close']
+        bar_data.loc[is_empty, 'volume'] = 0
+        bar_data['datetime'] = np.array(date_list, dtype=object)[all_key // bar_count] + ' ' + np.array(labels, dtype=object)[all_key % bar_count] + '.000000000'
+        organized_data = bar_data[self._columns]
+        organized_data.index = range(1, len(organized_data) + 1)
         return organized_data
 
 
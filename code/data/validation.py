@@ -271,8 +271,8 @@ class StockTickDataValidator(Validator):
         result = DtoStockValidationResult(RESULT_SUCCESS, [], tscode.split('.')[0], date.replace('-',''))
         # 检查是否停盘，如果停盘直接终止检查
         # if 'price' in data.loc[:, (data == 0).all()].columns.tolist():
-        index_constituent_config_dao = IndexConstituentConfigDao()
-        suspend_set = index_constituent_config_dao.get_suspend_list()
+        with IndexConstituentConfigDao() as index_constituent_config_dao:
+            suspend_set = index_constituent_config_dao.get_suspend_list()
         if (date + tscode[0:6]) in suspend_set:
             result.result = RESULT_FAIL
             result.error_details.append('The stock is suspended')
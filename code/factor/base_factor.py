@@ -2,23 +2,77 @@
 # -*- coding:utf8 -*-
 import os
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from datetime import datetime
 from scipy.stats import pearsonr
 
-from common.constants import CONFIG_PATH, STOCK_TICK_ORGANIZED_DATA_PATH, FACTOR_PATH, TEMP_PATH, FACTOR_STANDARD_FIELD_TYPE
+from common.constants import CONFIG_PATH, STOCK_TICK_ORGANIZED_DATA_PATH, FACTOR_PATH, TEMP_PATH, FACTOR_STANDARD_FIELD_TYPE, STOCK_TICK_SAMPLE_INTERVAL, \
+    STOCK_DATE_CACHE_MEMORY_BUDGET, STOCK_DATE_CACHE_PREFETCH, STOCK_DATE_CACHE_MAX_PREFETCH
 from common.localio import read_decompress, save_compress
 from data.process import StockTickDataColumnTransform
 from data.access import StockDataAccess, StockDailyDataAccess
 from common.persistence.dbutils import create_session
 from common.persistence.po import StockMissingData
-from common.persistence.dao import IndexConstituentConfigDao
+from data.constituent import get_constituent_index, set_constituent_index
+from common.persistence.trading_calendar import get_trading_calendar, set_trading_calendar
 from common.aop import timing
+from common.exception.exception import InvalidStatus
+from common.metrics import get_metrics_collector, metric_context, stage_timer
 from framework.localconcurrent import ThreadRunner
 from common.log import get_logger
 from framework.pagination import Pagination
-from framework.localconcurrent import ProcessRunner, ProcessExcecutor
+from framework.localconcurrent import ProcessRunner, ProcessExcecutor, PersistentProcessExecutor
+from framework.sharedmemory import dump_frame_to_shared_memory, load_frame_from_shared_memory, release_shared_memory
+from factor.factor_storage import FactorPartitionStore, ResultSink
+from factor.factor_dependency import get_target_data_by_date, get_member_list
+from factor.kernel import warm_up_rolling_moments
+
+
+def get_second_of_day(time_series):
+    """
+    把HH:MM:SS.fff格式的时间列向量化转换为当天的秒数，替代逐行strptime，
+    时间为空值时结果为空值
+
+    Parameters
+    ----------
+    time_series: Series
+
+    Returns
+    -------
+    ndarray: int64，有空值时为float64
+
+    """
+    is_null = time_series.isnull().to_numpy()
+    time_series = time_series.where(~is_null, '00:00:00').astype(str)
+    hours = time_series.str[0:2].astype('int64').to_numpy()
+    minutes = time_series.str[3:5].astype('int64').to_numpy()
+    seconds = time_series.str[6:8].astype('int64').to_numpy()
+    second_of_day = hours * 3600 + minutes * 60 + seconds
+    if is_null.any():
+        return np.where(is_null, np.nan, second_of_day)
+    return second_of_day
+
+def safe_divide(numerator, denominator):
+    """
+    向量化除法，分母为0时结果为0，
+    替代apply(lambda x: 0 if x[b] == 0 else x[a] / x[b], axis=1)
+
+    Parameters
+    ----------
+    numerator: Series or ndarray
+    denominator: Series or ndarray
+
+    Returns
+    -------
+    ndarray
+
+    """
+    numerator = np.asarray(numerator, dtype=FACTOR_STANDARD_FIELD_TYPE)
+    denominator = np.asarray(denominator, dtype=FACTOR_STANDARD_FIELD_TYPE)
+    return np.divide(numerator, denominator, out=np.zeros(np.broadcast(numerator, denominator).shape), where=denominator != 0)
 
 
 class Factor(metaclass=ABCMeta):
@@ -59,12 +113,41 @@ class Factor(metaclass=ABCMeta):
         return pearsonr(data[self.factor_code], data[factor.factor_code])
 
     #加载因子文件
-    def load(self, product, is_organized = False):
+    def load(self, product, is_organized = False, instrument_list = [], date_list = [], start_date = '', end_date = ''):
+        """
+        加载因子数据，有分区存储时只读取过滤条件需要的分区，否则读取单个因子文件再过滤
+
+        Parameters
+        ----------
+        product
+        is_organized
+        instrument_list: 合约过滤，为空时不过滤
+        date_list: 日期过滤，为空时不过滤
+        start_date
+        end_date
+
+        Returns
+        -------
+
+        """
+        if not is_organized:
+            store = FactorPartitionStore(product, self.get_full_name(), FACTOR_PATH)
+            if store.exists():
+                return store.read(instrument_list, date_list, start_date, end_date)
         if is_organized:
             factor_path = FACTOR_PATH + os.path.sep + 'organized' + os.path.sep + product + '_' + self.get_full_name()
         else:
             factor_path = FACTOR_PATH + product + '_' + self.get_full_name()
-        return read_decompress(factor_path)
+        data = read_decompress(factor_path)
+        if len(instrument_list) > 0:
+            data = data[data['instrument'].isin(instrument_list)]
+        if len(date_list) > 0:
+            data = data[data['date'].isin(date_list)]
+        if start_date != '':
+            data = data[data['date'] >= start_date]
+        if end_date != '':
+            data = data[data['date'] <= end_date]
+        return data
 
     def get_action_delay(self):
         """
@@ -77,11 +160,66 @@ class Factor(metaclass=ABCMeta):
         """
         return 1
 
+    def get_warm_up_ticks(self):
+        """
+        增量计算时新数据之前需要的预热长度，单位是tick，
+        默认按最大窗口的2倍估计（有些因子用2倍窗口计算ATR），
+        返回None表示因子依赖全部历史数据，比如累加类的因子
+        Returns
+        -------
+
+        """
+        windows = list(filter(lambda param: isinstance(param, (int, float)), self._params))
+        if len(windows) == 0:
+            return 0
+        return 2 * max(windows)
+
     # 全局计算因子值
     @abstractmethod
     def caculate(self, data):
         pass
 
+    def reset_state(self):
+        """
+        清空实时计算的状态，支持实时计算的因子实现reset_state和update
+
+        Returns
+        -------
+
+        """
+        raise InvalidStatus('Incremental caculation is not supported by factor: {0}'.format(self.get_full_name()))
+
+    def init_state(self, history):
+        """
+        实时计算前用历史数据初始化状态，逐个bar调用update，之后每来一个新的bar调用update
+
+        Parameters
+        ----------
+        history: dataframe
+
+        Returns
+        -------
+
+        """
+        self.reset_state()
+        for bar in history.to_dict('records'):
+            self.update(bar)
+
+    def update(self, bar):
+        """
+        实时计算，加入一个新的bar，返回的因子值和caculate在这一行的结果一致
+
+        Parameters
+        ----------
+        bar: dict or Series
+
+        Returns
+        -------
+        dict: 因子列名 -> 值
+
+        """
+        raise InvalidStatus('Incremental caculation is not supported by factor: {0}'.format(self.get_full_name()))
+
 class DifferenceFactor(Factor):
     """
     差分因子基类
@@ -118,24 +256,32 @@ class StockTickFactor(Factor):
     """
 
     _stock_filter = []
+    _worker_pool = None
 
     def __init__(self):
-        self._stocks_abstract_50 = pd.read_pickle(CONFIG_PATH + os.path.sep + '50_stocks_abstract.pkl')
-        self._stocks_abstract_300 = pd.read_pickle(CONFIG_PATH + os.path.sep + '300_stocks_abstract.pkl')
-        self._stocks_abstract_500 = pd.read_pickle(CONFIG_PATH + os.path.sep + '500_stocks_abstract.pkl')
-        self._stocks_map = {
-            'IC' : self._stocks_abstract_500,
-            'IH' : self._stocks_abstract_50,
-            'IF' : self._stocks_abstract_300
-        }
-        self._data_access = StockDataAccess(False)
+        # 成分股和非法数据索引在进程内共享
+        self._constituent_index = get_constituent_index()
+        self._data_access = StockDataAccess(False, columnar_enabled=True)
         self._daily_data_access = StockDailyDataAccess()
-        index_constituent_config_dao = IndexConstituentConfigDao()
-        self._invalid_set = index_constituent_config_dao.get_invalid_list()
 
     def set_stock_filter(self, stock_filter):
         self._stock_filter = stock_filter
 
+    def set_worker_pool(self, worker_pool):
+        self._worker_pool = worker_pool
+
+    def __getstate__(self):
+        # 进程池不能序列化，也不需要传给子进程
+        state = self.__dict__.copy()
+        state['_worker_pool'] = None
+        return state
+
+    def clear_cache(self):
+        """
+        释放跨天计算时保留的缓存，常驻进程切换合约时调用
+        """
+        pass
+
     @timing
     def caculate(self, data):
         """
@@ -149,7 +295,7 @@ class StockTickFactor(Factor):
 
         """
         columns = self.get_factor_columns(data)
-        new_data = pd.DataFrame(columns=columns)
+        result_sink = ResultSink(columns)
         product = data.iloc[0]['product']
         instrument = data.iloc[0]['instrument']
         date_list = list(set(data['date'].tolist()))
@@ -160,14 +306,19 @@ class StockTickFactor(Factor):
             get_logger().debug(
                 'Handle date from {0} to {1} for instrument: {2}'.format(date_list[0], date_list[-1], instrument))
             params_list = list(map(lambda date: [date, instrument, product], date_list))
-            results = ProcessExcecutor(10).execute(self.caculate_by_date, params_list)
+            if self._worker_pool:
+                results = self._worker_pool.caculate_by_date(self, params_list)
+            else:
+                results = ProcessExcecutor(10).execute(self.caculate_by_date, params_list)
             temp_cache = {}
-            for result in results:
-                cur_date_data = self.merge_with_stock_data(data, result[0], result[1])
-                temp_cache[result[0]] = cur_date_data
+            with stage_timer('merge'):
+                for result in results:
+                    cur_date_data = self.merge_with_stock_data(data, result[0], result[1])
+                    temp_cache[result[0]] = cur_date_data
             for date in date_list:
-                new_data = pd.concat([new_data, temp_cache[date]])
-        return new_data
+                result_sink.append(temp_cache[date])
+        with stage_timer('concat'):
+            return result_sink.get_result()
 
     def caculate_by_date(self, *args):
         """
@@ -184,11 +335,14 @@ class StockTickFactor(Factor):
         instrument = args[0][1]
         product = args[0][2]
         get_logger().debug(f'Caculate by date params {date}, {instrument}, {product}')
-        stock_data_per_date = self.get_stock_tick_data(product, instrument, date)
-        if len(stock_data_per_date) == 0:
-            get_logger().warning('The data on date: {0} and instrument: {1} is missing'.format(date, instrument))
-            return date, stock_data_per_date
-        return self.execute_caculation(date, stock_data_per_date)
+        with metric_context(date=date):
+            stock_data_per_date = self.get_stock_tick_data(product, instrument, date)
+            if len(stock_data_per_date) == 0:
+                get_logger().warning('The data on date: {0} and instrument: {1} is missing'.format(date, instrument))
+                get_metrics_collector().increase('missing_date')
+                return date, stock_data_per_date
+            with stage_timer('execute_caculation'):
+                return self.execute_caculation(date, stock_data_per_date)
 
     @timing
     def get_stock_tick_data(self, product, instrument, date):
@@ -210,13 +364,15 @@ class StockTickFactor(Factor):
         temp_data_cache = []
         if stock_list and len(stock_list) > 0:
             # 过滤异常数据
-            stock_list = list(filter(lambda stock: (date + stock) not in self._invalid_set, stock_list))
+            stock_list = self._constituent_index.filter_valid_stock_list(date, stock_list)
             for stock in stock_list:
                 # get_logger().debug('Handle stock {0}'.format(stock))
                 try:
-                    daily_stock_data = self.get_stock_data(date, stock)
+                    with stage_timer('io'):
+                        daily_stock_data = self.get_stock_data(date, stock)
                 except Exception as e:
                     get_logger().warning('Stock data is missing for date: {0} and stock: {1}'.format(date, stock))
+                    get_metrics_collector().increase('missing_stock_data')
                     # session = create_session()
                     # stock_missing_data = StockMissingData(date, stock)
                     # session.add(stock_missing_data)
@@ -226,13 +382,15 @@ class StockTickFactor(Factor):
                     get_logger().warning('Stock data is empty for date: {0} and stock: {1}'.format(date, stock))
                     continue
                 daily_stock_data = daily_stock_data.loc[:, columns]
-                daily_stock_data = self.enrich_stock_data(instrument, date, stock, daily_stock_data)
+                with stage_timer('enrich'):
+                    daily_stock_data = self.enrich_stock_data(instrument, date, stock, daily_stock_data)
                 temp_data_cache.append(daily_stock_data)
         else:
             get_logger().warning('Stock data configuration is missing for product: {0} and date: {1}'.format(product, date))
         if len(temp_data_cache) > 0:
-            data = pd.concat(temp_data_cache)
-            data = data.reset_index(drop = True)
+            with stage_timer('concat'):
+                data = pd.concat(temp_data_cache)
+                data = data.reset_index(drop = True)
         return data
         # return self._daily_data_access.access(date)
 
@@ -294,7 +452,8 @@ class StockTickFactor(Factor):
         -------
 
         """
-        temp_data = self._data_access.access(date, stock)
+        # 只加载因子需要的列
+        temp_data = self._data_access.access(date, stock, self.get_columns())
         return temp_data
 
     # @timing
@@ -344,13 +503,7 @@ class StockTickFactor(Factor):
         product ： 品种
         date ： 日期
         """
-        stock_abstract = self._stocks_map.get(product)
-        date = date.replace('-', '')
-        for key in stock_abstract.keys():
-            start_date = key.split('_')[0]
-            end_date = key.split('_')[1]
-            if date >= start_date and date <= end_date:
-                return stock_abstract[key]
+        return self._constituent_index.get_stock_list(product, date)
 
     # @timing
     def merge_with_stock_data(self, data, date, df_stock_data_per_date):
@@ -368,7 +521,7 @@ class StockTickFactor(Factor):
         """
         cur_date_data = data[data['date'] == date]
         if len(df_stock_data_per_date) > 0:
-            df_stock_data_per_date['second_remainder'] = df_stock_data_per_date.apply(lambda item: self.is_aligned(item), axis=1)
+            df_stock_data_per_date['second_remainder'] = get_second_of_day(df_stock_data_per_date['time']) % STOCK_TICK_SAMPLE_INTERVAL
             df_stock_data_per_date = df_stock_data_per_date[df_stock_data_per_date['second_remainder'] == 0]
             df_stock_data_per_date['datetime'] = date + ' ' + df_stock_data_per_date['time'] + '000000'
             cur_date_data = cur_date_data.merge(df_stock_data_per_date, on=['datetime'], how='left')
@@ -393,6 +546,353 @@ class StockTickFactor(Factor):
     # 全局计算因子值
 
 
+# 常驻进程中的因子实例，由init_stock_tick_worker初始化
+_worker_factor_list = []
+# 常驻进程最近一次处理的批次和合约
+_worker_batch = None
+_worker_instrument = None
+
+def init_stock_tick_worker(factor_list, constituent_index=None, trading_calendar=None):
+    """
+    常驻进程初始化，每个进程只反序列化一次因子配置，
+    父进程加载好的成分股索引和交易日历也通过这里传入，spawn启动的子进程不需要再查询数据库
+
+    Parameters
+    ----------
+    factor_list
+    constituent_index: ConstituentIndex，和因子引用的是同一个对象，反序列化后只有一份
+    trading_calendar: TradingCalendar
+
+    Returns
+    -------
+
+    """
+    global _worker_factor_list
+    _worker_factor_list = factor_list
+    if constituent_index is not None:
+        set_constituent_index(constituent_index)
+    if trading_calendar is not None:
+        set_trading_calendar(trading_calendar)
+
+def caculate_by_date_in_worker(args):
+    """
+    常驻进程中按天计算，结果通过共享内存返回
+
+    Parameters
+    ----------
+    args: list
+        args[0]: 批次号，父进程读取完一个批次的结果后才会提交下一个批次
+        args[1]: 因子在factor_list中的位置
+        args[2]: [date, instrument, product]
+
+    Returns
+    -------
+
+    """
+    global _worker_batch, _worker_instrument
+    if args[0] != _worker_batch:
+        # 上一个批次的结果父进程已经读取，可以关闭共享内存
+        release_shared_memory()
+        _worker_batch = args[0]
+    if args[2][1] != _worker_instrument:
+        # 跨天缓存只在同一个合约内复用，避免常驻进程的缓存无限增长
+        for factor in _worker_factor_list:
+            factor.clear_cache()
+        _worker_instrument = args[2][1]
+    factor = _worker_factor_list[args[1]]
+    date, data = factor.caculate_by_date(args[2])
+    if isinstance(data, list): # 因子组一次返回多个因子的结果
+        return date, list(map(dump_frame_to_shared_memory, data))
+    return date, dump_frame_to_shared_memory(data)
+
+def load_worker_result(result):
+    if isinstance(result, list):
+        return list(map(load_frame_from_shared_memory, result))
+    return load_frame_from_shared_memory(result)
+
+def distribute_cache_memory_budget(factor_list, pool_size=1, memory_budget=STOCK_DATE_CACHE_MEMORY_BUDGET):
+    """
+    跨天股票数据缓存按进程数和缓存数平分内存上限，所有进程中的缓存加起来不超过memory_budget
+
+    Parameters
+    ----------
+    factor_list: list 现货因子或者因子组
+    pool_size: int 进程数，每个进程中都有一份所有因子的缓存
+    memory_budget: int 总的内存上限，字节
+
+    Returns
+    -------
+    int: 每个缓存的内存上限，没有缓存时返回memory_budget
+
+    """
+    cache_list = [member.get_stock_date_cache() for factor in factor_list for member in get_member_list(factor) if isinstance(member, TimewindowStockTickFactor)]
+    if len(cache_list) == 0:
+        return memory_budget
+    cache_memory_budget = memory_budget // (pool_size * len(cache_list))
+    for cache in cache_list:
+        cache.set_memory_budget(cache_memory_budget)
+    return cache_memory_budget
+
+class StockTickWorkerPool():
+    """
+    现货因子常驻进程池，一次因子计算过程只创建一次
+
+    Parameters
+    ----------
+    factor_list: list 需要使用进程池的现货因子
+    pool_size: int
+    """
+
+    def __init__(self, factor_list, pool_size=10):
+        self._factor_list = factor_list
+        self._batch = 0
+        # 每个进程都有所有因子的缓存，在序列化给子进程之前平分内存上限
+        distribute_cache_memory_budget(factor_list, pool_size)
+        self._executor = PersistentProcessExecutor(pool_size, init_stock_tick_worker, (factor_list, get_constituent_index(), get_trading_calendar()))
+        for factor in factor_list:
+            factor.set_worker_pool(self)
+
+    def caculate_by_date(self, factor, params_list):
+        factor_index = self._factor_list.index(factor)
+        self._batch = self._batch + 1
+        results = self._executor.execute(caculate_by_date_in_worker, list(map(lambda params: [self._batch, factor_index, params], params_list)))
+        return list(map(lambda result: (result[0], load_worker_result(result[1])), results))
+
+    def close(self):
+        for factor in self._factor_list:
+            factor.set_worker_pool(None)
+        self._executor.close()
+
+class StockTickFactorGroup():
+    """
+    多个现货因子一起计算，每天每个股票只按所有因子列的并集读取一次数据，
+    再分别交给每个因子的enrich_stock_data和execute_caculation。
+    输出的因子列和逐个因子计算一致，但是股票数据中的time和second_remainder只保留一份：
+    逐个计算时这两列在每次merge后加后缀变成time_x，time_y等，这些列不再输出
+
+    Parameters
+    ----------
+    factor_list: list 可以合并计算的现货因子
+    """
+
+    _worker_pool = None
+
+    def __init__(self, factor_list):
+        self._factor_list = factor_list
+        self._columns = []
+        for factor in factor_list:
+            for column in factor.get_columns():
+                if column not in self._columns:
+                    self._columns.append(column)
+
+    def get_factor_list(self):
+        return self._factor_list
+
+    def get_full_name(self):
+        return '_'.join(list(map(lambda factor: factor.get_full_name(), self._factor_list)))
+
+    def get_action_delay(self):
+        return max(list(map(lambda factor: factor.get_action_delay(), self._factor_list)))
+
+    def get_warm_up_ticks(self):
+        warm_up_ticks_list = list(map(lambda factor: factor.get_warm_up_ticks(), self._factor_list))
+        if None in warm_up_ticks_list:
+            return None
+        return max(warm_up_ticks_list)
+
+    def set_worker_pool(self, worker_pool):
+        self._worker_pool = worker_pool
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_worker_pool'] = None
+        return state
+
+    def clear_cache(self):
+        for factor in self._factor_list:
+            factor.clear_cache()
+
+    @timing
+    def caculate(self, data):
+        """
+        按天并行计算所有因子，合并后一次输出所有因子列
+
+        Parameters
+        ----------
+        data
+
+        Returns
+        -------
+
+        """
+        product = data.iloc[0]['product']
+        instrument = data.iloc[0]['instrument']
+        date_list = list(set(data['date'].tolist()))
+        date_list.sort()
+        results_by_date = {}
+        pagination = Pagination(date_list, page_size=20)
+        while pagination.has_next():
+            sub_date_list = pagination.next()
+            get_logger().debug(
+                'Handle date from {0} to {1} for instrument: {2}'.format(sub_date_list[0], sub_date_list[-1], instrument))
+            params_list = list(map(lambda date: [date, instrument, product], sub_date_list))
+            if self._worker_pool:
+                results = self._worker_pool.caculate_by_date(self, params_list)
+            else:
+                results = ProcessExcecutor(10).execute(self.caculate_by_date, params_list)
+            for result in results:
+                results_by_date[result[0]] = result[1]
+        result_sink = ResultSink(self.get_factor_columns(data))
+        with stage_timer('merge'):
+            for date in date_list:
+                cur_date_data = None
+                for factor, factor_data in zip(self._factor_list, results_by_date[date]):
+                    merged_data = factor.merge_with_stock_data(data, date, factor_data)
+                    if cur_date_data is None:
+                        cur_date_data = merged_data
+                    else:
+                        # 都是按datetime左连接，行顺序一致，只补充新的因子列
+                        if len(merged_data) != len(cur_date_data):
+                            raise InvalidStatus('Duplicated datetime in stock data of factor: {0} on date: {1}'.format(factor.get_full_name(), date))
+                        new_columns = list(filter(lambda column: column not in cur_date_data.columns, merged_data.columns.tolist()))
+                        for column in new_columns:
+                            cur_date_data[column] = merged_data[column].values
+                result_sink.append(cur_date_data)
+        with stage_timer('concat'):
+            return result_sink.get_result()
+
+    def get_factor_columns(self, data):
+        columns = []
+        for factor in self._factor_list:
+            for column in factor.get_factor_columns(data):
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    def caculate_by_date(self, *args):
+        """
+        按天计算所有因子
+
+        Parameters
+        ----------
+        args
+
+        Returns
+        -------
+        date, list: 每个因子的计算结果
+
+        """
+        date = args[0][0]
+        instrument = args[0][1]
+        product = args[0][2]
+        with metric_context(date=date):
+            stock_data_list = self.get_stock_tick_data(product, instrument, date)
+            results = []
+            for factor, stock_data_per_date in zip(self._factor_list, stock_data_list):
+                if len(stock_data_per_date) == 0:
+                    get_logger().warning('The data on date: {0} and instrument: {1} is missing'.format(date, instrument))
+                    get_metrics_collector().increase('missing_date', factor=factor.get_full_name())
+                    results.append(stock_data_per_date)
+                else:
+                    with stage_timer('execute_caculation', factor=factor.get_full_name()):
+                        results.append(factor.execute_caculation(date, stock_data_per_date)[1])
+        return date, results
+
+    @timing
+    def get_stock_tick_data(self, product, instrument, date):
+        """
+        每个股票只读取一次，返回每个因子各自的股票数据
+
+        Parameters
+        ----------
+        product
+        instrument
+        date
+
+        Returns
+        -------
+
+        """
+        # 股票列表，过滤条件和数据接口对所有因子都是一样的
+        factor = self._factor_list[0]
+        stock_list = factor.get_stock_list_by_date(product, date)
+        if len(factor._stock_filter) > 0:
+            stock_list = factor._stock_filter
+        temp_data_cache = list(map(lambda factor: [], self._factor_list))
+        if stock_list and len(stock_list) > 0:
+            stock_list = factor._constituent_index.filter_valid_stock_list(date, stock_list)
+            for stock in stock_list:
+                try:
+                    with stage_timer('io'):
+                        daily_stock_data = factor._data_access.access(date, stock, self._columns)
+                except Exception as e:
+                    get_logger().warning('Stock data is missing for date: {0} and stock: {1}'.format(date, stock))
+                    get_metrics_collector().increase('missing_stock_data')
+                    continue
+                if len(daily_stock_data) == 0:
+                    get_logger().warning('Stock data is empty for date: {0} and stock: {1}'.format(date, stock))
+                    continue
+                with stage_timer('enrich'):
+                    for i, cur_factor in enumerate(self._factor_list):
+                        cur_stock_data = daily_stock_data.loc[:, cur_factor.get_columns()]
+                        temp_data_cache[i].append(cur_factor.enrich_stock_data(instrument, date, stock, cur_stock_data))
+        else:
+            get_logger().warning('Stock data configuration is missing for product: {0} and date: {1}'.format(product, date))
+        data_list = []
+        with stage_timer('concat'):
+            for cur_factor, cache in zip(self._factor_list, temp_data_cache):
+                if len(cache) > 0:
+                    data_list.append(pd.concat(cache).reset_index(drop=True))
+                else:
+                    data_list.append(pd.DataFrame(columns=cur_factor.get_columns()))
+        return data_list
+
+def is_groupable(factor):
+    """
+    是否可以放入因子组计算：使用默认的按天计算和股票数据加载逻辑的现货因子
+
+    Parameters
+    ----------
+    factor
+
+    Returns
+    -------
+
+    """
+    if not isinstance(factor, StockTickFactor):
+        return False
+    factor_class = type(factor)
+    return factor_class.caculate is StockTickFactor.caculate \
+        and factor_class.caculate_by_date is StockTickFactor.caculate_by_date \
+        and factor_class.get_stock_tick_data is StockTickFactor.get_stock_tick_data \
+        and factor_class.get_stock_data is StockTickFactor.get_stock_data
+
+def group_stock_tick_factors(factor_list):
+    """
+    把相邻的可合并现货因子放到一个因子组，保持因子原有的计算顺序
+
+    Parameters
+    ----------
+    factor_list
+
+    Returns
+    -------
+
+    """
+    result = []
+    group = []
+    for factor in factor_list:
+        if is_groupable(factor):
+            group.append(factor)
+            continue
+        if len(group) > 0:
+            result.append(group[0] if len(group) == 1 else StockTickFactorGroup(group))
+            group = []
+        result.append(factor)
+    if len(group) > 0:
+        result.append(group[0] if len(group) == 1 else StockTickFactorGroup(group))
+    return result
+
 class TimewindowStockTickFactor(StockTickFactor):
     """用于因子计算需要跨天的情形
 
@@ -402,7 +902,7 @@ class TimewindowStockTickFactor(StockTickFactor):
 
     def __init__(self):
         StockTickFactor.__init__(self)
-        self._stock_date_cache = StockDateCache()
+        self._stock_date_cache = StockDateCache(timewindow_size=self.get_timewindow_size(), prefetch=STOCK_DATE_CACHE_PREFETCH)
 
     @timing
     def prepare_timewindow_data(self, stock, data_list):
@@ -415,6 +915,12 @@ class TimewindowStockTickFactor(StockTickFactor):
         """
         return self._stock_date_cache.get_stock_data_list(data_list, stock)
 
+    def clear_cache(self):
+        self._stock_date_cache.clear()
+
+    def get_stock_date_cache(self):
+        return self._stock_date_cache
+
     def get_stock_date_map(self, instrument, session):
         result_list = session.execute(
             'select t2.tscode, t2.date from future_instrument_config t1, index_constituent_config t2 '
@@ -454,12 +960,39 @@ class TimewindowStockTickFactor(StockTickFactor):
 
 class StockDateCache():
     """
-    股票数据缓存
+    股票数据缓存：
+    按(股票, 日期)缓存每天的股票数据，总内存不超过memory_budget（按memory_usage(deep=True)计算），
+    超出时先淘汰当前日期时间窗之前的数据，再按最近最少使用淘汰，
+    开启预取时，后台线程提前加载同一只股票下一个交易日的数据
+
+    Parameters
+    ----------
+    memory_budget: int 单个缓存的内存上限，字节，常驻进程池中由distribute_cache_memory_budget平分总的上限
+    timewindow_size: int 时间窗大小，当前日期之前超过这个交易日数的数据优先淘汰
+    prefetch: bool 是否预取下一个交易日，日期格式为yyyy-mm-dd，因子中的缓存由STOCK_DATE_CACHE_PREFETCH配置
     """
 
-    def __init__(self):
-        self._stock_data_cache = {}
-        self._data_access = StockDataAccess(check_original=False)
+    def __init__(self, memory_budget=STOCK_DATE_CACHE_MEMORY_BUDGET, timewindow_size=None, prefetch=False):
+        self._stock_data_cache = OrderedDict()
+        self._size_dict = {}
+        self._total_size = 0
+        self._memory_budget = memory_budget
+        self._timewindow_size = timewindow_size
+        self._current_date = ''
+        self._prefetch = prefetch
+        self._prefetch_executor = None
+        self._prefetch_dict = {}
+        self._hit_count = 0
+        self._miss_count = 0
+        self._eviction_count = 0
+        self._data_access = StockDataAccess(check_original=False, columnar_enabled=True)
+
+    def __getstate__(self):
+        # 进程间传递时不带线程池和未完成的预取
+        state = self.__dict__.copy()
+        state['_prefetch_executor'] = None
+        state['_prefetch_dict'] = {}
+        return state
 
     def add_stock_data(self, date, stock, data):
         """
@@ -474,10 +1007,15 @@ class StockDateCache():
         -------
 
         """
-        if not (stock in self._stock_data_cache):
-            self._stock_data_cache[stock] = {date:data}
-        elif not (date in self._stock_data_cache[stock]):
-            self._stock_data_cache[stock][date] = data
+        if date > self._current_date:
+            self._current_date = date
+        if (stock, date) in self._stock_data_cache:
+            return
+        size = int(data.memory_usage(deep=True).sum())
+        self._stock_data_cache[(stock, date)] = data
+        self._size_dict[(stock, date)] = size
+        self._total_size = self._total_size + size
+        self.evict((stock, date))
 
     def get_stock_data(self, date, stock):
         """
@@ -492,15 +1030,121 @@ class StockDateCache():
 
         """
         try:
-            if not (stock in self._stock_data_cache and date in self._stock_data_cache[stock]):
-                self.add_stock_data(date, stock, self._data_access.access(date, stock))
-            return self._stock_data_cache[stock][date]
+            if (stock, date) in self._stock_data_cache:
+                self._hit_count = self._hit_count + 1
+                self._stock_data_cache.move_to_end((stock, date))
+                data = self._stock_data_cache[(stock, date)]
+            else:
+                self._miss_count = self._miss_count + 1
+                future = self._prefetch_dict.pop((stock, date), None)
+                data = future.result() if future is not None else self._data_access.access(date, stock)
+                self.add_stock_data(date, stock, data)
+            if self._prefetch:
+                self.prefetch(date, stock)
+            return data
         except Exception as e:
             get_logger().error('The data for date {0} and stock {1} is missing'.format(date, stock))
             return pd.DataFrame()
 
+    def prefetch(self, date, stock):
+        next_date = get_trading_calendar().get_next_n_transaction_date(date, 1)
+        if next_date == '' or (stock, next_date) in self._stock_data_cache or (stock, next_date) in self._prefetch_dict:
+            return
+        if self._prefetch_executor is None:
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        # 预取的数据不计入内存上限，限制未取走的数量
+        if len(self._prefetch_dict) >= STOCK_DATE_CACHE_MAX_PREFETCH:
+            self._prefetch_dict.pop(next(iter(self._prefetch_dict))).cancel()
+        self._prefetch_dict[(stock, next_date)] = self._prefetch_executor.submit(self._data_access.access, next_date, stock)
+
+    def set_memory_budget(self, memory_budget):
+        """
+        修改内存上限，超出时立即淘汰
+
+        Parameters
+        ----------
+        memory_budget: int
+
+        Returns
+        -------
+
+        """
+        self._memory_budget = memory_budget
+        self.evict()
+
+    def get_memory_budget(self):
+        return self._memory_budget
+
+    def get_window_start_date(self):
+        """
+        当前日期所在时间窗的第一天，按缓存中出现过的日期计算
+
+        Returns
+        -------
+
+        """
+        if self._timewindow_size is None:
+            return ''
+        date_list = sorted(set(map(lambda key: key[1], self._stock_data_cache.keys())) | {self._current_date})
+        return date_list[max(date_list.index(self._current_date) - self._timewindow_size, 0)]
+
+    def evict(self, excluded_key=None):
+        """
+        超出内存上限时淘汰数据，先淘汰时间窗之前的，再按最近最少使用
+
+        Parameters
+        ----------
+        excluded_key: 不淘汰的key，一般为刚加入的数据
+
+        Returns
+        -------
+
+        """
+        if self._total_size <= self._memory_budget:
+            return
+        window_start_date = self.get_window_start_date()
+        expired_key_list = list(filter(lambda key: key[1] < window_start_date and key != excluded_key, self._stock_data_cache.keys()))
+        for key in expired_key_list:
+            if self._total_size <= self._memory_budget:
+                return
+            self.remove_stock_data(key[1], key[0])
+            self._eviction_count = self._eviction_count + 1
+        for key in list(self._stock_data_cache.keys()):
+            if self._total_size <= self._memory_budget:
+                return
+            if key != excluded_key:
+                self.remove_stock_data(key[1], key[0])
+                self._eviction_count = self._eviction_count + 1
+
+    def clear(self):
+        """
+        清空缓存和未取走的预取数据
+        """
+        for future in self._prefetch_dict.values():
+            future.cancel()
+        self._prefetch_dict = {}
+        self._stock_data_cache = OrderedDict()
+        self._size_dict = {}
+        self._total_size = 0
+        self._current_date = ''
+
     def get_stock_data_cache(self):
-        return self._stock_data_cache
+        stock_data_cache = {}
+        for (stock, date), data in self._stock_data_cache.items():
+            stock_data_cache.setdefault(stock, {})[date] = data
+        return stock_data_cache
+
+    def get_total_size(self):
+        return self._total_size
+
+    def get_hit_count(self):
+        return self._hit_count
+
+    def get_miss_count(self):
+        return self._miss_count
+
+    def get_eviction_count(self):
+        return self._eviction_count
 
     def get_stock_data_list(self, date_list, stock):
         """
@@ -538,8 +1182,9 @@ class StockDateCache():
         -------
 
         """
-        if stock in self._stock_data_cache and date in self._stock_data_cache[stock]:
-            del self._stock_data_cache[stock][date]
+        if (stock, date) in self._stock_data_cache:
+            del self._stock_data_cache[(stock, date)]
+            self._total_size = self._total_size - self._size_dict.pop((stock, date))
 
 
 class StockTickDifferenceFactor(StockTickFactor, DifferenceFactor):
@@ -554,7 +1199,7 @@ class StockTickDifferenceFactor(StockTickFactor, DifferenceFactor):
     @timing
     def caculate(self, data):
         """
-        现货因子计算逻辑，多进程按天计算
+        基于目标因子按天计算，目标因子在同一个计算链中时直接使用内存中的结果
         Parameters
         ----------
         data
@@ -564,22 +1209,21 @@ class StockTickDifferenceFactor(StockTickFactor, DifferenceFactor):
 
         """
         columns = self.get_factor_columns(data)
-        new_data = pd.DataFrame(columns=columns)
-        product = data.iloc[0]['product']
-        original_data = self.get_target_factor().load(product)
+        result_sink = ResultSink(columns)
+        target_data_dict = get_target_data_by_date(self, data)
         date_list = list(set(data['date'].tolist()))
         date_list.sort()
         for date in date_list:
-            temp_data = original_data[original_data['date'] == date]
-            if len(temp_data) > 0:  # 因为已经按主力合约交割日进行了截取，所以temp_data有可能是空的，必须做这个处理
+            if date in target_data_dict:  # 因为已经按主力合约交割日进行了截取，所以有可能没有当天的数据，必须做这个处理
+                temp_data = target_data_dict[date].copy()
                 for param in self._params:
                     temp_data.loc[:, self.get_key(param)] = temp_data[self.get_target_factor().get_key()] - temp_data[self.get_target_factor().get_key()].shift(param)
                     if temp_data.dtypes[self.get_key(param)] != FACTOR_STANDARD_FIELD_TYPE:
                         temp_data[self.get_key(param)] = temp_data[self.get_key(param)].astype(FACTOR_STANDARD_FIELD_TYPE)
                     # 不足param长度的用第一个时间点计算
                     temp_data.loc[np.isnan(temp_data[self.get_key(param)]), self.get_key(param)] = temp_data[self.get_target_factor().get_key()] -  temp_data.iloc[0][self.get_target_factor().get_key()]
-                new_data = pd.concat([new_data, temp_data])
-        return new_data
+                result_sink.append(temp_data)
+        return result_sink.get_result()
 
 
 class StockTickMeanFactor(StockTickFactor, MeanFactor):
@@ -594,7 +1238,7 @@ class StockTickMeanFactor(StockTickFactor, MeanFactor):
     @timing
     def caculate(self, data):
         """
-        现货因子计算逻辑，多进程按天计算
+        基于目标因子按天计算，目标因子在同一个计算链中时直接使用内存中的结果
         Parameters
         ----------
         data
@@ -604,30 +1248,19 @@ class StockTickMeanFactor(StockTickFactor, MeanFactor):
 
         """
         columns = self.get_factor_columns(data)
-        new_data = pd.DataFrame(columns=columns)
-        product = data.iloc[0]['product']
-        original_data = self.get_target_factor().load(product)
+        result_sink = ResultSink(columns)
+        target_data_dict = get_target_data_by_date(self, data)
         date_list = list(set(data['date'].tolist()))
         date_list.sort()
         for date in date_list:
-            temp_data = original_data[original_data['date'] == date]
-            if len(temp_data) > 0:  # 因为已经按主力合约交割日进行了截取，所以temp_data有可能是空的，必须做这个处理
+            if date in target_data_dict:  # 因为已经按主力合约交割日进行了截取，所以有可能没有当天的数据，必须做这个处理
+                temp_data = target_data_dict[date].copy()
                 for param in self._params:
-                    temp_data.loc[:, self.get_key(param)] = temp_data[self.get_target_factor().get_key()].rolling(param).mean()
-                    if temp_data.dtypes[self.get_key(param)] != FACTOR_STANDARD_FIELD_TYPE:
-                        temp_data[self.get_key(param)] = temp_data[self.get_key(param)].astype(FACTOR_STANDARD_FIELD_TYPE)
-                    # 两种方式补0或者滑动时间窗
+                    # 两种方式补0或者滑动时间窗，窗口未满时按扩展窗口计算
                     # temp_data.loc[np.isnan(temp_data[self.get_key(param)]), self.get_key(param)] = 0
-                    filled_data_arr = np.zeros(len(temp_data.loc[np.isnan(temp_data[self.get_key(param)])]))
-                    temp_arr = temp_data.loc[np.isnan(temp_data[self.get_key(param)])][self.get_target_factor().get_key()].tolist()
-                    for i in range(len(temp_arr)):
-                        if i == 0:
-                            filled_data_arr[i] = temp_arr[i]
-                        else:
-                            filled_data_arr[i] = np.mean(temp_arr[:i + 1])
-                    temp_data.loc[np.isnan(temp_data[self.get_key(param)]), self.get_key(param)] = filled_data_arr
-                new_data = pd.concat([new_data, temp_data])
-        return new_data
+                    temp_data[self.get_key(param)] = warm_up_rolling_moments(temp_data[self.get_target_factor().get_key()], param)['mean'].astype(FACTOR_STANDARD_FIELD_TYPE)
+                result_sink.append(temp_data)
+        return result_sink.get_result()
 
 class StockTickStdFactor(StockTickFactor, StdFactor):
     """
@@ -641,7 +1274,7 @@ class StockTickStdFactor(StockTickFactor, StdFactor):
     @timing
     def caculate(self, data):
         """
-        现货因子计算逻辑，多进程按天计算
+        基于目标因子按天计算，目标因子在同一个计算链中时直接使用内存中的结果
         Parameters
         ----------
         data
@@ -651,30 +1284,19 @@ class StockTickStdFactor(StockTickFactor, StdFactor):
 
         """
         columns = self.get_factor_columns(data)
-        new_data = pd.DataFrame(columns=columns)
-        product = data.iloc[0]['product']
-        original_data = self.get_target_factor().load(product)
+        result_sink = ResultSink(columns)
+        target_data_dict = get_target_data_by_date(self, data)
         date_list = list(set(data['date'].tolist()))
         date_list.sort()
         for date in date_list:
-            temp_data = original_data[original_data['date'] == date]
-            if len(temp_data) > 0:  # 因为已经按主力合约交割日进行了截取，所以temp_data有可能是空的，必须做这个处理
+            if date in target_data_dict:  # 因为已经按主力合约交割日进行了截取，所以有可能没有当天的数据，必须做这个处理
+                temp_data = target_data_dict[date].copy()
                 for param in self._params:
-                    temp_data.loc[:, self.get_key(param)] = temp_data[self.get_target_factor().get_key()].rolling(param).std()
-                    if temp_data.dtypes[self.get_key(param)] != FACTOR_STANDARD_FIELD_TYPE:
-                        temp_data[self.get_key(param)] = temp_data[self.get_key(param)].astype(FACTOR_STANDARD_FIELD_TYPE)
-                    # 两种方式补0或者滑动时间窗
+                    # 两种方式补0或者滑动时间窗，窗口未满时按扩展窗口计算
                     # temp_data.loc[np.isnan(temp_data[self.get_key(param)]), self.get_key(param)] = 0
-                    filled_data_arr = np.zeros(len(temp_data.loc[np.isnan(temp_data[self.get_key(param)])]))
-                    temp_arr = temp_data.loc[np.isnan(temp_data[self.get_key(param)])][self.get_target_factor().get_key()].tolist()
-                    for i in range(len(temp_arr)):
-                        if i == 0:
-                            filled_data_arr[i] = 0
-                        else:
-                            filled_data_arr[i] = np.std(temp_arr[:i + 1])
-                    temp_data.loc[np.isnan(temp_data[self.get_key(param)]), self.get_key(param)] = filled_data_arr
-                new_data = pd.concat([new_data, temp_data])
-        return new_data
+                    temp_data[self.get_key(param)] = warm_up_rolling_moments(temp_data[self.get_target_factor().get_key()], param)['std'].astype(FACTOR_STANDARD_FIELD_TYPE)
+                result_sink.append(temp_data)
+        return result_sink.get_result()
 
 if __name__ == '__main__':
     stock_date_cache = StockDateCache()
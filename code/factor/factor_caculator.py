@@ -2,16 +2,19 @@
 # -*- coding:utf8 -*-
 import os
 import re
+import bisect
+import math
 import time
 import pandas as pd
 import random
 import uuid
 
 from common.aop import timing
-from common.constants import FUTURE_TICK_ORGANIZED_DATA_PATH, CONFIG_PATH, FACTOR_PATH, STOCK_INDEX_PRODUCTS, TEMP_PATH, TEST_PATH
+from common.constants import FUTURE_TICK_ORGANIZED_DATA_PATH, CONFIG_PATH, FACTOR_PATH, STOCK_INDEX_PRODUCTS, TEMP_PATH, TEST_PATH, FUTURE_TICK_COUNT_PER_DAY, REPORT_PATH
 from common.exception.exception import InvalidStatus
 from common.localio import read_decompress, list_files_in_path, save_compress
-from common.persistence.dbutils import create_session
+from common.metrics import get_metrics_collector, metric_context, stage_timer
+from common.persistence.dbutils import session_scope
 from common.persistence.po import FutureInstrumentConfig
 from factor.volume_price_factor import WilliamFactor
 from factor.spot_goods_factor import TotalCommissionRatioFactor, TenGradeCommissionRatioFactor, AmountAndCommissionRatioFactor, FiveGradeCommissionRatioFactor, \
@@ -23,14 +26,70 @@ from factor.spot_goods_factor import TotalCommissionRatioFactor, TenGradeCommiss
     BidLargeAmountBillFactor, AmountBid10GradeCommissionRatioFactor, AskLargeAmountBillFactor, AmountBid10GradeCommissionRatioStdFactor, AmountAsk10GradeCommissionRatioStdFactor, Commission10GradeVolatilityRatioFactor, AmountAndCommissionRatioMeanFactor,\
     AmountAndCommissionRatioStdFactor
 
-from factor.base_factor import StockTickFactor, TimewindowStockTickFactor
+from factor.indicator import IndicatorCache, set_indicator_cache
+from factor.factor_storage import FactorPartitionStore, ResultSink, PartitionResultSink
+from factor.factor_dependency import sort_by_dependency, prepare_target_factor_data, get_target_factor_cache
+from factor.base_factor import StockTickFactor, TimewindowStockTickFactor, StockTickWorkerPool, StockTickFactorGroup, group_stock_tick_factors
 from common.log import get_logger
 from framework.pagination import Pagination
 from framework.localconcurrent import ProcessRunner, ProcessExcecutor
 from common.persistence.po import FactorProcessRecord
 from data.access import StockDataAccess
 from common.timeutils import add_milliseconds_suffix, get_last_or_next_trading_date_by_stock
-from common.persistence.dao import FutureInstrumentConfigDao
+from common.persistence.trading_calendar import get_trading_calendar, reset_trading_calendar
+
+def create_worker_pool(caculation_list):
+    """
+    现货因子共用一个常驻进程池，整个计算过程只创建一次，没有现货因子时返回None
+
+    Parameters
+    ----------
+    caculation_list
+
+    Returns
+    -------
+
+    """
+    stock_tick_factor_list = list(filter(lambda factor: isinstance(factor, (StockTickFactor, StockTickFactorGroup)), caculation_list))
+    if len(stock_tick_factor_list) > 0:
+        return StockTickWorkerPool(stock_tick_factor_list)
+    return None
+
+
+def get_warm_up_days(factor_list):
+    """
+    增量计算需要的预热交易日数，None表示需要全部历史数据
+
+    Parameters
+    ----------
+    factor_list
+
+    Returns
+    -------
+
+    """
+    warm_up_ticks_list = list(map(lambda factor: factor.get_warm_up_ticks(), factor_list))
+    if None in warm_up_ticks_list:
+        return None
+    return math.ceil(max(warm_up_ticks_list) / FUTURE_TICK_COUNT_PER_DAY)
+
+
+def get_redo_days(factor_list):
+    """
+    已有数据中需要重新计算的交易日数，因子信号要延迟action_delay个tick才能使用，
+    最后几天的数据在新数据到来之前是不完整的
+
+    Parameters
+    ----------
+    factor_list
+
+    Returns
+    -------
+
+    """
+    action_delay = max(list(map(lambda factor: factor.get_action_delay(), factor_list)))
+    return math.ceil(action_delay / FUTURE_TICK_COUNT_PER_DAY)
+
 
 class FactorCaculator():
     """因子文件生成类
@@ -40,13 +99,16 @@ class FactorCaculator():
     """
 
     @timing
-    def caculate(self, process_code, factor_list, include_product_list=[], include_instrument_list=[], performance_test=False, need_resume=True):
+    def caculate(self, process_code, factor_list, include_product_list=[], include_instrument_list=[], performance_test=False, need_resume=True, single_pass=True, partitioned=False):
         '''
         生成因子文件
 
         Parameters
         ----------
         factor_list
+        single_pass: 现货因子是否合并计算，每天每个股票只读取一次数据，
+                     因子列和逐个计算一致，股票数据的time列只保留一份，不再输出time_x，time_y等加后缀的列
+        partitioned: 是否按 品种/合约/日期 分区存储
 
         Returns
         -------
@@ -54,62 +116,159 @@ class FactorCaculator():
         '''
         if len(factor_list) == 0:
             raise InvalidStatus('Empty factor list')
-        #获取k线文件列模板
-        session = create_session()
+        # 每次计算单独统计，结束时输出到报告目录
+        get_metrics_collector().reset()
         if len(include_product_list) == 0:
             include_product_list = STOCK_INDEX_PRODUCTS
-        for product in include_product_list:
-            temp_file = TEMP_PATH + product + '_' + '_'.join(
-                list(map(lambda factor: factor.get_full_name(), factor_list))) + '.temp'
-            if need_resume:
-                check_handled = session.execute(
-                    'select max(instrument) from factor_process_record where process_code = :process_code and product = :product',
-                    {'process_code': process_code, 'product': product}).fetchall()
-                current_instrument = check_handled[0][0]
-            else:
-                current_instrument = None
-            if current_instrument:
-                factor_data = read_decompress(temp_file)
-            else:
-                factor_data = pd.DataFrame()
-            instrument_list = session.execute('select distinct instrument from future_instrument_config where product = :product order by instrument', {'product': product}).fetchall()
-            instrument_list = list(filter(lambda instrument : len(include_instrument_list) == 0 or instrument[0] in include_instrument_list, instrument_list))
-            instrument_list = list(map(lambda instrument: instrument[0], instrument_list))
-            pagination = Pagination(instrument_list, page_size=5)
-            skip = False
-            while pagination.has_next():
-                sub_instrument_list = pagination.next()
-                get_logger().info('Start to handle instrument list: {}'.format(sub_instrument_list))
-                if current_instrument in sub_instrument_list: #已经处理过的最后一页，下一页开始要处理了
-                    skip = True
-                    continue
-                if current_instrument and current_instrument not in sub_instrument_list and not skip: #已经处理过的页面
-                    continue
-                params_list = list(map(lambda instrument: [factor_list, instrument, product], sub_instrument_list))
-                results = ProcessExcecutor(1).execute(self.caculate_by_instrument, params_list)
-                temp_cache = {}
-                for result in results:
-                    temp_cache[result[0]] = result[1]
-                for instrument in sub_instrument_list:
-                    factor_data = pd.concat([factor_data, temp_cache[instrument]])
-                    factor_process_record = FactorProcessRecord(process_code, product, instrument)
-                    session.add(factor_process_record)
-                # 每一个分页结束保存临时文件并提交
-                get_logger().info('Save temp file for instrument list: {}'.format(sub_instrument_list))
-                session.commit()
+        if single_pass:
+            caculation_list = group_stock_tick_factors(factor_list)
+        else:
+            caculation_list = factor_list
+        # 衍生因子排在目标因子之后，直接使用目标因子在内存中的结果
+        caculation_list = sort_by_dependency(caculation_list)
+        worker_pool = create_worker_pool(caculation_list)
+        try:
+            for product in include_product_list:
+                prepare_target_factor_data(caculation_list, product)
+                temp_file = TEMP_PATH + product + '_' + '_'.join(
+                    list(map(lambda factor: factor.get_full_name(), factor_list))) + '.temp'
                 if need_resume:
-                    save_compress(factor_data, temp_file)
-            factor_data = factor_data.reset_index(drop=True)
-            if not performance_test:
-                target_factor_file = FACTOR_PATH + product + '_' + '_'.join(
-                    list(map(lambda factor: factor.get_full_name(), factor_list)))
-            else:
-                target_factor_file = TEST_PATH + product + '_' + '_'.join(
-                    list(map(lambda factor: factor.get_full_name(), factor_list)))
-            get_logger().info('Save factor file: {0}'.format(target_factor_file))
-            save_compress(factor_data, target_factor_file)
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+                    with session_scope() as session:
+                        check_handled = session.execute(
+                            'select max(instrument) from factor_process_record where process_code = :process_code and product = :product',
+                            {'process_code': process_code, 'product': product}).fetchall()
+                    current_instrument = check_handled[0][0]
+                else:
+                    current_instrument = None
+                factor_file_name = '_'.join(list(map(lambda factor: factor.get_full_name(), factor_list)))
+                root_path = TEST_PATH if performance_test else FACTOR_PATH
+                if partitioned:
+                    # 每个合约计算完直接写入分区，已经写入的分区就是断点，不需要临时文件
+                    store = FactorPartitionStore(product, factor_file_name, root_path)
+                    get_logger().info('Save factor partitions: {0}'.format(store.get_path()))
+                    result_sink = PartitionResultSink(store)
+                else:
+                    result_sink = ResultSink()
+                if current_instrument and (not partitioned or os.path.exists(temp_file)):
+                    with stage_timer('io'):
+                        result_sink.append(read_decompress(temp_file))
+                with session_scope() as session:
+                    instrument_list = session.execute('select distinct instrument from future_instrument_config where product = :product order by instrument', {'product': product}).fetchall()
+                instrument_list = list(filter(lambda instrument : len(include_instrument_list) == 0 or instrument[0] in include_instrument_list, instrument_list))
+                instrument_list = list(map(lambda instrument: instrument[0], instrument_list))
+                pagination = Pagination(instrument_list, page_size=5)
+                skip = False
+                while pagination.has_next():
+                    sub_instrument_list = pagination.next()
+                    get_logger().info('Start to handle instrument list: {}'.format(sub_instrument_list))
+                    if current_instrument in sub_instrument_list: #已经处理过的最后一页，下一页开始要处理了
+                        skip = True
+                        continue
+                    if current_instrument and current_instrument not in sub_instrument_list and not skip: #已经处理过的页面
+                        continue
+                    params_list = list(map(lambda instrument: [caculation_list, instrument, product], sub_instrument_list))
+                    if worker_pool:
+                        # 进程池不能跨进程传递，合约在当前进程串行处理，按天的计算由常驻进程并行
+                        results = list(map(self.caculate_by_instrument, params_list))
+                    else:
+                        results = ProcessExcecutor(1).execute(self.caculate_by_instrument, params_list)
+                    temp_cache = {}
+                    for result in results:
+                        temp_cache[result[0]] = result[1]
+                    # 每一个分页结束保存临时文件并提交
+                    with session_scope() as session:
+                        for instrument in sub_instrument_list:
+                            with stage_timer('save' if partitioned else 'concat'):
+                                result_sink.append(temp_cache[instrument])
+                            factor_process_record = FactorProcessRecord(process_code, product, instrument)
+                            session.add(factor_process_record)
+                    get_logger().info('Save temp file for instrument list: {}'.format(sub_instrument_list))
+                    if need_resume and not partitioned:
+                        with stage_timer('save'):
+                            save_compress(result_sink.get_result(), temp_file)
+                if not partitioned:
+                    factor_data = result_sink.get_result().reset_index(drop=True)
+                    target_factor_file = root_path + product + '_' + factor_file_name
+                    get_logger().info('Save factor file: {0}'.format(target_factor_file))
+                    with stage_timer('save'):
+                        save_compress(factor_data, target_factor_file)
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+        finally:
+            get_target_factor_cache().clear()
+            if worker_pool:
+                worker_pool.close()
+            metrics_file = REPORT_PATH + 'metrics' + os.path.sep + process_code
+            get_logger().info('Save metrics file: {0}'.format(metrics_file))
+            get_metrics_collector().dump(metrics_file)
+
+    @timing
+    def caculate_incrementally(self, factor_list, include_product_list=[], include_instrument_list=[], single_pass=True):
+        '''
+        增量更新因子，只计算已有因子数据之后新增的交易日，
+        每个合约从已有数据的最后日期开始，往前多取预热数据，计算后只保留新的日期，
+        结果按 品种/合约/日期 分区写入，只有新的分区会被写入
+
+        Parameters
+        ----------
+        factor_list
+        include_product_list
+        include_instrument_list
+        single_pass: 现货因子是否合并计算
+
+        Returns
+        -------
+
+        '''
+        if len(factor_list) == 0:
+            raise InvalidStatus('Empty factor list')
+        if len(include_product_list) == 0:
+            include_product_list = STOCK_INDEX_PRODUCTS
+        if single_pass:
+            caculation_list = group_stock_tick_factors(factor_list)
+        else:
+            caculation_list = factor_list
+        # 衍生因子排在目标因子之后，直接使用目标因子在内存中的结果
+        caculation_list = sort_by_dependency(caculation_list)
+        worker_pool = create_worker_pool(caculation_list)
+        try:
+            for product in include_product_list:
+                prepare_target_factor_data(caculation_list, product)
+                factor_file_name = '_'.join(list(map(lambda factor: factor.get_full_name(), factor_list)))
+                store = FactorPartitionStore(product, factor_file_name, FACTOR_PATH)
+                target_factor_file = FACTOR_PATH + product + '_' + factor_file_name
+                if not store.exists() and os.path.exists(target_factor_file):
+                    # 已有的单文件因子数据先转为分区存储
+                    get_logger().info('Convert factor file to partitions: {0}'.format(target_factor_file))
+                    store.write(read_decompress(target_factor_file))
+                last_date_dict = store.get_last_date_dict()
+                with session_scope() as session:
+                    instrument_list = session.execute('select distinct instrument from future_instrument_config where product = :product order by instrument', {'product': product}).fetchall()
+                instrument_list = list(filter(lambda instrument : len(include_instrument_list) == 0 or instrument[0] in include_instrument_list, instrument_list))
+                instrument_list = list(map(lambda instrument: instrument[0], instrument_list))
+                params_list = list(map(lambda instrument: [caculation_list, instrument, product, last_date_dict.get(instrument)], instrument_list))
+                if worker_pool:
+                    results = list(map(self.caculate_by_instrument, params_list))
+                else:
+                    results = ProcessExcecutor(1).execute(self.caculate_by_instrument, params_list)
+                is_updated = False
+                for instrument, data in results:
+                    if len(data) == 0:
+                        continue
+                    get_logger().info('Update instrument: {0} from {1} to {2}'.format(instrument, data['date'].min(), data['date'].max()))
+                    # 重新计算的日期覆盖已有分区，新数据中没有的日期删除
+                    new_date_set = set(data['date'].tolist())
+                    for stale_instrument, stale_date in store.list_partitions([instrument], start_date=data['date'].min()):
+                        if stale_date not in new_date_set:
+                            store.delete(stale_instrument, stale_date)
+                    store.write(data)
+                    is_updated = True
+                if not is_updated:
+                    get_logger().info('Factor partitions are up to date for product: {0}'.format(product))
+        finally:
+            get_target_factor_cache().clear()
+            if worker_pool:
+                worker_pool.close()
 
     def caculate_by_instrument(self, *args):
         """
@@ -120,7 +279,7 @@ class FactorCaculator():
         factor_list
         instrument
         product
-        session
+        last_date: 可选，已有因子数据的最后日期，只计算之后的数据
 
         Returns
         -------
@@ -129,26 +288,76 @@ class FactorCaculator():
         factor_list = args[0][0]
         instrument = args[0][1]
         product = args[0][2]
-        session = create_session()
+        # 增量计算时为已有因子数据的最后日期
+        last_date = args[0][3] if len(args[0]) > 3 else None
         target_instrument_file = FUTURE_TICK_ORGANIZED_DATA_PATH + product + os.path.sep + instrument + '.pkl'
         get_logger().info('Handle instrument: {0} for file: {1}'.format(instrument, target_instrument_file))
-        data = read_decompress(target_instrument_file)
+        with stage_timer('io', product=product):
+            data = read_decompress(target_instrument_file)
         data['date'] = data['datetime'].str[0:10]
         data['product'] = product
         data['instrument'] = instrument
-        for factor in factor_list:
-            # 这个异常不能捕获，任何一个合约的异常都必须处理，不然最终还要修复
-            data = factor.caculate(data)
+        # 主力合约区间，只有这个区间内的数据会被保留
+        with session_scope() as session:
+            start_date, end_date = self.get_main_date_range(session, product, instrument)
+        if start_date is None:
+            get_logger().info('Instrument: {0} has never been the main contract'.format(instrument))
+            return instrument, data.iloc[0:0]
+        caculation_start_date = None
+        if last_date:
+            date_list = data['date'].drop_duplicates().sort_values().tolist()
+            new_date_index = bisect.bisect_right(date_list, last_date)
+            # 已有的数据截取到了主力合约区间，区间之后的日期不是新数据
+            if new_date_index == len(date_list) or date_list[new_date_index] > end_date:
+                get_logger().info('No new data for instrument: {0} after {1}'.format(instrument, last_date))
+                return instrument, data.iloc[0:0]
+            # 最后几天受行为延迟影响，需要重新计算
+            start_index = max(new_date_index - get_redo_days(factor_list), 0)
+            caculation_start_date = date_list[start_index]
+            warm_up_days = get_warm_up_days(factor_list)
+            if warm_up_days is not None:
+                data = data[data['date'] >= date_list[max(start_index - warm_up_days, 0)]]
+            get_logger().info('Caculate instrument: {0} from {1} with {2} rows'.format(instrument, caculation_start_date, len(data)))
+        # 同一个合约内各因子共享指标计算结果
+        indicator_cache = IndicatorCache()
+        set_indicator_cache(indicator_cache)
+        try:
+            for factor in factor_list:
+                # 这个异常不能捕获，任何一个合约的异常都必须处理，不然最终还要修复
+                with metric_context(factor=factor.get_full_name(), product=product):
+                    data = factor.caculate(data)
+        finally:
+            set_indicator_cache(None)
+            indicator_cache.clear()
         # 截取主力合约区间
+        data = data[(data['date'] >= start_date) & (data['date'] <= end_date)]
+        if caculation_start_date:
+            # 去掉预热数据
+            data = data[data['date'] >= caculation_start_date]
+        return instrument, data
+
+    def get_main_date_range(self, session, product, instrument):
+        """
+        合约作为主力合约的日期区间
+
+        Parameters
+        ----------
+        session
+        product
+        instrument
+
+        Returns
+        -------
+        start_date, end_date: 没有作为主力合约时为None
+
+        """
         date_range = session.execute(
             'select min(date), max(date) from future_instrument_config where product = :product and instrument = :instrument and is_main = 0',
             {'product': product, 'instrument': instrument})
-        if date_range.rowcount > 0:
-            date_range_query_result = date_range.fetchall()
-            start_date = date_range_query_result[0][0]
-            end_date = date_range_query_result[0][1]
-            data = data[(data['date'] >= start_date) & (data['date'] <= end_date)]
-        return instrument, data
+        date_range_query_result = date_range.fetchall()
+        if len(date_range_query_result) == 0:
+            return None, None
+        return date_range_query_result[0][0], date_range_query_result[0][1]
 
     @timing
     def caculate_manually_check(self, factor, stock_count = 2, manually_check_file_count = 1, is_accumulated = False):
@@ -165,18 +374,19 @@ class FactorCaculator():
         '''
         # 获取k线文件列模板
         window_size = 100
-        session = create_session()
-        future_instrument_config_dao = FutureInstrumentConfigDao()
+        trading_calendar = get_trading_calendar()
         product_list = STOCK_INDEX_PRODUCTS
         # 每一个品种生成一个检测文件
         for product in product_list:
             get_logger().info('Handle product {0}'.format(product))
-            instrument_list = session.execute('select distinct instrument from future_instrument_config where product = :product order by instrument', {'product': product}).fetchall()
+            with session_scope() as session:
+                instrument_list = session.execute('select distinct instrument from future_instrument_config where product = :product order by instrument', {'product': product}).fetchall()
             for i in range(manually_check_file_count):
                 rdm_number = random.randint(0, len(instrument_list) - 1)
                 # 随机选择一个合约
                 instrument = instrument_list[rdm_number][0]
-                date_list = session.execute('select date from future_instrument_config where instrument = :instrument and is_main = 0 order by date', {'instrument' : instrument}).fetchall()
+                with session_scope() as session:
+                    date_list = session.execute('select date from future_instrument_config where instrument = :instrument and is_main = 0 order by date', {'instrument' : instrument}).fetchall()
                 rdm_number = random.randint(0, len(date_list) - 1)
                 #随机选择一天
                 date = date_list[rdm_number][0]
@@ -217,7 +427,7 @@ class FactorCaculator():
                                 stock_data = stock_data[(stock_data['time'] >= min_time) & (stock_data['time'] <= max_time)]
                             stock_data.to_csv(FACTOR_PATH + 'manually' + os.path.sep + product + '_' + factor.get_full_name() + '_' + stock + '.csv')
                             if isinstance(factor, TimewindowStockTickFactor):
-                                days_before = future_instrument_config_dao.get_last_n_transaction_date_list(date, 3)
+                                days_before = trading_calendar.get_last_n_transaction_date_list(date, 3)
                                 for dt in days_before:
                                     if dt != date:
                                         stock_data_before = data_access.access(dt, stock)
@@ -228,29 +438,30 @@ class FactorCaculator():
 
     @timing
     def init_instrument_config(self):
-        session = create_session()
-        session.execute('delete from future_instrument_config')
-        main_instrument_config = pd.DataFrame(pd.read_pickle(CONFIG_PATH + 'all-main.pkl'))
-        main_instrument_config = main_instrument_config[STOCK_INDEX_PRODUCTS]
-        for product in STOCK_INDEX_PRODUCTS:
-            instrument_list = list_files_in_path(FUTURE_TICK_ORGANIZED_DATA_PATH + product)
-            instrument_list.sort()
-            for instrument in instrument_list:
-                if not re.search('[0-9]{4}', instrument):
-                    continue
-                data = read_decompress(FUTURE_TICK_ORGANIZED_DATA_PATH + product + os.path.sep + instrument)
-                data['date'] = data['datetime'].str[0:10]
-                date_list = list(set(data['date'].tolist()))
-                date_list.sort()
-                for date in date_list:
-                    main_instrument = main_instrument_config[main_instrument_config.index == date][product].tolist()[0]
-                    current_instrument = instrument.split('.')[0]
-                    if main_instrument == current_instrument:
-                        config = FutureInstrumentConfig(product, current_instrument , date, 0)
-                    else:
-                        config = FutureInstrumentConfig(product, current_instrument, date, 1)
-                    session.add(config)
-                    session.commit()
+        with session_scope() as session:
+            session.execute('delete from future_instrument_config')
+            main_instrument_config = pd.DataFrame(pd.read_pickle(CONFIG_PATH + 'all-main.pkl'))
+            main_instrument_config = main_instrument_config[STOCK_INDEX_PRODUCTS]
+            for product in STOCK_INDEX_PRODUCTS:
+                instrument_list = list_files_in_path(FUTURE_TICK_ORGANIZED_DATA_PATH + product)
+                instrument_list.sort()
+                for instrument in instrument_list:
+                    if not re.search('[0-9]{4}', instrument):
+                        continue
+                    data = read_decompress(FUTURE_TICK_ORGANIZED_DATA_PATH + product + os.path.sep + instrument)
+                    data['date'] = data['datetime'].str[0:10]
+                    date_list = list(set(data['date'].tolist()))
+                    date_list.sort()
+                    for date in date_list:
+                        main_instrument = main_instrument_config[main_instrument_config.index == date][product].tolist()[0]
+                        current_instrument = instrument.split('.')[0]
+                        if main_instrument == current_instrument:
+                            config = FutureInstrumentConfig(product, current_instrument , date, 0)
+                        else:
+                            config = FutureInstrumentConfig(product, current_instrument, date, 1)
+                        session.add(config)
+                        session.commit()
+        reset_trading_calendar()
 
 
 if __name__ == '__main__':
@@ -271,7 +482,10 @@ if __name__ == '__main__':
     # FactorCaculator().caculate(factor_list, ['IF1810','IF1811','IF1812','IF1901','IF1902','IF1903','IF1904','IF1905','IF1906','IF1907'])
     # FactorCaculator().caculate('8f771a6c-4233-4239-a12c-defb23963e01', factor_list, include_instrument_list = ['IF1712'], performance_test=True)
 
-    # 直接调用caculate_by_instrument便于cprofile分析
+    # 增量更新因子文件，只计算新增的交易日
+    # FactorCaculator().caculate_incrementally(factor_list, ['IF'])
+
+    # 各阶段耗时见REPORT_PATH/metrics下的json和prom文件，需要函数级别的分析时直接调用caculate_by_instrument便于cprofile分析
     # FactorCaculator().caculate_by_instrument((factor_list, 'IF1712', 'IF'))
 
     #生成因子比对文件
@@ -0,0 +1,173 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+from common.exception.exception import InvalidStatus
+from common.log import get_logger
+
+
+def get_target_factor(factor):
+    """
+    差分，均值，标准差等衍生因子依赖的目标因子，其他因子返回None
+
+    Parameters
+    ----------
+    factor
+
+    Returns
+    -------
+
+    """
+    if hasattr(factor, 'get_target_factor'):
+        return factor.get_target_factor()
+    return None
+
+
+def get_member_list(factor):
+    """
+    因子组返回组内的因子，其他因子返回自身
+
+    Parameters
+    ----------
+    factor
+
+    Returns
+    -------
+
+    """
+    if hasattr(factor, 'get_factor_list'):
+        return factor.get_factor_list()
+    return [factor]
+
+
+def sort_by_dependency(factor_list):
+    """
+    按依赖关系排序，计算链中的目标因子排在依赖它的衍生因子之前，
+    没有依赖关系的因子保持原来的顺序
+
+    Parameters
+    ----------
+    factor_list: list 因子或者因子组
+
+    Returns
+    -------
+    list
+
+    """
+    position_dict = {}
+    for i, factor in enumerate(factor_list):
+        for member in get_member_list(factor):
+            position_dict[member.get_full_name()] = i
+    dependency_dict = {}
+    for i, factor in enumerate(factor_list):
+        dependency_dict[i] = set()
+        for member in get_member_list(factor):
+            target_factor = get_target_factor(member)
+            if target_factor is not None and target_factor.get_full_name() in position_dict and position_dict[target_factor.get_full_name()] != i:
+                dependency_dict[i].add(position_dict[target_factor.get_full_name()])
+    result = []
+    handled_set = set()
+    while len(result) < len(factor_list):
+        ready_list = list(filter(lambda i: i not in handled_set and dependency_dict[i] <= handled_set, range(len(factor_list))))
+        if len(ready_list) == 0:
+            raise InvalidStatus('Circular factor dependency: {0}'.format(list(map(lambda factor: factor.get_full_name(), factor_list))))
+        handled_set.add(ready_list[0])
+        result.append(factor_list[ready_list[0]])
+    return result
+
+
+def index_by_date(data):
+    """
+    按日期分组，一次分组之后按天取数据不需要每次做布尔过滤
+
+    Parameters
+    ----------
+    data
+
+    Returns
+    -------
+    dict: 日期 -> dataframe
+
+    """
+    return {date: date_data for date, date_data in data.groupby('date', sort=False)}
+
+
+class TargetFactorCache():
+    """
+    计算链中没有的目标因子，每个品种只从因子文件加载一次，按日期建好索引，
+    同一个品种的所有合约和所有衍生因子共用
+    """
+
+    def __init__(self):
+        self._data_dict = {}
+
+    def get_data_by_date(self, factor, product):
+        key = (factor.get_full_name(), product)
+        if key not in self._data_dict:
+            get_logger().info('Load target factor: {0} for product: {1}'.format(factor.get_full_name(), product))
+            self._data_dict[key] = index_by_date(factor.load(product))
+        return self._data_dict[key]
+
+    def contains(self, factor, product):
+        return (factor.get_full_name(), product) in self._data_dict
+
+    def clear(self):
+        self._data_dict = {}
+
+
+target_factor_cache = TargetFactorCache()
+
+
+def get_target_factor_cache():
+    return target_factor_cache
+
+
+def get_target_data_by_date(factor, data):
+    """
+    衍生因子按天获取目标因子数据：
+    目标因子已经在同一个计算链中先计算时，直接使用内存中的结果，
+    否则使用按品种加载一次的因子文件
+
+    Parameters
+    ----------
+    factor: 衍生因子
+    data: 当前合约的数据
+
+    Returns
+    -------
+    dict: 日期 -> dataframe，各个衍生因子会修改返回的数据，使用前需要拷贝
+
+    """
+    target_factor = factor.get_target_factor()
+    if target_factor.get_key() in data.columns:
+        return index_by_date(data)
+    return target_factor_cache.get_data_by_date(target_factor, data.iloc[0]['product'])
+
+
+def prepare_target_factor_data(factor_list, product):
+    """
+    在当前进程中加载计算链中没有的目标因子，切换品种时释放上一个品种的数据。
+    衍生因子在调用caculate的进程中按合约计算，直接使用这里加载的数据；
+    常驻进程池的子进程在加载之前已经创建，不会看到这些数据
+
+    Parameters
+    ----------
+    factor_list: list 因子或者因子组
+    product
+
+    Returns
+    -------
+
+    """
+    target_factor_cache.clear()
+    member_list = [member for factor in factor_list for member in get_member_list(factor)]
+    name_set = set(map(lambda member: member.get_full_name(), member_list))
+    for member in member_list:
+        target_factor = get_target_factor(member)
+        if target_factor is not None and target_factor.get_full_name() not in name_set:
+            target_factor_cache.get_data_by_date(target_factor, product)
+
+
+if __name__ == '__main__':
+    # from factor.spot_goods_factor import TenGradeCommissionRatioFactor, TenGradeCommissionRatioDifferenceFactor, TenGradeCommissionRatioMeanFactor
+    # factor_list = [TenGradeCommissionRatioMeanFactor([20]), TenGradeCommissionRatioFactor(), TenGradeCommissionRatioDifferenceFactor([20])]
+    # print(list(map(lambda factor: factor.get_full_name(), sort_by_dependency(factor_list))))
+    pass
@@ -9,9 +9,11 @@ from functools import lru_cache
 import time
 
 from common.persistence.dbutils import create_session
-from common.persistence.dao import FutureConfigDao, IndexConstituentConfigDao
+from common.persistence.dao import IndexConstituentConfigDao
+from common.persistence.trading_calendar import get_trading_calendar
 from common.constants import STOCK_INDEX_PRODUCTS, FACTOR_PATH, FACTOR_STANDARD_FIELD_TYPE, RET_PERIOD, FUTURE_TICK_ORGANIZED_DATA_PATH
 from common.localio import save_compress, read_decompress
+from factor.factor_storage import FactorPartitionStore
 from factor.spot_goods_factor import TotalCommissionRatioFactor, RisingStockRatioFactor, TenGradeCommissionRatioFactor, \
     SpreadFactor, RisingFallingAmountRatioFactor, UntradedStockRatioFactor, FiveGradeCommissionRatioFactor, TotalCommissionRatioDifferenceFactor, \
     TenGradeCommissionRatioDifferenceFactor, FiveGradeCommissionRatioDifferenceFactor, DailyRisingStockRatioFactor, FiveGradeCommissionRatioMeanFactor, FiveGradeCommissionRatioStdFactor,\
@@ -71,9 +73,16 @@ def fix_factor(factor_list, products=[], dates_to_be_fixed=[], is_backup=True):
         products = STOCK_INDEX_PRODUCTS
     for factor in factor_list:
         for product in products:
-            data = factor.load(product)
+            store = FactorPartitionStore(product, factor.get_full_name(), FACTOR_PATH)
+            if store.exists():
+                # 分区存储只读取需要修复的日期
+                data = factor.load(product, date_list=dates_to_be_fixed)
+            else:
+                data = factor.load(product)
             if is_backup:
-                save_compress(data, FACTOR_PATH + os.path.sep + product + '_' + factor.get_full_name() + '.bak' + get_current_time())
+                # 备份完整的因子数据，分区存储时上面只读取了需要修复的日期
+                backup_data = store.read() if store.exists() else data
+                save_compress(backup_data, FACTOR_PATH + os.path.sep + product + '_' + factor.get_full_name() + '.bak' + get_current_time())
             pagination = Pagination(dates_to_be_fixed, page_size=10)
             while pagination.has_next():
                 date_list = pagination.next()
@@ -90,8 +99,11 @@ def fix_factor(factor_list, products=[], dates_to_be_fixed=[], is_backup=True):
                     else:
                         date_data_dict = dict(zip(result[1]['time'], result[1][factor.get_key()]))
                         data.loc[data['date'] == result[0], factor.get_key()] = data['datetime'].apply(lambda item: get_value(item, date_data_dict))
-            save_path = FACTOR_PATH + os.path.sep + product + '_' + factor.get_full_name()
-            save_compress(data, save_path)
+            if store.exists():
+                store.write(data)
+            else:
+                save_path = FACTOR_PATH + os.path.sep + product + '_' + factor.get_full_name()
+                save_compress(data, save_path)
 
 
 def fix_factor_by_date(*args):
@@ -116,8 +128,7 @@ def fix_factor_by_date(*args):
     return date, date_data
 
 def create_params_for_fix_factor_by_date(date, factor, product):
-    future_config_dao = FutureConfigDao()
-    instrument = future_config_dao.get_main_instrument_by_product_and_date(product, date)
+    instrument = get_trading_calendar().get_main_instrument(product, date)
     if instrument == '':
         return ''
     else:
@@ -147,7 +158,7 @@ def fix_ret(factor_list, products=[], is_backup=True):
     time.sleep(100000)
 
 def fix_ret_by_product(factor, is_backup, product):
-    future_config_dao = FutureConfigDao()
+    trading_calendar = get_trading_calendar()
     data = factor.load(product)
     date_list = list(set(data['date'].tolist()))
     date_list.sort()
@@ -157,7 +168,7 @@ def fix_ret_by_product(factor, is_backup, product):
                       FACTOR_PATH + os.path.sep + product + '_' + factor.get_full_name() + '.bak' + get_current_time())
     for date in date_list:
         get_logger().info('Fix product: {0}, date: {1} for factor: {2}'.format(product, date, factor.get_full_name()))
-        instrument = future_config_dao.get_main_instrument_by_product_and_date(product, date)
+        instrument = trading_calendar.get_main_instrument(product, date)
         if instrument == '':
             get_logger().warning('Main instrument not found for product: {0} and date: {1}'.format(product, date))
             continue
@@ -262,8 +273,7 @@ class DateFilterHandler(FactorHandler):
         else:
             if data.dtypes[factor.get_key()] != FACTOR_STANDARD_FIELD_TYPE:
                 data[factor.get_key()] = data[factor.get_key()].astype(FACTOR_STANDARD_FIELD_TYPE)
-        future_config_dao = FutureConfigDao()
-        date_list = future_config_dao.filter_date('2016-12-30', '2022-08-13')
+        date_list = get_trading_calendar().filter_date('2016-12-30', '2022-08-13')
         date_list = date_list + ['2017-05-10','2017-05-22','2017-12-01','2019-05-08','2021-07-06','2021-07-06','2021-08-11','2022-02-08','2022-08-01','2022-08-02','2022-08-03','2022-08-04','2022-08-05','2022-08-06','2022-08-07','2022-08-08','2022-08-09','2022-08-10','2022-08-11']
         for date in date_list:
             data = data.drop(data.index[data['date'] == date])
@@ -307,8 +317,7 @@ class TotalCommissionRatioFactorHandler(FactorHandler):
     """
     def handle(self, product, data, factor):
         get_logger().info('Total commission ratio handler for factor: {0}'.format(factor.get_full_name()))
-        future_config_dao = FutureConfigDao()
-        date_list = future_config_dao.filter_date('', '2022-02-07')
+        date_list = get_trading_calendar().filter_date('', '2022-02-07')
         ten_grade_commission_ratio_factor = TenGradeCommissionRatioFactor()
         for date in date_list:
             data.loc[data['date'] == date, factor.get_key()] = 0
@@ -0,0 +1,352 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import os
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from common.constants import FACTOR_PATH
+from common.exception.exception import InvalidValue
+from common.log import get_logger
+
+CATALOG_FILE_NAME = 'catalog.json'
+PARTITION_FILE_SUFFIX = '.npz'
+# 字符串列的空值掩码在分区文件中的名称前缀
+NULL_MASK_PREFIX = '__null__'
+
+
+def get_checksum(path):
+    """
+    文件的md5
+
+    Parameters
+    ----------
+    path
+
+    Returns
+    -------
+
+    """
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FactorPartitionStore():
+    """
+    因子分区存储：
+    按 品种/合约/日期 分区，每个分区一个按列压缩的npz文件，
+    每个品种一个目录清单catalog.json，记录表结构和每个分区的行数、最小最大时间和校验和，
+    读取时先按清单过滤，只加载需要的分区和列
+
+    Parameters
+    ----------
+    product: string 品种
+    name: string 因子文件名，和单文件存储的文件名一致，一般为因子的full name
+    root_path
+    """
+
+    def __init__(self, product, name, root_path=FACTOR_PATH):
+        self._product = product
+        self._name = name
+        self._path = root_path + 'partitioned' + os.path.sep + name + os.path.sep + product + os.path.sep
+        self._catalog = None
+
+    def get_path(self):
+        return self._path
+
+    def get_partition_path(self, instrument, date):
+        return self._path + instrument + os.path.sep + date + PARTITION_FILE_SUFFIX
+
+    def exists(self):
+        return os.path.exists(self._path + CATALOG_FILE_NAME)
+
+    def get_catalog(self):
+        """
+        读取清单：
+        schema: 列名 -> 类型
+        partitions: 合约 -> 日期 -> {rows, min_datetime, max_datetime, checksum}
+
+        Returns
+        -------
+
+        """
+        if self._catalog is None:
+            if self.exists():
+                with open(self._path + CATALOG_FILE_NAME, 'r') as f:
+                    self._catalog = json.load(f)
+            else:
+                self._catalog = {'schema': {}, 'partitions': {}}
+        return self._catalog
+
+    def save_catalog(self):
+        # 先写临时文件再替换，避免中断时清单损坏
+        temp_file = self._path + CATALOG_FILE_NAME + '.temp'
+        with open(temp_file, 'w') as f:
+            json.dump(self.get_catalog(), f)
+        os.replace(temp_file, self._path + CATALOG_FILE_NAME)
+
+    def get_instrument_list(self):
+        return sorted(self.get_catalog()['partitions'].keys())
+
+    def get_date_list(self, instrument_list=[]):
+        date_set = set()
+        for instrument, partitions in self.get_catalog()['partitions'].items():
+            if len(instrument_list) == 0 or instrument in instrument_list:
+                date_set.update(partitions.keys())
+        return sorted(date_set)
+
+    def get_last_date_dict(self):
+        """
+        每个合约已有数据的最后日期
+
+        Returns
+        -------
+        dict: 合约 -> 日期
+
+        """
+        return {instrument: max(partitions.keys()) for instrument, partitions in self.get_catalog()['partitions'].items() if len(partitions) > 0}
+
+    def list_partitions(self, instrument_list=[], date_list=[], start_date='', end_date=''):
+        """
+        根据清单过滤分区
+
+        Parameters
+        ----------
+        instrument_list
+        date_list
+        start_date
+        end_date
+
+        Returns
+        -------
+        list: [(合约, 日期)]，按合约和日期排序
+
+        """
+        partition_list = []
+        for instrument in self.get_instrument_list():
+            if len(instrument_list) > 0 and instrument not in instrument_list:
+                continue
+            for date in sorted(self.get_catalog()['partitions'][instrument].keys()):
+                if len(date_list) > 0 and date not in date_list:
+                    continue
+                if (start_date != '' and date < start_date) or (end_date != '' and date > end_date):
+                    continue
+                partition_list.append((instrument, date))
+        return partition_list
+
+    def read(self, instrument_list=[], date_list=[], start_date='', end_date='', columns=[]):
+        """
+        读取因子数据，过滤条件为空时读取全部
+
+        Parameters
+        ----------
+        instrument_list
+        date_list
+        start_date
+        end_date
+        columns: 需要的列，为空时读取全部列
+
+        Returns
+        -------
+        data: dataframe
+
+        """
+        schema = self.get_catalog()['schema']
+        if len(columns) == 0:
+            columns = list(schema.keys())
+        for column in columns:
+            if column not in schema:
+                raise InvalidValue('Column {0} is missing in factor partitions: {1}'.format(column, self._path))
+        data_list = []
+        for instrument, date in self.list_partitions(instrument_list, date_list, start_date, end_date):
+            with np.load(self.get_partition_path(instrument, date)) as partition:
+                partition_data = {}
+                for column in columns:
+                    if column not in partition.files:
+                        # 写入这个分区之后才增加的列
+                        rows = self.get_catalog()['partitions'][instrument][date]['rows']
+                        partition_data[column] = np.full(rows, np.nan, dtype=object if schema[column] == 'str' else 'float64')
+                        continue
+                    values = partition[column]
+                    if NULL_MASK_PREFIX + column in partition.files:
+                        values = values.astype(object)
+                        values[partition[NULL_MASK_PREFIX + column]] = np.nan
+                    partition_data[column] = values
+                data_list.append(pd.DataFrame(partition_data, columns=columns))
+        if len(data_list) == 0:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(data_list, ignore_index=True)
+
+    def write(self, data):
+        """
+        按合约和日期拆分写入，已有的分区会被覆盖，
+        表结构中已有的列必须都在data中，新的列加入表结构，之前写入的分区读取时这些列为空值
+
+        Parameters
+        ----------
+        data: dataframe 必须包含instrument，date和datetime列
+
+        Returns
+        -------
+
+        """
+        if len(data) == 0:
+            return
+        catalog = self.get_catalog()
+        if len(catalog['schema']) > 0:
+            missing_columns = list(filter(lambda column: column not in data.columns, catalog['schema'].keys()))
+            if len(missing_columns) > 0:
+                raise InvalidValue('Columns {0} are missing for factor partitions: {1}'.format(missing_columns, self._path))
+            data = data[list(catalog['schema'].keys()) + list(filter(lambda column: column not in catalog['schema'], data.columns))]
+        schema = {}
+        for (instrument, date), partition_data in data.groupby(['instrument', 'date'], sort=True):
+            partition_path = self.get_partition_path(instrument, date)
+            if not os.path.exists(os.path.dirname(partition_path)):
+                os.makedirs(os.path.dirname(partition_path))
+            arrays = {}
+            for column in partition_data.columns:
+                values = partition_data[column]
+                if pd.api.types.is_numeric_dtype(values) and catalog['schema'].get(column) != 'str':
+                    values = values.to_numpy()
+                    schema[column] = str(values.dtype)
+                else:
+                    # 字符串列转为定长unicode，读取时不需要pickle，空值单独保存掩码，读取时还原
+                    null_mask = values.isnull().to_numpy()
+                    values = np.array(values.astype(str).tolist(), dtype=str)
+                    if null_mask.any():
+                        values[null_mask] = ''
+                        arrays[NULL_MASK_PREFIX + column] = null_mask
+                    schema[column] = 'str'
+                arrays[column] = values
+            np.savez_compressed(partition_path, **arrays)
+            if instrument not in catalog['partitions']:
+                catalog['partitions'][instrument] = {}
+            catalog['partitions'][instrument][date] = {
+                'rows': len(partition_data),
+                'min_datetime': str(partition_data['datetime'].min()),
+                'max_datetime': str(partition_data['datetime'].max()),
+                'checksum': get_checksum(partition_path)
+            }
+        for column in data.columns:
+            if column not in catalog['schema']:
+                catalog['schema'][column] = schema[column]
+        self.save_catalog()
+
+    def delete(self, instrument, date):
+        partitions = self.get_catalog()['partitions']
+        if instrument in partitions and date in partitions[instrument]:
+            os.remove(self.get_partition_path(instrument, date))
+            del partitions[instrument][date]
+            self.save_catalog()
+
+    def verify(self):
+        """
+        用清单中的校验和检查分区文件
+
+        Returns
+        -------
+        list: 校验失败的分区[(合约, 日期)]
+
+        """
+        invalid_list = []
+        for instrument, date in self.list_partitions():
+            partition_path = self.get_partition_path(instrument, date)
+            if not os.path.exists(partition_path) or get_checksum(partition_path) != self.get_catalog()['partitions'][instrument][date]['checksum']:
+                get_logger().error('Invalid factor partition: {0}'.format(partition_path))
+                invalid_list.append((instrument, date))
+        return invalid_list
+
+
+class ResultSink():
+    """
+    因子计算结果收集：
+    按天或者按合约计算的结果先放到列表中，最后只合并一次，
+    避免每次pd.concat([new_data, temp_data])都复制已经累计的所有行
+
+    Parameters
+    ----------
+    columns: list 结果的列，一般为get_factor_columns，没有结果时返回这些列的空表，
+             有结果时这些列排在前面，结果中没有的列补空
+    """
+
+    def __init__(self, columns=[]):
+        self._columns = list(columns)
+        self._data_list = []
+        self._rows = 0
+
+    def append(self, data):
+        if data is None:
+            return
+        self._data_list.append(data)
+        self._rows = self._rows + len(data)
+
+    def get_rows(self):
+        return self._rows
+
+    def get_result(self):
+        """
+        合并所有结果，合并后的结果替换原来的列表，重复调用不会重复合并
+
+        Returns
+        -------
+        data: dataframe
+
+        """
+        if len(self._data_list) == 0:
+            return pd.DataFrame(columns=self._columns)
+        if len(self._data_list) > 1:
+            self._data_list = [pd.concat(self._data_list)]
+        data = self._data_list[0]
+        columns = self._columns + list(filter(lambda column: column not in self._columns, data.columns.tolist()))
+        if columns != data.columns.tolist():
+            data = data.reindex(columns=columns)
+            self._data_list = [data]
+        return data
+
+
+class PartitionResultSink(ResultSink):
+    """
+    结果直接按 合约/日期 分区写入，内存中不保留已经写入的数据。
+    不同合约的结果列可能不同，如没有股票数据的合约没有time列，
+    写入前按已有的表结构补齐，缺少的列补空，新的列加入表结构
+
+    Parameters
+    ----------
+    store: FactorPartitionStore
+    columns: list
+    """
+
+    def __init__(self, store, columns=[]):
+        ResultSink.__init__(self, columns)
+        self._store = store
+
+    def append(self, data):
+        if data is None or len(data) == 0:
+            return
+        schema = self._store.get_catalog()['schema']
+        columns = list(schema.keys()) if len(schema) > 0 else list(self._columns)
+        columns = columns + list(filter(lambda column: column not in columns, data.columns.tolist()))
+        if columns != data.columns.tolist():
+            data = data.reindex(columns=columns)
+        self._store.write(data)
+        self._rows = self._rows + len(data)
+
+    def get_result(self):
+        return self._store.read()
+
+
+if __name__ == '__main__':
+    # 单文件的因子数据转为分区存储
+    # from common.localio import read_decompress
+    # from factor.spot_goods_factor import TotalCommissionRatioFactor
+    # factor = TotalCommissionRatioFactor()
+    # FactorPartitionStore('IF', factor.get_full_name()).write(read_decompress(FACTOR_PATH + 'IF_' + factor.get_full_name()))
+
+    # 按日期读取
+    # print(FactorPartitionStore('IF', factor.get_full_name()).read(date_list=['2022-01-04']))
+    pass
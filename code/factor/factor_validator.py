@@ -26,6 +26,7 @@ from factor.spot_goods_factor import TotalCommissionRatioFactor, TenGradeCommiss
     AmountBid10GradeCommissionRatioFactor, AmountAsk10GradeCommissionRatioFactor, AmountBid5GradeCommissionRatioFactor, AmountAsk5GradeCommissionRatioFactor
 from common.exception.exception import ValidationFailed
 from data.access import StockDataAccess
+from data.constituent import get_constituent_index
 from common.timeutils import add_milliseconds_suffix
 from common.localio import FileWriter
 from common.log import get_logger
@@ -528,20 +529,9 @@ def parse_spot_goods_stock_data(product, date, start_time, end_time=''):
 
     """
     data = pd.DataFrame()
-    if product == 'IH':
-        stock_abstract = pd.read_pickle(CONFIG_PATH + os.path.sep + '50_stocks_abstract.pkl')
-    elif product == 'IF':
-        stock_abstract = pd.read_pickle(CONFIG_PATH + os.path.sep + '300_stocks_abstract.pkl')
-    else:
-        stock_abstract = pd.read_pickle(CONFIG_PATH + os.path.sep + '500_stocks_abstract.pkl')
-    date = date.replace('-', '')
-    stock_list = []
-    for key in stock_abstract.keys():
-        start_date = key.split('_')[0]
-        end_date = key.split('_')[1]
-        if date >= start_date and date <= end_date:
-            stock_list = stock_abstract[key]
-    stock_list.sort()
+    # 成分股列表是共享的，排序时不能修改原列表
+    stock_list = get_constituent_index().get_stock_list(product if product in ['IH', 'IF'] else 'IC', date)
+    stock_list = sorted(stock_list) if stock_list else []
     get_logger().info('The stocks list: {0}'.format('|'.join(stock_list)))
     data_access = StockDataAccess(False)
     for stock in stock_list:
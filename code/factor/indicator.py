@@ -1,11 +1,149 @@
 #! /usr/bin/env python
 # -*- coding:utf8 -*-
+import hashlib
+import math
 from abc import ABCMeta, abstractmethod
-from sklearn.linear_model import LinearRegression as lr
-from sklearn.preprocessing import PolynomialFeatures
+from functools import partial
 import numpy as np
+import pandas as pd
 
+from common.exception.exception import InvalidStatus
 from common.localio import read_decompress
+from common.log import get_logger
+from factor.kernel import rolling_linear_regression, rolling_polynomial_regression, rolling_moments, true_range, trend_sign
+from factor.rolling_state import RollingMeanState, RollingVarianceState, EwmState, divide
+
+# 可以缓存的源数据列，只有行情的原始列，因子计算过程中不会被替换或者原地修改，
+# log，change，tr等衍生列每个因子都会重新赋值，依赖这些列的指标不缓存
+CACHEABLE_SOURCE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'interest']
+
+
+class IndicatorCache():
+    """
+    指标计算缓存，在一个合约的因子计算过程中共享，
+    key为(指标类, 指标名称（包含目标列和窗口）, 源数据指纹)，
+    不同因子重复使用相同的指标时只计算一次。
+    只缓存依赖的列都在CACHEABLE_SOURCE_COLUMNS中的指标，其他指标每次直接计算，不保留源数据和结果
+
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._hit_count = 0
+        self._miss_count = 0
+        # 列名 -> 版本号，原地修改源数据列时增加
+        self._version_dict = {}
+        # 指纹中用到的列，保持引用避免底层数组释放后地址被新的列复用
+        self._source_dict = {}
+
+    def get_fingerprint(self, data, columns):
+        """
+        源数据指纹，由列的身份（底层数组的地址，类型，长度）和列的版本号组成，不读取列的内容，
+        只用于行情的原始列：data[column] = ... 替换列后底层数组变化，指纹随之变化，
+        原地修改原始列（如data.loc[:, column] = ...）时要调用bump_version。
+        不是numpy数组的列（如可空类型）对内容做摘要
+
+        Parameters
+        ----------
+        data: dataframe
+        columns: list 指标依赖的列
+
+        Returns
+        -------
+        tuple
+
+        """
+        fingerprint = [len(data)]
+        for column in columns:
+            series = data[column]
+            if isinstance(series.dtype, np.dtype) and series.dtype != object:
+                values = series.to_numpy()
+                identity = (column, values.__array_interface__['data'][0], values.dtype.str, values.strides)
+                self._source_dict.setdefault(identity, values)
+            else:
+                identity = (column, hashlib.md5(np.ascontiguousarray(pd.util.hash_array(series.to_numpy(dtype=object)))).hexdigest())
+            fingerprint.append(identity + (self._version_dict.get(column, 0),))
+        return tuple(fingerprint)
+
+    def bump_version(self, columns):
+        """
+        源数据列被原地修改后调用，之后使用这些列的指标重新计算
+
+        Parameters
+        ----------
+        columns: list
+
+        Returns
+        -------
+
+        """
+        for column in columns:
+            self._version_dict[column] = self._version_dict.get(column, 0) + 1
+
+    def is_cacheable(self, columns):
+        return all(map(lambda column: column in CACHEABLE_SOURCE_COLUMNS, columns))
+
+    def get_or_caculate(self, key, data, columns, func):
+        """
+        查找缓存，没有命中时调用func计算并缓存，依赖衍生列的指标直接计算
+
+        Parameters
+        ----------
+        key: tuple
+        data: dataframe
+        columns: list 指标依赖的列
+        func: 无参函数，返回 名称 -> 值 的dict
+
+        Returns
+        -------
+        dict
+
+        """
+        if not self.is_cacheable(columns):
+            return func()
+        cache_key = key + (self.get_fingerprint(data, columns),)
+        if cache_key in self._cache:
+            self._hit_count = self._hit_count + 1
+            # 返回拷贝，避免因子原地修改指标列时污染缓存
+            return {name: value.copy() if isinstance(value, np.ndarray) else value for name, value in self._cache[cache_key].items()}
+        self._miss_count = self._miss_count + 1
+        result = func()
+        self._cache[cache_key] = {name: np.array(value) if isinstance(value, (np.ndarray, pd.Series)) else value for name, value in result.items()}
+        return result
+
+    def get_hit_count(self):
+        return self._hit_count
+
+    def get_miss_count(self):
+        return self._miss_count
+
+    def clear(self):
+        get_logger().debug('Clear indicator cache, hit: {0}, miss: {1}'.format(self._hit_count, self._miss_count))
+        self._cache = {}
+        self._source_dict = {}
+
+
+_indicator_cache = None
+
+
+def set_indicator_cache(cache):
+    """
+    设置当前进程使用的指标缓存，为None时关闭缓存
+
+    Parameters
+    ----------
+    cache: IndicatorCache
+
+    Returns
+    -------
+
+    """
+    global _indicator_cache
+    _indicator_cache = cache
+
+
+def get_indicator_cache():
+    return _indicator_cache
 
 
 class Indicator(metaclass=ABCMeta):
@@ -28,6 +166,47 @@ class Indicator(metaclass=ABCMeta):
     def get_keys(self):
         return list(map(lambda param: self.key + '.' + str(param), self._params))
 
+    def caculate_with_cache(self, data, name, columns, func):
+        """
+        通过指标缓存计算，没有设置缓存时直接计算
+
+        Parameters
+        ----------
+        data: dataframe
+        name: string 在指标类内唯一标识一次计算，一般包含目标列和窗口
+        columns: list 计算依赖的列
+        func: 无参函数，返回 名称 -> 值 的dict
+
+        Returns
+        -------
+        dict
+
+        """
+        cache = get_indicator_cache()
+        if cache is None:
+            return func()
+        return cache.get_or_caculate((self.__class__.__name__, name), data, columns, func)
+
+    def enrich_with_cache(self, data, name, columns, func):
+        """
+        通过指标缓存计算，并把返回的列填充到data
+
+        Parameters
+        ----------
+        data: dataframe
+        name: string
+        columns: list
+        func: 无参函数，返回 列名 -> 值 的dict
+
+        Returns
+        -------
+        data: dataframe
+
+        """
+        for column, values in self.caculate_with_cache(data, name, columns, func).items():
+            data[column] = values
+        return data
+
     @abstractmethod
     def enrich(self, data):
         """
@@ -43,6 +222,47 @@ class Indicator(metaclass=ABCMeta):
         """
         pass
 
+    def reset_state(self):
+        """
+        清空实时计算的状态，支持实时计算的指标实现reset_state和update
+
+        Returns
+        -------
+
+        """
+        raise InvalidStatus('Incremental caculation is not supported by indicator: {0}'.format(self.__class__.__name__))
+
+    def init_state(self, history):
+        """
+        实时计算前用历史数据初始化状态，逐个bar调用update，之后每来一个新的bar调用update
+
+        Parameters
+        ----------
+        history: dataframe
+
+        Returns
+        -------
+
+        """
+        self.reset_state()
+        for bar in history.to_dict('records'):
+            self.update(bar)
+
+    def update(self, bar):
+        """
+        实时计算，加入一个新的bar，返回的值和enrich在这一行的结果一致
+
+        Parameters
+        ----------
+        bar: dict or Series
+
+        Returns
+        -------
+        dict: 指标列名 -> 值
+
+        """
+        raise InvalidStatus('Incremental caculation is not supported by indicator: {0}'.format(self.__class__.__name__))
+
 
 class MovingAverage(Indicator):
     """
@@ -59,9 +279,16 @@ class MovingAverage(Indicator):
 
     def enrich(self, data):
         for param in self._params:
-            data[self.get_key(param)] = data[self._target].rolling(param).mean()
+            key = self.get_key(param)
+            self.enrich_with_cache(data, key, [self._target], lambda: {key: data[self._target].rolling(param).mean()})
         return data
 
+    def reset_state(self):
+        self._states = {param: RollingMeanState(param) for param in self._params}
+
+    def update(self, bar):
+        return {self.get_key(param): state.update(bar[self._target]) for param, state in self._states.items()}
+
 
 class WeightedMovingAverage(Indicator):
     """
@@ -78,18 +305,14 @@ class WeightedMovingAverage(Indicator):
         return self.key + '.' + self._target + '.' + self._weight + '.' + str(param)
 
     def enrich(self, data):
-        simplifier_data = data[[self._weight, self._target]]
+        # 加权和的滑动求和除以权重的滑动求和
+        weighted_target = data[self._target] * data[self._weight]
         for param in self._params:
-            data[self.get_key(param)] = data['close'].rolling(param).apply(lambda item: self.caculate(item, simplifier_data))
+            key = self.get_key(param)
+            self.enrich_with_cache(data, key, [self._target, self._weight],
+                                   lambda: {key: weighted_target.rolling(param).sum() / data[self._weight].rolling(param).sum()})
         return data
 
-    def caculate(self, window, data):
-        #TODO: 这里需要优化
-        target = data.loc[window.index, [self._target]]
-        weight = data.loc[window.index, [self._weight]]
-        result = (target.values * weight.values).sum()/weight.values.sum()
-        return result
-
 
 # 指数移动平均线
 class ExpMovingAverage(Indicator):
@@ -107,14 +330,25 @@ class ExpMovingAverage(Indicator):
 
     def enrich(self, data):
         for param in self._params:
-            data[self.get_key(param)] = data[self._target].ewm(span=param, adjust=False).mean()
+            key = self.get_key(param)
+            self.enrich_with_cache(data, key, [self._target], lambda: {key: data[self._target].ewm(span=param, adjust=False).mean()})
         return data
 
-class StandardDeviation(Indicator):
+    def reset_state(self):
+        self._states = {param: EwmState(param) for param in self._params}
+
+    def update(self, bar):
+        return {self.get_key(param): state.update(bar[self._target]) for param, state in self._states.items()}
+
+class RollingMoment(Indicator):
     """
-    标准差
+    滑动矩指标基类：
+    方差和标准差使用pandas rolling，单个统计量时比numpy的分块累加快，标准差由方差开方得到，两者共用一次计算；
+    偏度和峰度使用rolling_moments，所有窗口一次计算，结果比pandas在价格序列上更准确。
+    缓存的key不区分指标类，同一个目标列和窗口在不同指标间只计算一次
     """
-    key = 'standard_deviation'
+    key = ''
+    moment = ''
 
     def __init__(self, params, target='close'):
         self._params = params
@@ -123,64 +357,80 @@ class StandardDeviation(Indicator):
     def get_key(self, param):
         return self.key + '.' + self._target + '.' + str(param)
 
+    def get_with_cache(self, name, data, param, func):
+        cache = get_indicator_cache()
+        if cache is None:
+            return func()
+        return cache.get_or_caculate((name, self._target + '.' + str(param)), data, [self._target], func)
+
+    def get_variance(self, data, param):
+        return self.get_with_cache('RollingVariance', data, param, lambda: {'variance': data[self._target].rolling(param).var()})['variance']
+
+    def get_higher_moments(self, data):
+        """
+        所有窗口的偏度和峰度，没有命中缓存时一次rolling_moments计算所有窗口
+
+        Returns
+        -------
+        dict: 窗口 -> {skewness, kurtosis}
+
+        """
+        moments_dict = {}
+
+        def caculate(param):
+            if len(moments_dict) == 0:
+                moments_dict.update(rolling_moments(data[self._target], self._params))
+            return {name: moments_dict[int(param)][name] for name in ['skewness', 'kurtosis']}
+
+        return {param: self.get_with_cache('RollingMoment', data, param, partial(caculate, param)) for param in self._params}
+
     def enrich(self, data):
-        for param in self._params:
-            data[self.get_key(param)] = data[self._target].rolling(param).std()
+        if self.moment in ['variance', 'std']:
+            for param in self._params:
+                variance = self.get_variance(data, param)
+                data[self.get_key(param)] = variance if self.moment == 'variance' else np.sqrt(variance)
+        else:
+            for param, moments in self.get_higher_moments(data).items():
+                data[self.get_key(param)] = moments[self.moment]
         return data
 
-class Variance(Indicator):
+    def reset_state(self):
+        # 实时计算只支持方差和标准差
+        if self.moment not in ['variance', 'std']:
+            Indicator.reset_state(self)
+        self._states = {param: RollingVarianceState(param) for param in self._params}
+
+    def update(self, bar):
+        index = 0 if self.moment == 'variance' else 1
+        return {self.get_key(param): state.update(bar[self._target])[index] for param, state in self._states.items()}
+
+class StandardDeviation(RollingMoment):
+    """
+    标准差
+    """
+    key = 'standard_deviation'
+    moment = 'std'
+
+class Variance(RollingMoment):
     """
     方差
     """
     key = 'variance'
+    moment = 'variance'
 
-    def __init__(self, params, target='close'):
-        self._params = params
-        self._target = target
-
-    def get_key(self, param):
-        return self.key + '.' + self._target + '.' + str(param)
-
-    def enrich(self, data):
-        for param in self._params:
-            data[self.get_key(param)] = data[self._target].rolling(param).var()
-        return data
-
-class Skewness(Indicator):
+class Skewness(RollingMoment):
     """
     偏度
     """
     key = 'skewness'
+    moment = 'skewness'
 
-    def __init__(self, params, target='close'):
-        self._params = params
-        self._target = target
-
-    def get_key(self, param):
-        return self.key + '.' + self._target + '.' + str(param)
-
-    def enrich(self, data):
-        for param in self._params:
-            data[self.get_key(param)] = data[self._target].rolling(param).skew()
-        return data
-
-class Kurtosis(Indicator):
+class Kurtosis(RollingMoment):
     """
     峰度
     """
     key = 'kurtosis'
-
-    def __init__(self, params, target='close'):
-        self._params = params
-        self._target = target
-
-    def get_key(self, param):
-        return self.key + '.' + self._target + '.' + str(param)
-
-    def enrich(self, data):
-        for param in self._params:
-            data[self.get_key(param)] = data[self._target].rolling(param).kurt()
-        return data
+    moment = 'kurtosis'
 
 class Median(Indicator):
     """
@@ -197,7 +447,8 @@ class Median(Indicator):
 
     def enrich(self, data):
         for param in self._params:
-            data[self.get_key(param)] = data[self._target].rolling(param).median()
+            key = self.get_key(param)
+            self.enrich_with_cache(data, key, [self._target], lambda: {key: data[self._target].rolling(param).median()})
         return data
 
 class Quantile(Indicator):
@@ -217,7 +468,8 @@ class Quantile(Indicator):
     def enrich(self, data):
         for param in self._params:
             for proportion in self._proportions:
-                data[self.get_key(param, proportion)] = data[self._target].rolling(param).quantile(proportion)
+                key = self.get_key(param, proportion)
+                self.enrich_with_cache(data, key, [self._target], lambda: {key: data[self._target].rolling(param).quantile(proportion)})
         return data
 
 class TR(Indicator):
@@ -231,15 +483,30 @@ class TR(Indicator):
         return self.key
 
     def enrich(self, data):
-        # 当日振幅
-        data['current_amp'] = data['high'] - data['low']
-        # 昨日真实涨幅
-        data['last_rise'] = abs(data['high'] - data['close'].shift(1))
-        # 昨日真实跌幅
-        data['last_fall'] = abs(data['low'] - data['close'].shift(1))
-        # 真实波幅
-        data[self.get_key()] = data.apply(lambda x: max(x['current_amp'], x['last_rise'], x['last_fall']), axis=1)
-        return data
+        return self.enrich_with_cache(data, self.get_key(), ['high', 'low', 'close'], lambda: self.caculate(data))
+
+    def caculate(self, data):
+        last_close = data['close'].shift(1)
+        return {
+            # 当日振幅
+            'current_amp': data['high'] - data['low'],
+            # 昨日真实涨幅
+            'last_rise': abs(data['high'] - last_close),
+            # 昨日真实跌幅
+            'last_fall': abs(data['low'] - last_close),
+            # 真实波幅
+            self.get_key(): true_range(data['high'], data['low'], data['close'])
+        }
+
+    def reset_state(self):
+        self._last_close = math.nan
+
+    def update(self, bar):
+        # 和true_range一致，忽略第一个bar的空值
+        value_list = [bar['high'] - bar['low'], abs(bar['high'] - self._last_close), abs(bar['low'] - self._last_close)]
+        value_list = list(filter(lambda value: not math.isnan(value), value_list))
+        self._last_close = bar['close']
+        return {self.get_key(): max(value_list) if len(value_list) > 0 else math.nan}
 
 class ATR(Indicator):
     """
@@ -260,6 +527,14 @@ class ATR(Indicator):
             data[self.get_key(param)] = data[self._ma_indictor.get_key(param)]
         return data
 
+    def reset_state(self):
+        self._tr.reset_state()
+        self._ma_indictor.reset_state()
+
+    def update(self, bar):
+        moving_average = self._ma_indictor.update(self._tr.update(bar))
+        return {self.get_key(param): moving_average[self._ma_indictor.get_key(param)] for param in self._params}
+
 class LinearRegression(Indicator):
     """
     线性回归
@@ -267,15 +542,25 @@ class LinearRegression(Indicator):
 
     key = 'linear_regression'
 
-    model = lr()
-
     def __init__(self, params, target = 'close', variable = ''):
         self._params = params
         self._target = target
         #自变量
         self._variable = variable
+        self._caculation_func = lambda result: result['slope']
 
     def set_caculation_func(self, func):
+        """
+        设置从回归结果中取值的函数
+
+        Parameters
+        ----------
+        func: 参数为rolling_linear_regression返回的dict
+
+        Returns
+        -------
+
+        """
         self._caculation_func = func
 
     def get_key(self, param):
@@ -283,18 +568,16 @@ class LinearRegression(Indicator):
 
     def enrich(self, data):
         for param in self._params:
-            data[self.get_key(param)] = data[self._target].rolling(param).apply(lambda x: self.regression(x, data, self._caculation_func))
+            data[self.get_key(param)] = self._caculation_func(self.regression(data, param))
         return data
 
-    def regression(self, window, data, func):
+    def regression(self, data, param):
         if '' == self._variable:
-            x = np.linspace(1, len(window), len(window)).reshape(-1, 1)
+            return self.caculate_with_cache(data, self._target + '.' + str(param), [self._target],
+                                            lambda: rolling_linear_regression(data[self._target], param))
         else:
-            # TODO: 这里需要优化
-            x = data.loc[window.index, [self._variable]]
-        y = np.array(window.tolist()).reshape(-1, 1)
-        self.model.fit(x, y)
-        return func(self.model, window, x)
+            return self.caculate_with_cache(data, self._target + '.' + self._variable + '.' + str(param), [self._target, self._variable],
+                                            lambda: rolling_linear_regression(data[self._target], param, data[self._variable]))
 
 class PolynomialRegression(Indicator):
     """
@@ -303,14 +586,24 @@ class PolynomialRegression(Indicator):
 
     key = 'polynomial_regression'
 
-    model = lr()
-
     def __init__(self, params, target = 'close', order = 2):
         self._params = params
         self._target = target
-        self.poly = PolynomialFeatures(order)
+        self._order = order
+        self._caculation_func = lambda result: result['fitted']
 
     def set_caculation_func(self, func):
+        """
+        设置从回归结果中取值的函数
+
+        Parameters
+        ----------
+        func: 参数为rolling_polynomial_regression返回的dict
+
+        Returns
+        -------
+
+        """
         self._caculation_func = func
 
     def get_key(self, param):
@@ -318,16 +611,12 @@ class PolynomialRegression(Indicator):
 
     def enrich(self, data):
         for param in self._params:
-            data[self.get_key(param)] = data[self._target].rolling(param).apply(lambda x: self.regression(x, self._caculation_func))
+            data[self.get_key(param)] = self._caculation_func(self.regression(data, param))
         return data
 
-    def regression(self, window, func):
-        x = np.linspace(1, len(window), len(window)).reshape(-1, 1)
-        self.poly.fit(x.reshape(-1, 1))
-        X = self.poly.transform(x.reshape(-1, 1))
-        y = np.array(window.tolist()).reshape(-1, 1)
-        self.model.fit(X, y)
-        return func(self.model, self.poly, window)
+    def regression(self, data, param):
+        return self.caculate_with_cache(data, self._target + '.' + str(param) + '.' + str(self._order), [self._target],
+                                        lambda: rolling_polynomial_regression(data[self._target], param, self._order))
 
 class ADX(Indicator):
     """
@@ -354,6 +643,15 @@ class ADX(Indicator):
 
     def enrich(self, data):
         self._atr.enrich(data)
+        self.enrich_with_cache(data, 'dm', ['high', 'low'], lambda: self.caculate_dm(data))
+        for param in self._params:
+            for ext_param in self._ext_params:
+                # DM和ATR都由最高价、最低价和收盘价计算得到
+                self.enrich_with_cache(data, self.get_key(param, ext_param), ['high', 'low', 'close'],
+                                       lambda: self.caculate_dx(data, param, ext_param))
+        return data
+
+    def caculate_dm(self, data):
         data['up'] = data['high'] - data['high'].shift(1) #今天和昨天最高价之差
         data['down'] = data['low'].shift(1) - data['low'] #今天和昨天最低价之差
         data.loc[((data['up'] < 0) & (data['down'] < 0)) | (data['up'] == data['down']), 'DM+'] = 0
@@ -362,17 +660,53 @@ class ADX(Indicator):
         data.loc[(data['up'] > data['down']), 'DM-'] = 0
         data.loc[(data['up'] < data['down']), 'DM-'] = data['down']
         data.loc[(data['up'] < data['down']), 'DM+'] = 0
+        return {column: data[column] for column in ['up', 'down', 'DM+', 'DM-']}
+
+    def caculate_dx(self, data, param, ext_param):
+        data['DM+.' + str(param)] = data['DM+'].rolling(param).mean()
+        data['DM-.' + str(param)] = data['DM-'].rolling(param).mean()
+        data['DI+.' + str(param)] = data['DM+.' + str(param)] / data[self._atr.get_key(param)]
+        data['DI-.' + str(param)] = data['DM-.' + str(param)] / data[self._atr.get_key(param)]
+        data['DI.SUM.' + str(param)] = data['DI+.' + str(param)] + data['DI-.' + str(param)]
+        data['DI.SUB.' + str(param)] = abs(data['DI+.' + str(param)] - data['DI-.' + str(param)])
+        data['DX.' + str(param)] = (data['DI.SUB.' + str(param)] * 100) / data['DI.SUM.' + str(param)]
+        data[self.get_key(param, ext_param)] = data['DX.' + str(param)].rolling(ext_param).mean()
+        columns = ['DM+.', 'DM-.', 'DI+.', 'DI-.', 'DI.SUM.', 'DI.SUB.', 'DX.']
+        result = {column + str(param): data[column + str(param)] for column in columns}
+        result[self.get_key(param, ext_param)] = data[self.get_key(param, ext_param)]
+        return result
+
+    def reset_state(self):
+        self._atr.reset_state()
+        self._last_high = math.nan
+        self._last_low = math.nan
+        self._dm_states = {param: (RollingMeanState(param), RollingMeanState(param)) for param in self._params}
+        self._dx_states = {(param, ext_param): RollingMeanState(ext_param) for param in self._params for ext_param in self._ext_params}
+
+    def update(self, bar):
+        atr = self._atr.update(bar)
+        up = bar['high'] - self._last_high
+        down = self._last_low - bar['low']
+        self._last_high = bar['high']
+        self._last_low = bar['low']
+        # 和caculate_dm一致，第一个bar为空值
+        if up > down:
+            dm_plus, dm_minus = up, 0.0
+        elif up < down:
+            dm_plus, dm_minus = 0.0, down
+        elif up == down:
+            dm_plus, dm_minus = 0.0, 0.0
+        else:
+            dm_plus, dm_minus = math.nan, math.nan
+        result = {}
         for param in self._params:
+            dm_plus_state, dm_minus_state = self._dm_states[param]
+            di_plus = divide(dm_plus_state.update(dm_plus), atr[self._atr.get_key(param)])
+            di_minus = divide(dm_minus_state.update(dm_minus), atr[self._atr.get_key(param)])
+            dx = divide(abs(di_plus - di_minus) * 100, di_plus + di_minus)
             for ext_param in self._ext_params:
-                data['DM+.' + str(param)] = data['DM+'].rolling(param).mean()
-                data['DM-.' + str(param)] = data['DM-'].rolling(param).mean()
-                data['DI+.' + str(param)] = data['DM+.' + str(param)] / data[self._atr.get_key(param)]
-                data['DI-.' + str(param)] = data['DM-.' + str(param)] / data[self._atr.get_key(param)]
-                data['DI.SUM.' + str(param)] = data['DI+.' + str(param)] + data['DI-.' + str(param)]
-                data['DI.SUB.' + str(param)] = abs(data['DI+.' + str(param)] - data['DI-.' + str(param)])
-                data['DX.' + str(param)] = (data['DI.SUB.' + str(param)] * 100) / data['DI.SUM.' + str(param)]
-                data[self.get_key(param, ext_param)] = data['DX.' + str(param)].rolling(ext_param).mean()
-        return data
+                result[self.get_key(param, ext_param)] = self._dx_states[(param, ext_param)].update(dx)
+        return result
 
 class OBV(Indicator):
     """
@@ -385,20 +719,28 @@ class OBV(Indicator):
         return self.key
 
     def enrich(self, data):
-        data['last_close'] = data['close'].shift(1)
-        data['sign'] = data.apply(lambda x: self.get_trend_indicator(x), axis=1)
-        data['signed_volume'] = data['sign'] * data['volume']
-        signed_vol = np.array(data['signed_volume'])
-        obv = np.cumsum(signed_vol)
-        data[self.get_key()] = obv
-        return data
-
-    def get_trend_indicator(self, x):
-        if (x['close'] > x['last_close']):
-            return 1
-        if (x['close'] < x['last_close']):
-            return -1
-        return 0
+        return self.enrich_with_cache(data, self.get_key(), ['close', 'volume'], lambda: self.caculate(data))
+
+    def caculate(self, data):
+        sign = trend_sign(data['close'])
+        signed_volume = sign * data['volume'].to_numpy()
+        return {
+            'last_close': data['close'].shift(1),
+            'sign': sign,
+            'signed_volume': signed_volume,
+            self.get_key(): np.cumsum(signed_volume)
+        }
+
+    def reset_state(self):
+        self._last_close = math.nan
+        self._obv = 0.0
+
+    def update(self, bar):
+        change = bar['close'] - self._last_close
+        self._last_close = bar['close']
+        sign = 0 if math.isnan(change) else np.sign(change)
+        self._obv = self._obv + sign * bar['volume']
+        return {self.get_key(): self._obv}
 
 class RSI(Indicator):
     """
@@ -414,19 +756,40 @@ class RSI(Indicator):
         return self.key + '.' + str(param)
 
     def enrich(self, data):
-        data['up'] = 0
-        data['down'] = 0
+        data['up'] = 0.0
+        data['down'] = 0.0
         data['change'] = data['close'] - data['close'].shift(1)
         data.loc[data['change'] > 0, 'up'] = data['change']
         data.loc[data['change'] < 0, 'down'] = -data['change']
         for param in self._params:
-            # data['au.' + str(param)] = data['up'].rolling(param).mean()
-            # data['ad.' + str(param)] = data['down'].rolling(param).mean()
-            data['au.' + str(param)] = data['up'].ewm(span=param, adjust=False).mean()
-            data['ad.' + str(param)] = data['down'].ewm(span=param, adjust=False).mean()
-            data[self.get_key(param)] = 100 - (100 / (1 + data['au.' + str(param)] / data['ad.' + str(param)]))
+            self.enrich_with_cache(data, self.get_key(param), ['close'], lambda: self.caculate(data, param))
         return data
 
+    def caculate(self, data, param):
+        # data['au.' + str(param)] = data['up'].rolling(param).mean()
+        # data['ad.' + str(param)] = data['down'].rolling(param).mean()
+        au = data['up'].ewm(span=param, adjust=False).mean()
+        ad = data['down'].ewm(span=param, adjust=False).mean()
+        return {
+            'au.' + str(param): au,
+            'ad.' + str(param): ad,
+            self.get_key(param): 100 - (100 / (1 + au / ad))
+        }
+
+    def reset_state(self):
+        self._last_close = math.nan
+        self._states = {param: (EwmState(param), EwmState(param)) for param in self._params}
+
+    def update(self, bar):
+        change = bar['close'] - self._last_close
+        self._last_close = bar['close']
+        up = change if change > 0 else 0.0
+        down = -change if change < 0 else 0.0
+        result = {}
+        for param, (up_state, down_state) in self._states.items():
+            result[self.get_key(param)] = 100 - divide(100, 1 + divide(up_state.update(up), down_state.update(down)))
+        return result
+
 
 if __name__ == '__main__':
     # data = read_decompress('/Users/finley/Projects/stock-index-future/data/organised/future/IH/IH2209.pkl')
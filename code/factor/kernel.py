@@ -0,0 +1,352 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import numpy as np
+import pandas as pd
+
+"""向量化计算内核，指标和因子直接调用，避免逐行或逐窗口的python回调
+"""
+
+def rolling_polynomial_regression(values, window, order=2):
+    """
+    滑动窗口多项式回归，自变量为窗口内的序号1..window。
+    窗口内的设计矩阵是固定的，对其做QR分解后，每个窗口的回归系数都是y的固定线性组合，
+    因此可以用np.correlate一次算出所有窗口的结果，不需要逐窗口拟合
+
+    Parameters
+    ----------
+    values: Series or ndarray 因变量
+    window: int 窗口大小
+    order: int 多项式阶数
+
+    Returns
+    -------
+    dict:
+        slope: 一阶系数，order为1时即为斜率
+        intercept: 截距，x=0处的值，只在order为1时有意义
+        fitted: 窗口最后一个点的拟合值
+        residual_std: 残差标准差，自由度为window - 1
+        values: 因变量
+        window: 窗口大小
+
+    """
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    result = {
+        'slope': np.full(n, np.nan),
+        'intercept': np.full(n, np.nan),
+        'fitted': np.full(n, np.nan),
+        'residual_std': np.full(n, np.nan),
+        'values': values,
+        'window': window
+    }
+    if n < window or window <= order:
+        return result
+    # x标准化到[-1, 1]，改善高阶多项式的数值稳定性
+    x = np.linspace(1, window, window)
+    center = (window + 1) / 2
+    scale = (window - 1) / 2
+    q, r = np.linalg.qr(np.vander((x - center) / scale, order + 1, increasing=True))
+    # 去掉整体均值，减少平方和相减时的精度损失，不影响回归结果
+    offset = np.nanmean(values) if not np.all(np.isnan(values)) else 0
+    y = values - offset
+    # 在正交基上的投影，第t个元素对应以t开始的窗口
+    projections = np.array([np.correlate(y, q[:, k], 'valid') for k in range(order + 1)])
+    fitted = q[-1, :] @ projections + offset
+    rss = np.maximum(np.correlate(y * y, np.ones(window), 'valid') - (projections ** 2).sum(axis=0), 0)
+    coefficients = np.linalg.solve(r, projections)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['residual_std'][window - 1:] = np.sqrt(rss / (window - 1))
+    result['fitted'][window - 1:] = fitted
+    result['slope'][window - 1:] = coefficients[1] / scale
+    result['intercept'][window - 1:] = coefficients[0] - coefficients[1] * center / scale + offset
+    return result
+
+def rolling_linear_regression(values, window, variable=None):
+    """
+    滑动窗口一元线性回归，
+    没有自变量时以窗口内序号1..window为自变量，否则用滑动的均值、方差和协方差直接求解
+
+    Parameters
+    ----------
+    values: Series or ndarray 因变量
+    window: int 窗口大小
+    variable: Series or ndarray 自变量
+
+    Returns
+    -------
+    dict: 同rolling_polynomial_regression
+
+    """
+    if variable is None:
+        return rolling_polynomial_regression(values, window, 1)
+    values = np.asarray(values, dtype='float64')
+    variable = np.asarray(variable, dtype='float64')
+    # 去掉整体均值，斜率不变，截距最后再还原
+    y_offset = np.nanmean(values) if not np.all(np.isnan(values)) else 0
+    x_offset = np.nanmean(variable) if not np.all(np.isnan(variable)) else 0
+    y = pd.Series(values - y_offset)
+    x = pd.Series(variable - x_offset)
+    var_x = x.rolling(window).var().to_numpy()
+    var_y = y.rolling(window).var().to_numpy()
+    cov_xy = x.rolling(window).cov(y).to_numpy()
+    # 自变量在窗口内为常数时，和sklearn一致，斜率取0，滑动方差有舍入误差，按相对大小判断
+    tolerance = 1e-10 * np.maximum((x ** 2).rolling(window).mean().to_numpy(), 1)
+    slope = np.divide(cov_xy, var_x, out=np.zeros(len(values)), where=var_x > tolerance)
+    slope[np.isnan(var_x)] = np.nan
+    intercept = y.rolling(window).mean().to_numpy() + y_offset - slope * (x.rolling(window).mean().to_numpy() + x_offset)
+    rss = np.maximum((window - 1) * (var_y - slope * cov_xy), 0)
+    return {
+        'slope': slope,
+        'intercept': intercept,
+        'fitted': intercept + slope * variable,
+        'residual_std': np.sqrt(rss / (window - 1)) if window > 1 else np.full(len(values), np.nan),
+        'values': values,
+        'window': window
+    }
+
+def expanding_moments(values):
+    """
+    扩展窗口的均值和总体方差（自由度为0，和np.mean/np.std一致），
+    以第一个值为基准对一阶和二阶累加和求解，每个点O(1)，
+    有空值之后的结果都为空值
+
+    Parameters
+    ----------
+    values: ndarray
+
+    Returns
+    -------
+    mean, variance
+
+    """
+    values = np.asarray(values, dtype='float64')
+    count = np.arange(1, len(values) + 1)
+    centered = values - values[0] if len(values) > 0 else values
+    sum1 = np.cumsum(centered)
+    sum2 = np.cumsum(centered * centered)
+    mean = sum1 / count
+    # 累加和相减可能出现很小的负数
+    variance = np.maximum(sum2 / count - mean * mean, 0)
+    return mean + (values[0] if len(values) > 0 else 0), variance
+
+def warm_up_rolling_moments(values, window):
+    """
+    窗口满了之后按滑动窗口，窗口未满时按扩展窗口计算均值和标准差，
+    和原来rolling之后对空值逐个调用np.mean/np.std的结果一致：
+    窗口满时标准差的自由度为1（和pandas rolling一致），窗口未满时自由度为0（和np.std一致），
+    窗口为1时滑动标准差没有意义，标准差全部按扩展窗口计算。
+    滑动部分使用pandas的rolling，窗口未满部分用累加和一次算出，不再对每个点重新求和
+
+    Parameters
+    ----------
+    values: Series or ndarray
+    window: int 窗口大小
+
+    Returns
+    -------
+    dict:
+        mean: 均值
+        variance: 方差
+        std: 标准差
+        count: 每个点使用的样本数
+
+    """
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    series = pd.Series(values)
+    head = min(window - 1, n)
+    mean = np.array(series.rolling(window).mean())
+    variance = np.array(series.rolling(window).var()) if window > 1 else np.full(n, np.nan)
+    std_head = head if window > 1 else n
+    head_mean, head_variance = expanding_moments(values[:std_head])
+    mean[:head] = head_mean[:head]
+    variance[:std_head] = head_variance
+    return {
+        'mean': mean,
+        'variance': variance,
+        'std': np.sqrt(variance),
+        'count': np.minimum(np.arange(1, n + 1), window)
+    }
+
+def rolling_moments(values, window_list):
+    """
+    多个窗口的滑动均值、方差、标准差、偏度和峰度，和pandas rolling的结果一致，
+    每个窗口只计算一次1到4阶的累加和，五种统计量都由累加和相减得到，不再分别扫描序列。
+    价格序列的整体漂移远大于窗口内的波动，直接对整个序列累加会在高阶矩相减时损失精度
+    （pandas的rolling skew和kurt在价格序列上也有明显的误差），
+    所以按窗口大小分块，每块以块内均值为基准，结束在第b块的窗口只落在第b-1和b块内，
+    只在这两块上以第b块的基准累加，累加的值和窗口内的波动在同一个量级。
+    窗口内有空值时结果为空值，窗口内的值都相同时方差为0，偏度为0，峰度为-3
+
+    Parameters
+    ----------
+    values: Series or ndarray
+    window_list: list 窗口大小
+
+    Returns
+    -------
+    dict: 窗口 -> {mean, variance, std, skewness, kurtosis}
+
+    """
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    is_nan = np.isnan(values)
+    nan_count = np.concatenate(([0], np.cumsum(is_nan)))
+    # 和前一个值不同的次数，用来判断窗口内的值是否都相同
+    change_count = np.concatenate(([0, 0], np.cumsum(values[1:] != values[:-1]))) if n > 0 else np.zeros(1)
+    result = {}
+    for window in window_list:
+        window = int(window)
+        moments = {name: np.full(n, np.nan) for name in ['mean', 'variance', 'std', 'skewness', 'kurtosis']}
+        result[window] = moments
+        if window > n or window < 1:
+            continue
+        block_count = (n + window - 1) // window
+        # 前面补一块，后面补齐最后一块，补的位置和空值一样不参与求和
+        padded_values = np.full((block_count + 1) * window, np.nan)
+        padded_values[window: window + n] = values
+        blocks = padded_values[window:].reshape(block_count, window)
+        block_valid_count = (~np.isnan(blocks)).sum(axis=1)
+        anchor = np.nansum(blocks, axis=1) / np.maximum(block_valid_count, 1)
+        segments = np.lib.stride_tricks.sliding_window_view(padded_values, 2 * window)[::window][:block_count] - anchor[:, None]
+        segments = np.where(np.isnan(segments), 0, segments)
+        square = segments * segments
+        zeros = np.zeros((block_count, 1))
+        power_sum_list = list(map(lambda power: np.concatenate((zeros, np.cumsum(power, axis=1)), axis=1), [segments, square, square * segments, square * square]))
+        end = np.arange(window - 1, n)
+        block = end // window
+        # 窗口在所在两块中的位置，按展开后的下标取值
+        flat_end = end + block * (window + 1) + window + 1
+        flat_start = flat_end - window
+        e1, e2, e3, e4 = map(lambda power_sum: (power_sum.ravel()[flat_end] - power_sum.ravel()[flat_start]) / window, power_sum_list)
+        # 总体的2到4阶中心矩
+        e1_square = e1 * e1
+        m2 = np.maximum(e2 - e1_square, 0)
+        m3 = e3 - e1 * (3 * e2 - 2 * e1_square)
+        m4 = e4 - e1 * (4 * e3 - e1 * (6 * e2 - 3 * e1_square))
+        has_nan = nan_count[end + 1] - nan_count[end + 1 - window] > 0
+        is_constant = change_count[end + 1] - change_count[end + 2 - window] == 0
+        m2[is_constant] = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = m2 * window / (window - 1) if window > 1 else np.full(len(end), np.nan)
+            skewness = np.sqrt(window * (window - 1)) * m3 / ((window - 2) * m2 * np.sqrt(m2)) if window > 2 else np.full(len(end), np.nan)
+            kurtosis = ((window * window - 1) * m4 / (m2 * m2) - 3 * (window - 1) ** 2) / ((window - 2) * (window - 3)) if window > 3 else np.full(len(end), np.nan)
+        # 和pandas一致，方差接近0但不是常数时偏度和峰度没有意义
+        is_degenerate = (m2 <= 1e-14) & ~is_constant
+        skewness[is_degenerate] = np.nan
+        kurtosis[is_degenerate] = np.nan
+        if window > 2:
+            skewness[is_constant] = 0
+        if window > 3:
+            kurtosis[is_constant] = -3
+        for name, value in [('mean', e1 + anchor[block]), ('variance', variance), ('skewness', skewness), ('kurtosis', kurtosis)]:
+            value[has_nan] = np.nan
+            moments[name][window - 1:] = value
+        moments['std'] = np.sqrt(moments['variance'])
+    return result
+
+def true_range(high, low, close):
+    """
+    真实波幅：当日振幅、和昨日收盘价比较的涨幅、跌幅三者的最大值，
+    用np.fmax忽略第一行的空值，和python内置max的结果一致
+
+    Parameters
+    ----------
+    high
+    low
+    close
+
+    Returns
+    -------
+    ndarray
+
+    """
+    high = np.asarray(high, dtype='float64')
+    low = np.asarray(low, dtype='float64')
+    last_close = shift(np.asarray(close, dtype='float64'), 1)
+    return np.fmax.reduce([high - low, np.abs(high - last_close), np.abs(low - last_close)])
+
+def trend_sign(close):
+    """
+    和上一个收盘价比较的方向：上涨1，下跌-1，持平或者没有上一个值为0
+
+    Parameters
+    ----------
+    close
+
+    Returns
+    -------
+    ndarray
+
+    """
+    close = np.asarray(close, dtype='float64')
+    sign = np.sign(close - shift(close, 1))
+    sign[np.isnan(sign)] = 0
+    return sign
+
+def safe_log(values):
+    """
+    向量化自然对数，非正数和空值返回空值，由因子统一补0
+
+    Parameters
+    ----------
+    values
+
+    Returns
+    -------
+    ndarray
+
+    """
+    values = np.asarray(values, dtype='float64')
+    result = np.full(values.shape, np.nan)
+    np.log(values, out=result, where=values > 0)
+    return result
+
+def log_ratio(numerator, denominator):
+    """
+    log(numerator / denominator)
+
+    Parameters
+    ----------
+    numerator
+    denominator
+
+    Returns
+    -------
+    ndarray
+
+    """
+    numerator = np.asarray(numerator, dtype='float64')
+    denominator = np.asarray(denominator, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return safe_log(numerator / denominator)
+
+def shift(values, n):
+    """
+    和Series.shift一致，空出的位置填空值
+
+    Parameters
+    ----------
+    values: ndarray
+    n: int
+
+    Returns
+    -------
+    ndarray
+
+    """
+    result = np.full(values.shape, np.nan)
+    if n == 0:
+        result[:] = values
+    elif n > 0:
+        result[n:] = values[:-n]
+    else:
+        result[:n] = values[-n:]
+    return result
+
+
+if __name__ == '__main__':
+    print(rolling_linear_regression(np.array([1.0, 2.0, 4.0, 8.0, 16.0]), 3))
+    print(rolling_polynomial_regression(np.array([1.0, 2.0, 4.0, 8.0, 16.0]), 3, 2))
+    print(true_range(np.array([3.0, 4.0]), np.array([1.0, 2.0]), np.array([2.0, 3.5])))
+    print(trend_sign(np.array([1.0, 2.0, 2.0, 1.0])))
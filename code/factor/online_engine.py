@@ -0,0 +1,112 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import numpy as np
+import pandas as pd
+
+from common.aop import deamon
+from common.exception.exception import ValidationFailed
+from common.log import get_logger
+from common.metrics import stage_timer
+
+
+class OnlineFactorEngine():
+    """
+    实盘逐个bar的增量计算，每个因子维护自己的滚动状态，
+    新的bar到来时只更新状态，不再对整段历史数据重新计算
+
+    Examples
+    --------
+    >>> engine = OnlineFactorEngine([CloseMinusMovingAverageFactor([20]), AdxFactor([14])])
+    >>> engine.init_state(history)
+    >>> engine.update(bar)
+
+    """
+
+    def __init__(self, factor_list):
+        self._factor_list = factor_list
+
+    def get_factor_list(self):
+        return self._factor_list
+
+    def init_state(self, history):
+        """
+        用历史数据初始化所有因子的状态
+
+        Parameters
+        ----------
+        history: dataframe 按时间排序的历史bar
+
+        Returns
+        -------
+
+        """
+        with stage_timer('online_init'):
+            for factor in self._factor_list:
+                factor.init_state(history)
+
+    @deamon
+    def update(self, bar):
+        """
+        加入一个新的bar，返回所有因子在这个bar上的值
+
+        Parameters
+        ----------
+        bar: dict or Series
+
+        Returns
+        -------
+        dict: 因子列名 -> 值
+
+        """
+        result = {}
+        with stage_timer('online_update'):
+            for factor in self._factor_list:
+                result.update(factor.update(bar))
+        return result
+
+
+def replay(factor_list, data, warm_up_count=0, rtol=1e-8, atol=1e-8):
+    """
+    回放历史bar，校验增量计算和批量计算的结果一致：
+    前warm_up_count个bar用来初始化状态，之后逐个bar调用update，
+    和caculate的结果逐列比较，不一致时抛出ValidationFailed
+
+    Parameters
+    ----------
+    factor_list: list
+    data: dataframe 按时间排序的历史bar，如3秒的tick数据
+    warm_up_count: int 初始化状态使用的bar数
+    rtol: float
+    atol: float
+
+    Returns
+    -------
+    dataframe: 增量计算的结果，index和data一致
+
+    """
+    engine = OnlineFactorEngine(factor_list)
+    engine.init_state(data.iloc[:warm_up_count])
+    bar_list = data.iloc[warm_up_count:].to_dict('records')
+    result = pd.DataFrame([engine.update(bar) for bar in bar_list], index=data.index[warm_up_count:])
+    expected = data.copy()
+    for factor in factor_list:
+        expected = factor.caculate(expected)
+    for column in result.columns:
+        online_values = result[column].to_numpy(dtype='float64')
+        batch_values = expected[column].to_numpy(dtype='float64')[warm_up_count:]
+        mismatch = ~np.isclose(online_values, batch_values, rtol=rtol, atol=atol, equal_nan=True)
+        if mismatch.any():
+            position = np.flatnonzero(mismatch)[0]
+            raise ValidationFailed('Online result of {0} is different from batch result at {1}: {2} != {3}'
+                                   .format(column, result.index[position], online_values[position], batch_values[position]))
+    get_logger().info('Replay {0} bars for {1} factors, online result is consistent with batch result'.format(len(bar_list), len(factor_list)))
+    return result
+
+
+if __name__ == '__main__':
+    # from common.localio import read_decompress
+    # from factor.volume_price_factor import CloseMinusMovingAverageFactor, AdxFactor, OnBalanceVolumeFactor
+    # data = read_decompress('E:\\data\\organized\\future\\tick\\IF\\IF2212.pkl')
+    # data = data[data['date'] == '2022-11-01'].reset_index(drop=True)
+    # replay([CloseMinusMovingAverageFactor([20]), AdxFactor([14]), OnBalanceVolumeFactor()], data, 1000)
+    pass
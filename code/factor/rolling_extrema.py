@@ -0,0 +1,186 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+"""滑动窗口的最大值，最小值和它们出现的位置，
+批量计算位置时使用分块的前缀/后缀极值，实时计算使用单调队列，两者结果一致
+"""
+
+def rolling_max(values, window, return_lag=False):
+    """
+    单个窗口的滑动最大值，return_lag为True时同时返回最大值距离当前的bar数。
+    只要最大值时直接用pandas rolling，需要位置时序列按窗口大小分块，窗口[t-window+1, t]由起点所在块的后缀和终点所在块的前缀拼成，
+    前缀和后缀的最大值都可以用accumulate向量化计算，和窗口大小无关。
+    最大值出现多次时取最近的一次，窗口内有空值时结果为空值，和pandas rolling一致
+
+    Parameters
+    ----------
+    values: ndarray
+    window: int
+    return_lag: bool
+
+    Returns
+    -------
+    max: ndarray，return_lag为True时返回 max, lag
+
+    """
+    values = np.asarray(values, dtype='float64')
+    window = int(window)
+    if not return_lag:
+        return np.array(pd.Series(values).rolling(window).max())
+    n = len(values)
+    maximum = np.full(n, np.nan)
+    lag = np.full(n, np.nan)
+    if window < 1 or window > n:
+        return maximum, lag
+    is_nan = np.isnan(values)
+    block_count = (n + window - 1) // window
+    padded_values = np.full(block_count * window, -np.inf)
+    padded_values[:n] = np.where(is_nan, -np.inf, values)
+    blocks = padded_values.reshape(block_count, window)
+    prefix = np.maximum.accumulate(blocks, axis=1)
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1]
+    end = np.arange(window - 1, n)
+    start = end - window + 1
+    nan_count = np.concatenate(([0], np.cumsum(is_nan)))
+    has_nan = nan_count[end + 1] - nan_count[start] > 0
+    index = np.arange(block_count * window).reshape(block_count, window)
+    # 块内前缀最大值和前缀最大值相等的最近位置
+    prefix_index = np.maximum.accumulate(np.where(blocks == prefix, index, -1), axis=1)
+    # 块内后缀最大值，从右往左严格创新高的位置中离起点最近的一个就是后缀中最近的最大值
+    is_record = np.ones(blocks.shape, dtype=bool)
+    is_record[:, :-1] = blocks[:, :-1] > suffix[:, 1:]
+    suffix_index = np.minimum.accumulate(np.where(is_record, index, block_count * window)[:, ::-1], axis=1)[:, ::-1]
+    prefix, prefix_index, suffix, suffix_index = prefix.ravel(), prefix_index.ravel(), suffix.ravel(), suffix_index.ravel()
+    # 相等时取前缀，前缀在后缀之后
+    position = np.where(prefix[end] >= suffix[start], prefix_index[end], suffix_index[start])
+    maximum[window - 1:] = values[position]
+    lag[window - 1:] = end - position
+    maximum[window - 1:][has_nan] = np.nan
+    lag[window - 1:][has_nan] = np.nan
+    return maximum, lag
+
+def rolling_min(values, window, return_lag=False):
+    """
+    单个窗口的滑动最小值，return_lag为True时同时返回最小值距离当前的bar数，取反之后求最大值
+
+    Parameters
+    ----------
+    values: ndarray
+    window: int
+    return_lag: bool
+
+    Returns
+    -------
+    min: ndarray，return_lag为True时返回 min, lag
+
+    """
+    values = np.asarray(values, dtype='float64')
+    if not return_lag:
+        return np.array(pd.Series(values).rolling(int(window)).min())
+    maximum, lag = rolling_max(-values, window, True)
+    return -maximum + 0.0, lag
+
+def rolling_extrema(values, window_list):
+    """
+    多个窗口的滑动最大值，最小值，argmax和argmin，
+    argmax和argmin是极值距离当前的bar数，当前bar为0，极值出现多次时取最近的一次
+
+    Parameters
+    ----------
+    values: Series or ndarray
+    window_list: list 窗口大小
+
+    Returns
+    -------
+    dict: 窗口 -> {max, min, argmax, argmin}
+
+    """
+    values = np.asarray(values, dtype='float64')
+    result = {}
+    for window in window_list:
+        maximum, argmax = rolling_max(values, window, True)
+        minimum, argmin = rolling_min(values, window, True)
+        result[window] = {'max': maximum, 'min': minimum, 'argmax': argmax, 'argmin': argmin}
+    return result
+
+
+class RollingExtrema():
+    """
+    实时计算的滑动极值，每个窗口维护一个单调递减队列和一个单调递增队列，
+    队列中保存 (序号, 值)，每来一个bar均摊O(1)更新，
+    结果和rolling_extrema一致
+
+    Examples
+    --------
+    >>> rolling_extrema = RollingExtrema([20, 50])
+    >>> for price in history:
+    >>>     rolling_extrema.update(price)
+    >>> rolling_extrema.update(cur_price)[20]['max']
+
+    """
+
+    def __init__(self, window_list):
+        self._window_list = list(map(int, window_list))
+        self._max_queue_dict = {window: deque() for window in self._window_list}
+        self._min_queue_dict = {window: deque() for window in self._window_list}
+        self._count = 0
+        self._last_nan_index = -1
+
+    def get_window_list(self):
+        return self._window_list
+
+    def update(self, value):
+        """
+        加入一个新的bar
+
+        Parameters
+        ----------
+        value: float
+
+        Returns
+        -------
+        dict: 窗口 -> {max, min, argmax, argmin}，窗口未满或者窗口内有空值时为空值
+
+        """
+        index = self._count
+        self._count = self._count + 1
+        is_nan = value is None or np.isnan(value)
+        if is_nan:
+            self._last_nan_index = index
+        result = {}
+        for window in self._window_list:
+            max_queue = self._max_queue_dict[window]
+            min_queue = self._min_queue_dict[window]
+            if not is_nan:
+                # 相等的旧值出队，保证取到最近的极值
+                while max_queue and max_queue[-1][1] <= value:
+                    max_queue.pop()
+                max_queue.append((index, value))
+                while min_queue and min_queue[-1][1] >= value:
+                    min_queue.pop()
+                min_queue.append((index, value))
+            while max_queue and max_queue[0][0] <= index - window:
+                max_queue.popleft()
+            while min_queue and min_queue[0][0] <= index - window:
+                min_queue.popleft()
+            if self._count < window or self._last_nan_index > index - window:
+                result[window] = {'max': np.nan, 'min': np.nan, 'argmax': np.nan, 'argmin': np.nan}
+            else:
+                result[window] = {
+                    'max': max_queue[0][1],
+                    'min': min_queue[0][1],
+                    'argmax': index - max_queue[0][0],
+                    'argmin': index - min_queue[0][0]
+                }
+        return result
+
+
+if __name__ == '__main__':
+    print(rolling_extrema(np.array([1.0, 3.0, 2.0, 3.0, 1.0, 0.0]), [3]))
+    # rolling_extrema = RollingExtrema([3])
+    # for price in [1.0, 3.0, 2.0, 3.0, 1.0, 0.0]:
+    #     print(rolling_extrema.update(price))
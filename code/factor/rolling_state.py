@@ -0,0 +1,220 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import math
+
+"""实时计算的滚动状态，每来一个bar均摊O(1)更新，
+结果和批量计算使用的pandas rolling，ewm一致
+"""
+
+def divide(numerator, denominator):
+    """
+    和numpy一致的除法，除以0得到inf或者空值，不抛出异常
+
+    Parameters
+    ----------
+    numerator: float
+    denominator: float
+
+    Returns
+    -------
+    float
+
+    """
+    if denominator == 0:
+        if numerator == 0 or math.isnan(numerator):
+            return math.nan
+        return math.copysign(math.inf, numerator) * math.copysign(1, denominator)
+    return numerator / denominator
+
+def fill_nan(value, fill_value=0):
+    """
+    空值填充，和批量计算中 data.loc[data[key].isnull(), key] = 0 一致
+
+    Parameters
+    ----------
+    value: float
+    fill_value: float
+
+    Returns
+    -------
+    float
+
+    """
+    return fill_value if math.isnan(value) else value
+
+
+class RingBuffer():
+    """
+    固定大小的环形缓冲区，保存最近size个值
+    """
+
+    def __init__(self, size):
+        self._size = int(size)
+        self._values = [math.nan] * self._size
+        self._count = 0
+
+    def append(self, value):
+        """
+        加入一个值
+
+        Parameters
+        ----------
+        value: float
+
+        Returns
+        -------
+        被挤出的值，缓冲区未满时返回None
+
+        """
+        position = self._count % self._size
+        old_value = self._values[position] if self._count >= self._size else None
+        self._values[position] = value
+        self._count = self._count + 1
+        return old_value
+
+    def get(self, lag=0):
+        """
+        lag个bar之前的值，和Series.shift(lag)一致，超出范围时为空值
+        """
+        if lag >= min(self._count, self._size):
+            return math.nan
+        return self._values[(self._count - 1 - lag) % self._size]
+
+    def get_values(self):
+        """
+        按时间顺序返回缓冲区中的值
+        """
+        if self._count < self._size:
+            return self._values[:self._count]
+        position = self._count % self._size
+        return self._values[position:] + self._values[:position]
+
+    def is_full(self):
+        return self._count >= self._size
+
+    def is_wrapped(self):
+        """
+        刚写满一轮，滚动累加的状态在这时按缓冲区重新计算，避免误差累积
+        """
+        return self._count % self._size == 0
+
+
+class RollingMeanState():
+    """
+    滑动均值，对应 rolling(window).mean()，
+    窗口未满或者窗口内有空值时为空值
+    """
+
+    def __init__(self, window):
+        self._window = int(window)
+        self._buffer = RingBuffer(self._window)
+        self._sum = 0.0
+        self._nan_count = 0
+
+    def update(self, value):
+        old_value = self._buffer.append(value)
+        if old_value is not None:
+            if math.isnan(old_value):
+                self._nan_count = self._nan_count - 1
+            else:
+                self._sum = self._sum - old_value
+        if math.isnan(value):
+            self._nan_count = self._nan_count + 1
+        else:
+            self._sum = self._sum + value
+        if self._buffer.is_wrapped():
+            self._sum = math.fsum(filter(lambda x: not math.isnan(x), self._buffer.get_values()))
+        if not self._buffer.is_full() or self._nan_count > 0:
+            return math.nan
+        return self._sum / self._window
+
+
+class RollingVarianceState():
+    """
+    滑动方差和标准差，对应 rolling(window).var() 和 rolling(window).std()，
+    累加的是和基准值的差，基准值在每轮重新计算时取窗口均值，
+    价格序列的累加值和窗口内的波动在同一个量级，窗口内的值都相同时方差为0
+    """
+
+    def __init__(self, window):
+        self._window = int(window)
+        self._buffer = RingBuffer(self._window)
+        self._anchor = None
+        self._sum = 0.0
+        self._square_sum = 0.0
+        self._nan_count = 0
+        # 最新的值连续出现的次数
+        self._repeat_count = 0
+
+    def update(self, value):
+        """
+        Returns
+        -------
+        variance, std
+
+        """
+        if self._anchor is None and not math.isnan(value):
+            self._anchor = value
+        self._repeat_count = self._repeat_count + 1 if value == self._buffer.get() else 1
+        old_value = self._buffer.append(value)
+        if old_value is not None:
+            if math.isnan(old_value):
+                self._nan_count = self._nan_count - 1
+            else:
+                self._sum = self._sum - (old_value - self._anchor)
+                self._square_sum = self._square_sum - (old_value - self._anchor) ** 2
+        if math.isnan(value):
+            self._nan_count = self._nan_count + 1
+        else:
+            self._sum = self._sum + (value - self._anchor)
+            self._square_sum = self._square_sum + (value - self._anchor) ** 2
+        if self._buffer.is_wrapped():
+            self.recaculate()
+        if not self._buffer.is_full() or self._nan_count > 0 or self._window < 2:
+            return math.nan, math.nan
+        if self._repeat_count >= self._window:
+            return 0.0, 0.0
+        mean = self._sum / self._window
+        variance = max(self._square_sum / self._window - mean * mean, 0) * self._window / (self._window - 1)
+        return variance, math.sqrt(variance)
+
+    def recaculate(self):
+        values = list(filter(lambda x: not math.isnan(x), self._buffer.get_values()))
+        if len(values) == 0:
+            return
+        self._anchor = math.fsum(values) / len(values)
+        self._sum = math.fsum(map(lambda x: x - self._anchor, values))
+        self._square_sum = math.fsum(map(lambda x: (x - self._anchor) ** 2, values))
+
+
+class EwmState():
+    """
+    指数移动平均，对应 ewm(span=span, adjust=False).mean()，
+    空值不更新均值，但是和pandas一样，旧均值的权重在空值期间继续衰减
+    """
+
+    def __init__(self, span):
+        alpha = 2 / (span + 1)
+        self._old_weight_factor = 1 - alpha
+        self._new_weight = alpha
+        self._weighted = math.nan
+        self._old_weight = 1.0
+
+    def update(self, value):
+        is_observation = not math.isnan(value)
+        if not math.isnan(self._weighted):
+            self._old_weight = self._old_weight * self._old_weight_factor
+            if is_observation:
+                if self._weighted != value:
+                    self._weighted = (self._old_weight * self._weighted + self._new_weight * value) / (self._old_weight + self._new_weight)
+                self._old_weight = 1.0
+        elif is_observation:
+            self._weighted = value
+        return self._weighted
+
+
+if __name__ == '__main__':
+    # state = RollingMeanState(3)
+    # for value in [1.0, 2.0, 3.0, 4.0]:
+    #     print(state.update(value))
+    pass
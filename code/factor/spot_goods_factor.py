@@ -5,7 +5,9 @@ import time
 from memory_profiler import profile
 import numpy as np
 
-from factor.base_factor import Factor, StockTickFactor, TimewindowStockTickFactor, StockTickDifferenceFactor, StockTickMeanFactor, StockTickStdFactor
+from factor.base_factor import Factor, StockTickFactor, TimewindowStockTickFactor, StockTickDifferenceFactor, StockTickMeanFactor, StockTickStdFactor, safe_divide
+from factor.factor_storage import ResultSink
+from factor.kernel import warm_up_rolling_moments
 from common.constants import TEST_PATH, STOCK_TRANSACTION_START_TIME, STOCK_OPEN_CALL_AUACTION_2ND_STAGE_START_TIME, \
     STOCK_OPEN_CALL_AUACTION_2ND_STAGE_END_TIME, STOCK_OPEN_CALL_AUACTION_1ST_STAGE_START_TIME, STOCK_INDEX_INFO, FACTOR_STANDARD_FIELD_TYPE
 from common.localio import read_decompress, save_compress
@@ -17,8 +19,8 @@ from data.access import StockDataAccess
 from framework.localconcurrent import ProcessRunner, ProcessExcecutor
 from common.log import get_logger
 from common.stockutils import approximately_equal_to, get_rising_falling_limit
-from common.persistence.dao import FutureInstrumentConfigDao, IndexConstituentConfigDao
-from common.commonutils import local_divide
+from common.persistence.dao import IndexConstituentConfigDao
+from common.persistence.trading_calendar import get_trading_calendar
 
 """现货类因子
 分类编号：02
@@ -84,9 +86,8 @@ class TotalCommissionRatioFactor(StockTickFactor):
         stock_data_per_date['bid_commission_amount'] = stock_data_per_date['total_bid_volume'] * stock_data_per_date['weighted_average_bid_price']
         stock_data_per_date['total_commission_amount'] = stock_data_per_date['ask_commission_amount'] + stock_data_per_date['bid_commission_amount']
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')['bid_commission_amount', 'total_commission_amount'].sum()
-        stock_data_per_date_group_by[self.get_key()] = stock_data_per_date_group_by.apply(
-            lambda x: 0 if x['total_commission_amount'] == 0 else x['bid_commission_amount'] / x['total_commission_amount'], axis=1)
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[['bid_commission_amount', 'total_commission_amount']].sum()
+        stock_data_per_date_group_by[self.get_key()] = safe_divide(stock_data_per_date_group_by['bid_commission_amount'], stock_data_per_date_group_by['total_commission_amount'])
         df_stock_data_per_date = pd.DataFrame({self.get_key(): stock_data_per_date_group_by[self.get_key()], 'time': stock_data_per_date_group_by.index})
         # 过滤对齐在3秒线的数据
         return date, df_stock_data_per_date
@@ -123,9 +124,8 @@ class TenGradeCommissionRatioFactor(StockTickFactor):
         stock_data_per_date = stock_data_per_date[stock_data_per_date['time'] > add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)]
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
         stock_data_per_date['10_grade_total_amount'] = stock_data_per_date['10_grade_bid_amount'] + stock_data_per_date['10_grade_ask_amount']
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')['10_grade_bid_amount', '10_grade_total_amount'].sum()
-        stock_data_per_date_group_by[self.get_key()] = stock_data_per_date_group_by.apply(
-            lambda x: 0 if x['10_grade_total_amount'] == 0 else x['10_grade_bid_amount'] / x['10_grade_total_amount'], axis=1)
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[['10_grade_bid_amount', '10_grade_total_amount']].sum()
+        stock_data_per_date_group_by[self.get_key()] = safe_divide(stock_data_per_date_group_by['10_grade_bid_amount'], stock_data_per_date_group_by['10_grade_total_amount'])
         df_stock_data_per_date = pd.DataFrame(
             {self.get_key(): stock_data_per_date_group_by[self.get_key()], 'time': stock_data_per_date_group_by.index})
         return date, df_stock_data_per_date
@@ -166,11 +166,9 @@ class TenGradeWeightedCommissionRatioFactor(TenGradeCommissionRatioFactor):
     def execute_caculation(self, date, stock_data_per_date):
         stock_data_per_date = stock_data_per_date[stock_data_per_date['time'] > add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)]
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[
-            '10_grade_bid_commission_amount', '10_grade_total_commission_amount'].sum()
-        stock_data_per_date_group_by[self.get_key()] = stock_data_per_date_group_by.apply(
-            lambda x: 0 if x['10_grade_total_commission_amount'] == 0 else x['10_grade_bid_commission_amount'] / x[
-                '10_grade_total_commission_amount'], axis=1)
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[[
+            '10_grade_bid_commission_amount', '10_grade_total_commission_amount']].sum()
+        stock_data_per_date_group_by[self.get_key()] = safe_divide(stock_data_per_date_group_by['10_grade_bid_commission_amount'], stock_data_per_date_group_by['10_grade_total_commission_amount'])
         df_stock_data_per_date = pd.DataFrame(
             {self.get_key(): stock_data_per_date_group_by[self.get_key()], 'time': stock_data_per_date_group_by.index})
         return date, df_stock_data_per_date
@@ -216,9 +214,8 @@ class FiveGradeCommissionRatioFactor(StockTickFactor):
         stock_data_per_date = stock_data_per_date[stock_data_per_date['time'] > add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)]
         stock_data_per_date['5_grade_total_amount'] = stock_data_per_date['5_grade_bid_amount'] + stock_data_per_date['5_grade_ask_amount']
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')['5_grade_bid_amount', '5_grade_total_amount'].sum()
-        stock_data_per_date_group_by[self.get_key()] = stock_data_per_date_group_by.apply(
-            lambda x: 0 if x['5_grade_total_amount'] == 0 else x['5_grade_bid_amount'] / x['5_grade_total_amount'], axis=1)
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[['5_grade_bid_amount', '5_grade_total_amount']].sum()
+        stock_data_per_date_group_by[self.get_key()] = safe_divide(stock_data_per_date_group_by['5_grade_bid_amount'], stock_data_per_date_group_by['5_grade_total_amount'])
         df_stock_data_per_date = pd.DataFrame(
             {self.get_key(): stock_data_per_date_group_by[self.get_key()], 'time': stock_data_per_date_group_by.index})
         return date, df_stock_data_per_date
@@ -254,11 +251,9 @@ class FiveGradeWeightedCommissionRatioFactor(FiveGradeCommissionRatioFactor):
     def execute_caculation(self, date, stock_data_per_date):
         stock_data_per_date = stock_data_per_date[stock_data_per_date['time'] > add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)]
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[
-            '5_grade_bid_commission_amount', '5_grade_total_commission_amount'].sum()
-        stock_data_per_date_group_by[self.get_key()] = stock_data_per_date_group_by.apply(
-            lambda x: 0 if x['5_grade_total_commission_amount'] == 0 else x['5_grade_bid_commission_amount'] / x[
-                '5_grade_total_commission_amount'], axis=1)
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[[
+            '5_grade_bid_commission_amount', '5_grade_total_commission_amount']].sum()
+        stock_data_per_date_group_by[self.get_key()] = safe_divide(stock_data_per_date_group_by['5_grade_bid_commission_amount'], stock_data_per_date_group_by['5_grade_total_commission_amount'])
         df_stock_data_per_date = pd.DataFrame(
             {self.get_key(): stock_data_per_date_group_by[self.get_key()], 'time': stock_data_per_date_group_by.index})
         return date, df_stock_data_per_date
@@ -751,8 +746,8 @@ class BidLargeAmountBillFactor(TimewindowStockTickFactor):
     @timing
     def caculate(self, data):
         columns = self.get_factor_columns(data)
-        future_instrument_config_dao = FutureInstrumentConfigDao()
-        new_data = pd.DataFrame(columns=columns)
+        trading_calendar = get_trading_calendar()
+        result_sink = ResultSink(columns)
         product = data.iloc[0]['product']
         instrument = data.iloc[0]['instrument']
         date_list = list(set(data['date'].tolist()))
@@ -770,14 +765,14 @@ class BidLargeAmountBillFactor(TimewindowStockTickFactor):
                 try:
                     cur_date_data = temp_cache[date]
                     auxiliary_data = self.get_auxiliary_data(product)
-                    three_days_before_list = future_instrument_config_dao.get_last_n_transaction_date_list(date, 3)
+                    three_days_before_list = trading_calendar.get_last_n_transaction_date_list(date, 3)
                     five_grade_bid_amount_3days_mean = auxiliary_data[three_days_before_list].mean()
                     cur_date_data[self.get_key()] = 0
                     cur_date_data.loc[cur_date_data['5_grade_bid_amount_mean'] > five_grade_bid_amount_3days_mean * 1.5, self.get_key()] = 1
                 except Exception as e:
                     get_logger().warning('The data is missing for date: {0}'.format(date))
-                new_data = pd.concat([new_data, cur_date_data])
-        return new_data
+                result_sink.append(cur_date_data)
+        return result_sink.get_result()
 
     def caculate_by_date(self, *args):
         date = args[0][0]
@@ -839,8 +834,8 @@ class AskLargeAmountBillFactor(TimewindowStockTickFactor):
     @timing
     def caculate(self, data):
         columns = self.get_factor_columns(data)
-        future_instrument_config_dao = FutureInstrumentConfigDao()
-        new_data = pd.DataFrame(columns=columns)
+        trading_calendar = get_trading_calendar()
+        result_sink = ResultSink(columns)
         product = data.iloc[0]['product']
         instrument = data.iloc[0]['instrument']
         date_list = list(set(data['date'].tolist()))
@@ -858,14 +853,14 @@ class AskLargeAmountBillFactor(TimewindowStockTickFactor):
                 try:
                     cur_date_data = temp_cache[date]
                     auxiliary_data = self.get_auxiliary_data(product)
-                    three_days_before_list = future_instrument_config_dao.get_last_n_transaction_date_list(date, 3)
+                    three_days_before_list = trading_calendar.get_last_n_transaction_date_list(date, 3)
                     five_grade_ask_amount_3days_mean = auxiliary_data[three_days_before_list].mean()
                     cur_date_data[self.get_key()] = 0
                     cur_date_data.loc[cur_date_data['5_grade_ask_amount_mean'] > five_grade_ask_amount_3days_mean * 1.5, self.get_key()] = 1
                 except Exception as e:
                     get_logger().warning('The data is missing for date: {0}'.format(date))
-                new_data = pd.concat([new_data, cur_date_data])
-        return new_data
+                result_sink.append(cur_date_data)
+        return result_sink.get_result()
 
     def caculate_by_date(self, *args):
         date = args[0][0]
@@ -970,9 +965,8 @@ class AmountAndCommissionRatioFactor(StockTickFactor):
         stock_data_per_date.loc[stock_data_per_date['delta_price'] < 0, 'amount_and_ask_commission_amount'] = stock_data_per_date['amount_and_ask_commission_amount'] + stock_data_per_date['amount']
         stock_data_per_date['total_amount_and_commission_amount'] = stock_data_per_date['amount_and_ask_commission_amount'] + stock_data_per_date['amount_and_bid_commission_amount']
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')['amount_and_bid_commission_amount', 'total_amount_and_commission_amount'].sum()
-        stock_data_per_date_group_by[self.get_key()] = stock_data_per_date_group_by.apply(
-            lambda x: 0 if x['total_amount_and_commission_amount'] == 0 else x['amount_and_bid_commission_amount'] / x['total_amount_and_commission_amount'], axis=1)
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[['amount_and_bid_commission_amount', 'total_amount_and_commission_amount']].sum()
+        stock_data_per_date_group_by[self.get_key()] = safe_divide(stock_data_per_date_group_by['amount_and_bid_commission_amount'], stock_data_per_date_group_by['total_amount_and_commission_amount'])
         df_stock_data_per_date = pd.DataFrame({self.get_key(): stock_data_per_date_group_by[self.get_key()], 'time': stock_data_per_date_group_by.index})
         return date, df_stock_data_per_date
 
@@ -1032,8 +1026,8 @@ class RisingFallingAmountRatioFactor(StockTickFactor):
         stock_data_per_date['total_amount'] = stock_data_per_date['amount']
         stock_data_per_date['diff_amount'] = stock_data_per_date['rising_amount'] - stock_data_per_date['falling_amount']
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')['diff_amount', 'total_amount'].sum()
-        stock_data_per_date_group_by[self.get_key()] = stock_data_per_date_group_by.apply(lambda x: 0 if x['total_amount'] == 0 else x['diff_amount'] / x['total_amount'], axis=1)
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[['diff_amount', 'total_amount']].sum()
+        stock_data_per_date_group_by[self.get_key()] = safe_divide(stock_data_per_date_group_by['diff_amount'], stock_data_per_date_group_by['total_amount'])
         df_stock_data_per_date = pd.DataFrame({self.get_key(): stock_data_per_date_group_by[self.get_key()], 'time': stock_data_per_date_group_by.index})
         return date, df_stock_data_per_date
 
@@ -1087,9 +1081,8 @@ class UntradedStockRatioFactor(StockTickFactor):
         stock_data_per_date['untraded_count'] = 0
         stock_data_per_date.loc[stock_data_per_date['volume'] == 0, 'untraded_count'] = 1
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')['untraded_count', 'total_count'].sum()
-        stock_data_per_date_group_by[self.get_key()] = stock_data_per_date_group_by.apply(
-            lambda x: 0 if x['total_count'] == 0 else x['untraded_count'] / x['total_count'], axis=1)
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[['untraded_count', 'total_count']].sum()
+        stock_data_per_date_group_by[self.get_key()] = safe_divide(stock_data_per_date_group_by['untraded_count'], stock_data_per_date_group_by['total_count'])
         df_stock_data_per_date = pd.DataFrame(
             {self.get_key(): stock_data_per_date_group_by[self.get_key()], 'time': stock_data_per_date_group_by.index})
         return date, df_stock_data_per_date
@@ -1124,8 +1117,8 @@ class DailyAccumulatedLargeOrderRatioFactor(StockTickFactor):
     def execute_caculation(self, date, stock_data_per_date):
         stock_data_per_date = stock_data_per_date[stock_data_per_date['time'] > add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)]
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')['total_rising_amount_per_transaction', 'total_amount_per_transaction'].sum()
-        stock_data_per_date_group_by[self.get_key()] = np.apply_along_axis(lambda item: local_divide(item[0], item[1]), axis=1, arr=stock_data_per_date_group_by.values)
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[['total_rising_amount_per_transaction', 'total_amount_per_transaction']].sum()
+        stock_data_per_date_group_by[self.get_key()] = safe_divide(stock_data_per_date_group_by.iloc[:, 0], stock_data_per_date_group_by.iloc[:, 1])
         df_stock_data_per_date = pd.DataFrame({self.get_key(): stock_data_per_date_group_by[self.get_key()], 'time': stock_data_per_date_group_by.index})
         return date, df_stock_data_per_date
 
@@ -1134,7 +1127,7 @@ class DailyAccumulatedLargeOrderRatioFactor(StockTickFactor):
         data = data.reset_index()
         data['delta_transaction_number'] = data['transaction_number'] - data['transaction_number'].shift(1)
         data.loc[data[pd.isnull(data['delta_transaction_number'])].index, 'delta_transaction_number'] = 0
-        data['amount_per_transaction'] = np.apply_along_axis(lambda item: local_divide(item[4], item[7]), axis=1, arr=data.values)
+        data['amount_per_transaction'] = safe_divide(data.iloc[:, 4], data.iloc[:, 7])
         data['delta_price'] = data['price'] - data['price'].shift(1)
         data.loc[data[pd.isnull(data['delta_price'])].index, 'delta_price'] = 0
         data['rising_amount_per_transaction'] = 0
@@ -1188,14 +1181,9 @@ class RollingAccumulatedLargeOrderRatioFactor(StockTickFactor):
         stock_data_per_date = stock_data_per_date[stock_data_per_date['time'] > add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)]
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
         for param in self._params:
-            stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[
-                'total_rising_amount_per_transaction.' + str(param), 'total_amount_per_transaction.' + str(param)].sum()
-            stock_data_per_date_group_by[self.get_key(param)] = stock_data_per_date_group_by.apply(
-                lambda x: 0 if x['total_amount_per_transaction.' + str(param)] == 0 else x[
-                                                                                             'total_rising_amount_per_transaction.' + str(
-                                                                                                 param)] / x[
-                                                                                             'total_amount_per_transaction.' + str(
-                                                                                                 param)], axis=1)
+            stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[[
+                'total_rising_amount_per_transaction.' + str(param), 'total_amount_per_transaction.' + str(param)]].sum()
+            stock_data_per_date_group_by[self.get_key(param)] = safe_divide(stock_data_per_date_group_by['total_rising_amount_per_transaction.' + str(param)], stock_data_per_date_group_by['total_amount_per_transaction.' + str(param)])
             df_stock_data_per_date = pd.DataFrame(
                 {self.get_key(param): stock_data_per_date_group_by[self.get_key(param)],
                  'time': stock_data_per_date_group_by.index})
@@ -1215,7 +1203,7 @@ class RollingAccumulatedLargeOrderRatioFactor(StockTickFactor):
         """
         temp_data = self._data_access.access(date, stock)
         temp_data['delta_transaction_number'] = temp_data['transaction_number'] - temp_data['transaction_number'].shift(1)
-        temp_data['amount_per_transaction'] = temp_data.apply(lambda x: 0 if x['delta_transaction_number'] == 0 else x['amount'] / x['delta_transaction_number'], axis=1)
+        temp_data['amount_per_transaction'] = safe_divide(temp_data['amount'], temp_data['delta_transaction_number'])
         temp_data['delta_price'] = temp_data['price'] - temp_data['price'].shift(1)
         temp_data.loc[temp_data[np.isnan(temp_data['delta_price'])].index, 'delta_price'] = 0
         temp_data['rising_amount_per_transaction'] = 0
@@ -1425,24 +1413,15 @@ class AmountBidTotalCommissionRatioFactor(StockTickFactor):
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
         commission_amount_key = self.get_action_type() + '_commission_amount'
         # 股票维度求和
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[commission_amount_key, 'amount'].sum()
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[[commission_amount_key, 'amount']].sum()
         # 按时间点求比例
-        stock_data_per_date_group_by['ratio'] = stock_data_per_date_group_by.apply(
-            lambda x: 0 if x[commission_amount_key] == 0 else x['amount'] / x[commission_amount_key], axis=1)
+        stock_data_per_date_group_by['ratio'] = safe_divide(stock_data_per_date_group_by['amount'], stock_data_per_date_group_by[commission_amount_key])
         columns = []
         # 时间维度求平均
         for param in self.get_params():
-            stock_data_per_date_group_by[self.get_key(param)] = stock_data_per_date_group_by['ratio'].rolling(param).mean()
-            # 两种方式补0或者滑动时间窗
+            # 两种方式补0或者滑动时间窗，窗口未满时按扩展窗口计算
             # stock_data_per_date_group_by.loc[np.isnan(stock_data_per_date_group_by[self.get_key(param)]), self.get_key(param)] = 0
-            filled_data_arr = np.zeros(len(stock_data_per_date_group_by.loc[np.isnan(stock_data_per_date_group_by[self.get_key(param)])]))
-            temp_arr = stock_data_per_date_group_by.loc[np.isnan(stock_data_per_date_group_by[self.get_key(param)])]['ratio'].tolist()
-            for i in range(len(temp_arr)):
-                if i == 0:
-                    filled_data_arr[i] = temp_arr[i]
-                else:
-                    filled_data_arr[i] = np.mean(temp_arr[:i + 1])
-            stock_data_per_date_group_by.loc[np.isnan(stock_data_per_date_group_by[self.get_key(param)]), self.get_key(param)] = filled_data_arr
+            stock_data_per_date_group_by[self.get_key(param)] = warm_up_rolling_moments(stock_data_per_date_group_by['ratio'], param)['mean']
             columns = columns + [self.get_key(param)]
         df_stock_data_per_date = stock_data_per_date_group_by[columns]
         df_stock_data_per_date['time'] = stock_data_per_date_group_by.index
@@ -1598,8 +1577,7 @@ class TotalCommissionVolatilityRatioFactor(StockTickFactor):
         stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[sum_columns].sum()
         columns = []
         for param in self.get_params():
-            stock_data_per_date_group_by[self.get_key(param)] = stock_data_per_date_group_by.apply(
-                lambda x: 0 if x['ask_commission_amount_std_' + str(param)] == 0 else x['bid_commission_amount_std_' + str(param)] / x['ask_commission_amount_std_' + str(param)], axis=1)
+            stock_data_per_date_group_by[self.get_key(param)] = safe_divide(stock_data_per_date_group_by['bid_commission_amount_std_' + str(param)], stock_data_per_date_group_by['ask_commission_amount_std_' + str(param)])
             columns = columns + [self.get_key(param)]
         df_stock_data_per_date = stock_data_per_date_group_by[columns]
         df_stock_data_per_date['time'] = df_stock_data_per_date.index
@@ -1664,7 +1642,7 @@ class Commission5GradeVolatilityRatioFactor(TotalCommissionVolatilityRatioFactor
             data['bid_commission_amount_std_' + str(param)] = data['5_grade_bid_amount'].rolling(param).std()
         return data
 
-class TotalCommissionRatioDifferenceFactor(StockTickFactor):
+class TotalCommissionRatioDifferenceFactor(StockTickDifferenceFactor):
     """
     总委比差分因子
     """
@@ -1676,35 +1654,8 @@ class TotalCommissionRatioDifferenceFactor(StockTickFactor):
         self._params = params
         self._total_commission_ratio_factor = TotalCommissionRatioFactor()
 
-    @timing
-    def caculate(self, data):
-        """
-        现货因子计算逻辑，多进程按天计算
-        Parameters
-        ----------
-        data
-
-        Returns
-        -------
-
-        """
-        columns = self.get_factor_columns(data)
-        new_data = pd.DataFrame(columns=columns)
-        product = data.iloc[0]['product']
-        original_data = self._total_commission_ratio_factor.load(product)
-        date_list = list(set(data['date'].tolist()))
-        date_list.sort()
-        for date in date_list:
-            temp_data = original_data[original_data['date'] == date]
-            if len(temp_data) > 0: # 因为已经按主力合约交割日进行了截取，所以temp_data有可能是空的，必须做这个处理
-                for param in self._params:
-                    temp_data.loc[:, self.get_key(param)] = temp_data[self._total_commission_ratio_factor.get_key()] - temp_data[self._total_commission_ratio_factor.get_key()].shift(param)
-                    if temp_data.dtypes[self.get_key(param)] != FACTOR_STANDARD_FIELD_TYPE:
-                        temp_data[self.get_key(param)] = temp_data[self.get_key(param)].astype(FACTOR_STANDARD_FIELD_TYPE)
-                    # 不足param长度的用第一个时间点计算
-                    temp_data.loc[np.isnan(temp_data[self.get_key(param)]), self.get_key(param)] = temp_data[self._total_commission_ratio_factor.get_key()] - temp_data.iloc[0][self._total_commission_ratio_factor.get_key()]
-                new_data = pd.concat([new_data, temp_data])
-        return new_data
+    def get_target_factor(self):
+        return self._total_commission_ratio_factor
 
 class TenGradeCommissionRatioDifferenceFactor(StockTickDifferenceFactor):
     """
@@ -1823,7 +1774,7 @@ class LargeOrderBidAskVolumeRatioFactor(TimewindowStockTickFactor):
     # @profile
     def caculate(self, data):
         columns = self.get_factor_columns(data)
-        new_data = pd.DataFrame(columns=columns)
+        result_sink = ResultSink(columns)
         product = data.iloc[0]['product']
         instrument = data.iloc[0]['instrument']
         date_list = list(set(data['date'].tolist()))
@@ -1841,8 +1792,8 @@ class LargeOrderBidAskVolumeRatioFactor(TimewindowStockTickFactor):
                 cur_date_data = temp_cache[date]
                 cur_date_data[self.get_key()] = 0
                 cur_date_data.loc[cur_date_data['total_large_amount'] > 0, self.get_key()] = cur_date_data['rising_large_amount']/cur_date_data['total_large_amount']
-                new_data = pd.concat([new_data, cur_date_data])
-        return new_data
+                result_sink.append(cur_date_data)
+        return result_sink.get_result()
 
     def caculate_by_date(self, *args):
         date = args[0][0]
@@ -2087,24 +2038,18 @@ class AmountBidTotalCommissionRatioStdFactor(StockTickFactor):
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
         commission_amount_key = self.get_action_type() + '_commission_amount'
         # 股票维度求和
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[commission_amount_key, 'amount'].sum()
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[[commission_amount_key, 'amount']].sum()
         # 按时间点求比例
-        stock_data_per_date_group_by['ratio'] = stock_data_per_date_group_by.apply(
-            lambda x: 0 if x[commission_amount_key] == 0 else x['amount'] / x[commission_amount_key], axis=1)
+        stock_data_per_date_group_by['ratio'] = safe_divide(stock_data_per_date_group_by['amount'], stock_data_per_date_group_by[commission_amount_key])
         columns = []
         # 时间维度求平均
         for param in self.get_params():
-            stock_data_per_date_group_by[self.get_key(param)] = stock_data_per_date_group_by['ratio'].rolling(param).std()
-            # 两种方式补0或者滑动时间窗
+            # 两种方式补0或者滑动时间窗，窗口未满时按扩展窗口计算
             # stock_data_per_date_group_by.loc[np.isnan(stock_data_per_date_group_by[self.get_key(param)]), self.get_key(param)] = 0
-            filled_data_arr = np.zeros(len(stock_data_per_date_group_by.loc[np.isnan(stock_data_per_date_group_by[self.get_key(param)])]))
-            temp_arr = stock_data_per_date_group_by.loc[np.isnan(stock_data_per_date_group_by[self.get_key(param)])]['ratio'].tolist()
-            for i in range(len(temp_arr)):
-                if i == 0:
-                    filled_data_arr[i] = temp_arr[i]
-                else:
-                    filled_data_arr[i] = np.std(temp_arr[:i + 1])
-            stock_data_per_date_group_by.loc[np.isnan(stock_data_per_date_group_by[self.get_key(param)]), self.get_key(param)] = filled_data_arr
+            std = warm_up_rolling_moments(stock_data_per_date_group_by['ratio'], param)['std']
+            # 和原来的计算一致，第一个点取比例本身
+            std[:1] = stock_data_per_date_group_by['ratio'].values[:1]
+            stock_data_per_date_group_by[self.get_key(param)] = std
             columns = columns + [self.get_key(param)]
         df_stock_data_per_date = stock_data_per_date_group_by[columns]
         df_stock_data_per_date['time'] = stock_data_per_date_group_by.index
@@ -2381,15 +2326,14 @@ class LargeOrderBidAskVolumeRatioFactor(TimewindowStockTickFactor):
     # @profile
     def caculate(self, data):
         columns = self.get_factor_columns(data)
-        new_data = pd.DataFrame(columns=columns)
+        result_sink = ResultSink(columns)
         product = data.iloc[0]['product']
         instrument = data.iloc[0]['instrument']
         date_list = list(set(data['date'].tolist()))
         date_list.sort()
         # 这里最小天数还需要往前扩展一个timewindow_size
         min_date = date_list[0]
-        future_instrument_config_dao = FutureInstrumentConfigDao()
-        min_date = future_instrument_config_dao.get_last_n_transaction_date(min_date, self.get_timewindow_size())
+        min_date = get_trading_calendar().get_last_n_transaction_date(min_date, self.get_timewindow_size())
         max_date = date_list[-1]
         pagination = Pagination(date_list, page_size=20)
         while pagination.has_next():
@@ -2402,14 +2346,12 @@ class LargeOrderBidAskVolumeRatioFactor(TimewindowStockTickFactor):
                 temp_cache[result[0]] = cur_date_data
             for date in date_list:
                 cur_date_data = temp_cache[date]
-                new_data = pd.concat([new_data, cur_date_data])
-        return new_data
+                result_sink.append(cur_date_data)
+        return result_sink.get_result()
 
     def get_stock_date_list_cache_by_stock_list(self, stock_list, start_date, end_date):
-        index_constituent_config_dao = IndexConstituentConfigDao()
-        result = index_constituent_config_dao.query_trading_date_by_tscode_list(stock_list, start_date, end_date)
-        index_constituent_config_dao.close()
-        return result
+        with IndexConstituentConfigDao() as index_constituent_config_dao:
+            return index_constituent_config_dao.query_trading_date_by_tscode_list(stock_list, start_date, end_date)
 
     def caculate_by_date(self, *args):
         date = args[0][0]
@@ -2424,9 +2366,9 @@ class LargeOrderBidAskVolumeRatioFactor(TimewindowStockTickFactor):
             return date, stock_data_per_date
         stock_data_per_date = stock_data_per_date.rename(columns={'time': 'cur_time'})
         # 求每个时刻上涨大单额和下跌大单额在股票维度的累加
-        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')['rising_large_amount', 'falling_large_amount'].sum()
+        stock_data_per_date_group_by = stock_data_per_date.groupby('cur_time')[['rising_large_amount', 'falling_large_amount']].sum()
         stock_data_per_date_group_by['total_large_amount'] = stock_data_per_date_group_by['falling_large_amount'] + stock_data_per_date_group_by['rising_large_amount']
-        stock_data_per_date_group_by[self.get_key()] = np.apply_along_axis(lambda item: local_divide(item[0], item[2]), axis=1, arr=stock_data_per_date_group_by.values)
+        stock_data_per_date_group_by[self.get_key()] = safe_divide(stock_data_per_date_group_by.iloc[:, 0], stock_data_per_date_group_by.iloc[:, 2])
         df_stock_data_per_date = pd.DataFrame(
             {self.get_key(): stock_data_per_date_group_by[self.get_key()],
              'time': stock_data_per_date_group_by.index})
@@ -2453,7 +2395,7 @@ class LargeOrderBidAskVolumeRatioFactor(TimewindowStockTickFactor):
         if stock_list and len(stock_list) > 0:
             stock_date_list_cache = self.get_stock_date_list_cache_by_stock_list(stock_list, min_date, max_date)
             # 过滤异常数据
-            stock_list = list(filter(lambda stock: (date + stock) not in self._invalid_set, stock_list))
+            stock_list = self._constituent_index.filter_valid_stock_list(date, stock_list)
             for stock in stock_list:
                 # get_logger().debug('Handle stock {0}'.format(stock))
                 try:
@@ -2510,14 +2452,14 @@ class LargeOrderBidAskVolumeRatioFactor(TimewindowStockTickFactor):
             amount_per_transaction = total_amount/total_transaction
             data['amount_per_transaction'] = amount_per_transaction
         else: # 没有之前的股票现货数据，取当天当前时刻之前的平均成交额
-            data['amount_per_transaction'] = np.apply_along_axis(lambda item: local_divide(item[4], item[5]),  axis=1, arr=data.values)
+            data['amount_per_transaction'] = safe_divide(data.iloc[:, 4], data.iloc[:, 5])
         data['delta_price'] = data['price'] - data['price'].shift(1)
         data.loc[data[pd.isnull(data['delta_price'])].index, 'delta_price'] = 0
         data['delta_transaction_number'] = data['transaction_number'] - data['transaction_number'].shift(1)
         data.loc[data[pd.isnull(data['delta_transaction_number'])].index, 'delta_transaction_number'] = 0
         data['rising_large_amount'] = 0
         data['falling_large_amount'] = 0
-        data['cur_amount_per_transaction'] = np.apply_along_axis(lambda item: local_divide(item[3], item[9]), axis=1, arr=data.values)
+        data['cur_amount_per_transaction'] = safe_divide(data.iloc[:, 3], data.iloc[:, 9])
         data.loc[(data['delta_price'] > 0) & (data['cur_amount_per_transaction'] > 2 * data['amount_per_transaction']), 'rising_large_amount'] = data['amount']
         data.loc[(data['delta_price'] < 0) & (data['cur_amount_per_transaction'] > 2 * data['amount_per_transaction']), 'falling_large_amount'] = data['amount']
         return data
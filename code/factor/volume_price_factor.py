@@ -1,6 +1,5 @@
 #! /usr/bin/env python
 # -*- coding:utf8 -*-
-import math
 from math import sqrt
 
 import numpy as np
@@ -11,6 +10,9 @@ from factor.base_factor import Factor
 from common.localio import read_decompress
 from factor.indicator import ATR, MovingAverage, LinearRegression, PolynomialRegression, StandardDeviation, ADX, TR, \
     Variance, Skewness, Kurtosis, WeightedMovingAverage, Median, Quantile, OBV, RSI
+from factor.kernel import safe_log, log_ratio
+from factor.rolling_extrema import rolling_max, rolling_min, RollingExtrema
+from factor.rolling_state import RingBuffer, divide, fill_nan
 
 """量价类因子
 分类编号：01
@@ -32,7 +34,9 @@ class WilliamFactor(Factor):
 
     def caculate(self, data):
         for param in self._params:
-            data[self.get_key(param)] = (data['close'] - (data['high'].rolling(window=param).max()+data['low'].rolling(window=param).min())/2)/(data['high'].rolling(window=param).max()-data['low'].rolling(window=param).min())
+            high = rolling_max(data['high'], param)
+            low = rolling_min(data['low'], param)
+            data[self.get_key(param)] = (data['close'] - (high + low)/2)/(high - low)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
@@ -53,19 +57,28 @@ class CloseMinusMovingAverageFactor(Factor):
         data = self._moving_average.enrich(data)
         data = self._atr.enrich(data)
         for param in self._params:
-            data[self.get_key(param)] = data.apply(lambda item : self.formula(item, param), axis = 1)
+            data[self.get_key(param)] = self.formula(data, param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
     
-    def formula(self, item, param):
-        moving_average_get_key = self._moving_average.get_key(param)
-        numerator = math.log((item['close'] / item[moving_average_get_key]), math.e)
-        atr_get_key = self._atr.get_key(2 * param)
-        denominator = sqrt(param) * item[atr_get_key]
-        if denominator == 0:
-            return 0
-        else:
-            return numerator/denominator
+    def formula(self, data, param):
+        numerator = log_ratio(data['close'], data[self._moving_average.get_key(param)])
+        denominator = sqrt(param) * data[self._atr.get_key(2 * param)].to_numpy()
+        return np.divide(numerator, denominator, out=np.zeros(len(data)), where=denominator != 0)
+
+    def reset_state(self):
+        self._moving_average.reset_state()
+        self._atr.reset_state()
+
+    def update(self, bar):
+        moving_average = self._moving_average.update(bar)
+        atr = self._atr.update(bar)
+        result = {}
+        for param in self._params:
+            numerator = float(log_ratio(bar['close'], moving_average[self._moving_average.get_key(param)]))
+            denominator = sqrt(param) * atr[self._atr.get_key(2 * param)]
+            result[self.get_key(param)] = fill_nan(numerator / denominator if denominator != 0 else 0)
+        return result
 
 class LinearPerAtrFactor(Factor):
     """
@@ -82,7 +95,7 @@ class LinearPerAtrFactor(Factor):
         self._linear_regression.set_caculation_func(self.caculation_function)
 
     def caculate(self, data):
-        data['log'] = data.apply(lambda item:math.log((item['open'] + item['close'] + item['high'] + item['low'])/4), axis=1)
+        data['log'] = safe_log((data['open'] + data['close'] + data['high'] + data['low'])/4)
         data = self._linear_regression.enrich(data)
         data = self._atr.enrich(data)
         for param in self._params:
@@ -90,8 +103,8 @@ class LinearPerAtrFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def caculation_function(self, model, window, variable):
-        return model.coef_
+    def caculation_function(self, result):
+        return result['slope']
 
 class LinearDeviationFactor(Factor):
     """
@@ -99,7 +112,7 @@ class LinearDeviationFactor(Factor):
     """
 
     factor_code = 'FCT_01_004_LINEAR_DEVIATION'
-    version = '1.0'
+    version = '2.0'
 
     def __init__(self, params = [10, 20, 50, 100]):
         self._params = params
@@ -113,16 +126,11 @@ class LinearDeviationFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def caculation_function(self, model, window, variable):
-        x = np.linspace(0, 1, len(window)).reshape(-1, 1)
-        estimated_values = model.predict(x)
-        estimated_value = estimated_values[-1]
-        true_value = window.tolist()[-1]
-        return (true_value - estimated_value) / self.get_standard_error(window.tolist(), estimated_values)
+    def caculation_function(self, result):
+        return (result['values'] - result['fitted']) / self.get_standard_error(result)
 
-    def get_standard_error(self, true_values, estimated_values):
-        n = len(true_values)
-        return ((((np.array(true_values) - np.array(estimated_values))**2).sum() / (n - 1)) ** 0.5) / n ** 0.5 #stardand error等于标准差除以根号n
+    def get_standard_error(self, result):
+        return result['residual_std'] / result['window'] ** 0.5 #stardand error等于标准差除以根号n
 
 class QuadraticDeviationFactor(Factor):
     """
@@ -130,7 +138,7 @@ class QuadraticDeviationFactor(Factor):
     """
 
     factor_code = 'FCT_01_005_QUADRATIC_DEVIATION'
-    version = '1.0'
+    version = '2.0'
 
     def __init__(self, params = [10, 20, 50, 100]):
         self._params = params
@@ -144,17 +152,11 @@ class QuadraticDeviationFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def caculation_function(self, model, poly, window):
-        x = np.linspace(1, len(window), len(window)).reshape(-1, 1)
-        X = poly.transform(x.reshape(-1, 1))
-        estimated_values = model.predict(X)
-        estimated_value = estimated_values[-1]
-        true_value = window.tolist()[-1]
-        return (true_value - estimated_value) / self.get_standard_error(window.tolist(), estimated_values)
+    def caculation_function(self, result):
+        return (result['values'] - result['fitted']) / self.get_standard_error(result)
 
-    def get_standard_error(self, true_values, estimated_values):
-        n = len(true_values)
-        return ((((np.array(true_values) - np.array(estimated_values))**2).sum() / (n - 1)) ** 0.5) / n ** 0.5 #stardand error等于标准差除以根号n
+    def get_standard_error(self, result):
+        return result['residual_std'] / result['window'] ** 0.5 #stardand error等于标准差除以根号n
 
 class CubicDeviationFactor(Factor):
     """
@@ -162,7 +164,7 @@ class CubicDeviationFactor(Factor):
     """
 
     factor_code = 'FCT_01_006_CUBIC_DEVIATION'
-    version = '1.0'
+    version = '2.0'
 
     def __init__(self, params = [10, 20, 50, 100]):
         self._params = params
@@ -176,17 +178,11 @@ class CubicDeviationFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def caculation_function(self, model, poly, window):
-        x = np.linspace(1, len(window), len(window)).reshape(-1, 1)
-        X = poly.transform(x.reshape(-1, 1))
-        estimated_values = model.predict(X)
-        estimated_value = estimated_values[-1]
-        true_value = window.tolist()[-1]
-        return (true_value - estimated_value) / self.get_standard_error(window.tolist(), estimated_values)
+    def caculation_function(self, result):
+        return (result['values'] - result['fitted']) / self.get_standard_error(result)
 
-    def get_standard_error(self, true_values, estimated_values):
-        n = len(true_values)
-        return ((((np.array(true_values) - np.array(estimated_values))**2).sum() / (n - 1)) ** 0.5) / n ** 0.5 #stardand error等于标准差除以根号n
+    def get_standard_error(self, result):
+        return result['residual_std'] / result['window'] ** 0.5 #stardand error等于标准差除以根号n
 
 class PriceMomentumFactor(Factor):
     """
@@ -203,17 +199,31 @@ class PriceMomentumFactor(Factor):
 
     def caculate(self, data):
         data['mean'] = (data['open'] + data['close'] + data['high'] + data['low'])/4
-        data['log2'] = data['mean'].rolling(2).apply(lambda item: self.formula(item))
+        data['log2'] = self.formula(data['mean'], 2)
         data = self._standard_deviation.enrich(data)
         for param in self._params:
-            data['log' + str(param)] = data['mean'].rolling(param).apply(lambda item: self.formula(item))
+            data['log' + str(param)] = self.formula(data['mean'], param)
             data[self.get_key(param)] = data['log' + str(param)]/(data[self._standard_deviation.get_key(self._multiplier*param)]*(param**0.5))
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def formula(self, item):
-        list = item.tolist()
-        return math.log(list[-1]/list[0])
+    def formula(self, mean, param):
+        # 窗口最后一个值和第一个值之比的对数
+        return log_ratio(mean, mean.shift(param - 1))
+
+    def reset_state(self):
+        self._standard_deviation.reset_state()
+        self._mean_buffer = RingBuffer(max(self._params + [2]))
+
+    def update(self, bar):
+        mean = (bar['open'] + bar['close'] + bar['high'] + bar['low'])/4
+        self._mean_buffer.append(mean)
+        standard_deviation = self._standard_deviation.update({'log2': float(log_ratio(mean, self._mean_buffer.get(1)))})
+        result = {}
+        for param in self._params:
+            log = float(log_ratio(mean, self._mean_buffer.get(param - 1)))
+            result[self.get_key(param)] = fill_nan(divide(log, standard_deviation[self._standard_deviation.get_key(self._multiplier*param)]*(param**0.5)))
+        return result
 
 class AdxFactor(Factor):
     """
@@ -234,6 +244,13 @@ class AdxFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
+    def reset_state(self):
+        self._adx.reset_state()
+
+    def update(self, bar):
+        adx = self._adx.update(bar)
+        return {self.get_key(param): fill_nan(adx[self._adx.get_key(param, self._adx._ext_params[0])]) for param in self._params}
+
 class MinAdxFactor(Factor):
     """
     TSSB MIN ADX HistLength MinLength 因子
@@ -249,10 +266,19 @@ class MinAdxFactor(Factor):
     def caculate(self, data):
         data = self._adx.enrich(data)
         for param in self._params:
-            data[self.get_key(param)] = data[self._adx.get_key(self._adx.get_params()[0], self._adx._ext_params[0])].rolling(param).min()
+            data[self.get_key(param)] = rolling_min(data[self._adx.get_key(self._adx.get_params()[0], self._adx._ext_params[0])], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
+    def reset_state(self):
+        self._adx.reset_state()
+        self._rolling_extrema = RollingExtrema(self._params)
+
+    def update(self, bar):
+        adx = self._adx.update(bar)[self._adx.get_key(self._adx.get_params()[0], self._adx._ext_params[0])]
+        extrema = self._rolling_extrema.update(adx)
+        return {self.get_key(param): fill_nan(extrema[param]['min']) for param in self._params}
+
 class ResidualMinAdxFactor(Factor):
     """
     TSSB RESIDUAL MIN ADX HistLength MinLength 因子
@@ -268,10 +294,19 @@ class ResidualMinAdxFactor(Factor):
     def caculate(self, data):
         data = self._adx.enrich(data)
         for param in self._params:
-            data[self.get_key(param)] = data[self._adx.get_key(self._adx.get_params()[0], self._adx._ext_params[0])] - data[self._adx.get_key(self._adx.get_params()[0], self._adx._ext_params[0])].rolling(param).min()
+            data[self.get_key(param)] = data[self._adx.get_key(self._adx.get_params()[0], self._adx._ext_params[0])] - rolling_min(data[self._adx.get_key(self._adx.get_params()[0], self._adx._ext_params[0])], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
+    def reset_state(self):
+        self._adx.reset_state()
+        self._rolling_extrema = RollingExtrema(self._params)
+
+    def update(self, bar):
+        adx = self._adx.update(bar)[self._adx.get_key(self._adx.get_params()[0], self._adx._ext_params[0])]
+        extrema = self._rolling_extrema.update(adx)
+        return {self.get_key(param): fill_nan(adx - extrema[param]['min']) for param in self._params}
+
 class MaxAdxFactor(Factor):
     """
     TSSB MAX ADX HistLength MaxLength 因子
@@ -287,7 +322,7 @@ class MaxAdxFactor(Factor):
     def caculate(self, data):
         data = self._adx.enrich(data)
         for param in self._params:
-            data[self.get_key(param)] = data[self._adx.get_key(self._adx.get_params()[0])].rolling(param).max()
+            data[self.get_key(param)] = rolling_max(data[self._adx.get_key(self._adx.get_params()[0])], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
@@ -306,7 +341,7 @@ class ResidualMaxAdxFactor(Factor):
     def caculate(self, data):
         data = self._adx.enrich(data)
         for param in self._params:
-            data[self.get_key(param)] = data[self._adx.get_key(self._adx.get_params()[0])].rolling(param).max() - data[self._adx.get_key(self._adx.get_params()[0])]
+            data[self.get_key(param)] = rolling_max(data[self._adx.get_key(self._adx.get_params()[0])], param) - data[self._adx.get_key(self._adx.get_params()[0])]
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
@@ -372,6 +407,15 @@ class IntradayIntensityFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
+    def reset_state(self):
+        self._tr.reset_state()
+        self._moving_average.reset_state()
+
+    def update(self, bar):
+        intensity = divide(bar['close'] - bar['open'], self._tr.update(bar)[self._tr.get_key()])
+        moving_average = self._moving_average.update({IntradayIntensityFactor.factor_code: intensity})
+        return {self.get_key(param): fill_nan(moving_average[self._moving_average.get_key(param)]) for param in self._params}
+
 class DeltaIntradayIntensityFactor(Factor):
     """
     TSSB DELTA INTRADAY INTENSITY HistLength DeltaLength 因子
@@ -407,7 +451,7 @@ class PriceVarianceRatioFactor(Factor):
         self._var = Variance(var_params, 'log')
 
     def caculate(self, data):
-        data['log'] = data['close'].apply(lambda item: math.log(item))
+        data['log'] = safe_log(data['close'])
         data = self._var.enrich(data)
         for param in self._params:
             data[self.get_key(param)] = data[self._var.get_key(param)]/data[self._var.get_key(self._multiplier * param)]
@@ -429,7 +473,7 @@ class MinPriceVarianceRatioFactor(Factor):
     def caculate(self, data):
         data = self._price_variance_ratio_factor.caculate(data)
         for param in self._params:
-            data[self.get_key(param)] = data[self._price_variance_ratio_factor.get_key(param)].rolling(param).min()
+            data[self.get_key(param)] = rolling_min(data[self._price_variance_ratio_factor.get_key(param)], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
@@ -449,7 +493,7 @@ class MaxPriceVarianceRatioFactor(Factor):
     def caculate(self, data):
         data = self._price_variance_ratio_factor.caculate(data)
         for param in self._params:
-            data[self.get_key(param)] = data[self._price_variance_ratio_factor.get_key(param)].rolling(param).max()
+            data[self.get_key(param)] = rolling_max(data[self._price_variance_ratio_factor.get_key(param)], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
@@ -469,7 +513,7 @@ class ChangeVarianceRatioFactor(Factor):
 
     def caculate(self, data):
         data['change'] = data['close']/data['close'].shift(1)
-        data['log'] = data['change'].apply(lambda item: math.log(item))
+        data['log'] = safe_log(data['change'])
         data = self._var.enrich(data)
         for param in self._params:
             data[self.get_key(param)] = data[self._var.get_key(param)]/data[self._var.get_key(self._multiplier * param)]
@@ -491,7 +535,7 @@ class MinChangeVarianceRatioFactor(Factor):
     def caculate(self, data):
         data = self._change_variance_ratio_factor.caculate(data)
         for param in self._params:
-            data[self.get_key(param)] = data[self._change_variance_ratio_factor.get_key(param)].rolling(param).min()
+            data[self.get_key(param)] = rolling_min(data[self._change_variance_ratio_factor.get_key(param)], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
@@ -511,7 +555,7 @@ class MaxChangeVarianceRatioFactor(Factor):
     def caculate(self, data):
         data = self._change_variance_ratio_factor.caculate(data)
         for param in self._params:
-            data[self.get_key(param)] = data[self._change_variance_ratio_factor.get_key(param)].rolling(param).max()
+            data[self.get_key(param)] = rolling_max(data[self._change_variance_ratio_factor.get_key(param)], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
@@ -536,6 +580,13 @@ class AtrRatioFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
+    def reset_state(self):
+        self._atr.reset_state()
+
+    def update(self, bar):
+        atr = self._atr.update(bar)
+        return {self.get_key(param): fill_nan(divide(atr[self._atr.get_key(param)], atr[self._atr.get_key(param * self._multiplier)])) for param in self._params}
+
 
 class DeltaPriceVarianceRatioFactor(Factor):
     """
@@ -774,6 +825,13 @@ class VolumeMomentumFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
+    def reset_state(self):
+        self._moving_average.reset_state()
+
+    def update(self, bar):
+        moving_average = self._moving_average.update(bar)
+        return {self.get_key(param): fill_nan(divide(moving_average[self._moving_average.get_key(param)], moving_average[self._moving_average.get_key(param * self._multiplier)])) for param in self._params}
+
 class DeltaVolumeMomentumFactor(Factor):
     """
     TSSB DELTA VOLUME MOMENTUM HistLen Multiplier DeltaLen 因子
@@ -810,7 +868,7 @@ class VolumeWeightedMaOverMaFactor(Factor):
         data = self._weighted_moving_average.enrich(data)
         data = self._moving_average.enrich(data)
         for param in self._params:
-            data[self.get_key(param)] = data.apply(lambda item:math.log(item[self._weighted_moving_average.get_key(param)]/item[self._moving_average.get_key(param)]), axis=1)
+            data[self.get_key(param)] = log_ratio(data[self._weighted_moving_average.get_key(param)], data[self._moving_average.get_key(param)])
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
@@ -849,16 +907,16 @@ class PriceVolumeFitFactor(Factor):
         self._linear_regression.set_caculation_func(self.caculation_function)
 
     def caculate(self, data):
-        data['log_price'] = data.apply(lambda item: math.log(item['close']), axis = 1)
-        data['log_volume'] = data.apply(lambda item: 0 if item['volume'] == 0 else math.log(item['volume']), axis = 1)
+        data['log_price'] = safe_log(data['close'])
+        data['log_volume'] = np.where(data['volume'] == 0, 0, safe_log(data['volume']))
         data = self._linear_regression.enrich(data)
         for param in self._params:
             data[self.get_key(param)] = data[self._linear_regression.get_key(param)]
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def caculation_function(self, model, window, variable):
-        return model.coef_
+    def caculation_function(self, result):
+        return result['slope']
 
 class DiffPriceVolumeFitFactor(Factor):
     """
@@ -1008,7 +1066,7 @@ class ProductPriceVolumeFactor(Factor):
 
     def caculate(self, data):
         data['change_price'] = data['close']/data['close'].shift(1)
-        data['log_price'] = data.apply(lambda item: math.log(item['change_price']), axis = 1)
+        data['log_price'] = safe_log(data['change_price'])
         data = self._volume_median.enrich(data)
         data = self._log_price_median.enrich(data)
         data = self._log_price_quantile.enrich(data)
@@ -1035,7 +1093,7 @@ class SumPriceVolumeFactor(Factor):
 
     def caculate(self, data):
         data['change_price'] = data['close']/data['close'].shift(1)
-        data['log_price'] = data.apply(lambda item: math.log(item['change_price']), axis = 1)
+        data['log_price'] = safe_log(data['change_price'])
         data = self._volume_median.enrich(data)
         data = self._log_price_median.enrich(data)
         data = self._log_price_quantile.enrich(data)
@@ -1087,6 +1145,25 @@ class DeltaSumPriceVolumeFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
+def n_day_position(lag, window):
+    """
+    TSSB N DAY系列因子，极值距离当前的bar数映射到[-50, 50]，
+    当前bar就是窗口内的极值时为50
+
+    Parameters
+    ----------
+    lag: ndarray 窗口内极值距离当前的bar数
+    window: int
+
+    Returns
+    -------
+    ndarray
+
+    """
+    n = np.where(lag == 0, window + 1, lag)
+    return 100*(n-1)/window - 50
+
+
 class NDayHighFactor(Factor):
     """
     TSSB N DAY HIGH HistLength 因子
@@ -1100,21 +1177,10 @@ class NDayHighFactor(Factor):
 
     def caculate(self, data):
         for param in self._params:
-            data[self.get_key(param)] = data['close'].rolling(param).apply(self.n_day_high)
+            data[self.get_key(param)] = n_day_position(rolling_max(data['close'], param, True)[1], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def n_day_high(self, window):
-        price_list = window.tolist()
-        cur_price = price_list[-1]
-        n = len(window) + 1
-        for i in range(len(window)):
-            print(price_list[-(i+1)])
-            if i > 0 and price_list[-(i+1)] > cur_price:
-                n = i
-                cur_price = price_list[-(i+1)]
-        return 100*(n-1)/len(window) - 50
-
 
 class NDayLowFactor(Factor):
     """
@@ -1122,34 +1188,24 @@ class NDayLowFactor(Factor):
     """
 
     factor_code = 'FCT_01_051_N_DAY_LOW'
-    version = '1.0'
+    version = '2.0'
 
     def __init__(self, params = [50, 100, 200, 500]):
         self._params = params
 
     def caculate(self, data):
         for param in self._params:
-            data[self.get_key(param)] = data['close'].rolling(param).apply(self.n_day_low)
+            data[self.get_key(param)] = n_day_position(rolling_min(data['close'], param, True)[1], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def n_day_low(self, window):
-        price_list = window.tolist()
-        cur_price = price_list[-1]
-        n = len(window) + 1
-        for i in range(len(window)):
-            if i > 0 and price_list[-(i+1)] < cur_price:
-                n = i
-                price_list[-(i + 1)] = cur_price
-        return 100*(n-1)/len(window) - 50
-
 class NDayNarrowFactor(Factor):
     """
     TSSB N DAY NARROWER HistLength 因子
     """
 
     factor_code = 'FCT_01_052_N_DAY_NARROWER'
-    version = '1.0'
+    version = '2.0'
 
     def __init__(self, params = [50, 100, 200, 500]):
         self._params = params
@@ -1158,20 +1214,10 @@ class NDayNarrowFactor(Factor):
     def caculate(self, data):
         self._tr.enrich(data)
         for param in self._params:
-            data[self.get_key(param)] = data[self._tr.get_key()].rolling(param).apply(self.n_day_narrower)
+            data[self.get_key(param)] = n_day_position(rolling_min(data[self._tr.get_key()], param, True)[1], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def n_day_narrower(self, window):
-        price_list = window.tolist()
-        cur_price = price_list[-1]
-        n = len(window) + 1
-        for i in range(len(window)):
-            if i > 0 and price_list[-(i+1)] < cur_price:
-                n = i
-                price_list[-(i + 1)] = cur_price
-        return 100*(n-1)/len(window) - 50
-
 
 class NDayWiderFactor(Factor):
     """
@@ -1179,7 +1225,7 @@ class NDayWiderFactor(Factor):
     """
 
     factor_code = 'FCT_01_053_N_DAY_WIDER'
-    version = '1.0'
+    version = '2.0'
 
     def __init__(self, params = [50, 100, 200, 500]):
         self._params = params
@@ -1188,20 +1234,10 @@ class NDayWiderFactor(Factor):
     def caculate(self, data):
         self._tr.enrich(data)
         for param in self._params:
-            data[self.get_key(param)] = data[self._tr.get_key()].rolling(param).apply(self.n_day_wider)
+            data[self.get_key(param)] = n_day_position(rolling_max(data[self._tr.get_key()], param, True)[1], param)
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def n_day_wider(self, window):
-        price_list = window.tolist()
-        cur_price = price_list[-1]
-        n = len(window) + 1
-        for i in range(len(window)):
-            if i > 0 and price_list[-(i+1)] > cur_price:
-                n = i
-                price_list[-(i + 1)] = cur_price
-        return 100*(n-1)/len(window) - 50
-
 
 class OnBalanceVolumeFactor(Factor):
     """
@@ -1217,12 +1253,22 @@ class OnBalanceVolumeFactor(Factor):
     def get_key(self):
         return self.factor_code
 
+    def get_warm_up_ticks(self):
+        # OBV是成交量的累加，依赖全部历史数据
+        return None
+
     def caculate(self, data):
         self._obv.enrich(data)
         data[self.get_key()] = data[self._obv.get_key()]
         data.loc[data[self.get_key()].isnull(), self.get_key()] = 0
         return data
 
+    def reset_state(self):
+        self._obv.reset_state()
+
+    def update(self, bar):
+        return {self.get_key(): fill_nan(self._obv.update(bar)[self._obv.get_key()])}
+
 class DeltaOnBalanceVolumeFactor(Factor):
     """
     TSSB DELTA ON BALANCE VOLUME HistLength 因子
@@ -1245,6 +1291,15 @@ class DeltaOnBalanceVolumeFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
+    def reset_state(self):
+        self._on_balance_volume_factor.reset_state()
+        self._obv_buffer = RingBuffer(max(self._params) + 1)
+
+    def update(self, bar):
+        obv = self._on_balance_volume_factor.update(bar)[self._on_balance_volume_factor.get_key()]
+        self._obv_buffer.append(obv)
+        return {self.get_key(param): fill_nan(obv - self._obv_buffer.get(param)) for param in self._params}
+
 class DetrendedRsiFactor(Factor):
     """
     TSSB DETRENDED RSI DetrendedLength DetrenderLength Lookback 因子
@@ -1280,11 +1335,8 @@ class DetrendedRsiFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
-    def caculation_function(self, model, window, variable):
-        estimated_values = model.predict(variable)
-        estimated_value = estimated_values[-1]
-        true_value = window.tolist()[-1]
-        return true_value - estimated_value
+    def caculation_function(self, result):
+        return result['values'] - result['fitted']
 
 class ThresholdRsiFactor(Factor):
     """
@@ -1312,6 +1364,18 @@ class ThresholdRsiFactor(Factor):
             data.loc[data[self.get_key(param)].isnull(), self.get_key(param)] = 0
         return data
 
+    def reset_state(self):
+        self._rsi.reset_state()
+
+    def update(self, bar):
+        rsi = self._rsi.update(bar)
+        result = {}
+        for param in self._params:
+            value = rsi[self._rsi.get_key(param)]
+            # 和caculate一致，同时满足时取-1
+            result[self.get_key(param)] = -1 if value <= self._lower else (1 if value >= self._upper else 0)
+        return result
+
 class SupportCloseThreeBollFactor(Factor):
     """
     Support close three boll 因子，来自长青账户
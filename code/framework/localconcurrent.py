@@ -2,11 +2,13 @@
 # -*- coding:utf8 -*-
 import os
 import time
+from functools import partial
 
 from multiprocessing import Pool, Manager
 from concurrent.futures import ThreadPoolExecutor, as_completed, ProcessPoolExecutor
 from common.aop import timing
 from common.localio import read_decompress
+from common.metrics import get_metrics_collector, get_metric_labels, run_with_metrics
 
 class ProcessRunner():
     """
@@ -36,9 +38,24 @@ class ProcessRunner():
     def get_results(self):
         return self._results
 
+def collect_result(result):
+    """
+    合并子进程记录的指标，返回任务结果
+
+    Parameters
+    ----------
+    result: run_with_metrics的返回值
+
+    Returns
+    -------
+
+    """
+    get_metrics_collector().merge(result[1])
+    return result[0]
+
 class ProcessExcecutor():
     """
-    异步进程执行框架2
+    异步进程执行框架2，子进程中记录的指标会合并到当前进程
     """
 
     def __init__(self, pool_size, is_async=True):
@@ -47,13 +64,41 @@ class ProcessExcecutor():
 
     def execute(self, task, list):
         with ProcessPoolExecutor(max_workers=self._pool_size) as executor:
-            ans = [executor.submit(task, i) for i in list]
+            metrics_task = partial(run_with_metrics, task, get_metric_labels())
+            ans = [executor.submit(metrics_task, i) for i in list]
             results = []
             for res in as_completed(ans):
-                results.append(res.result())
+                results.append(collect_result(res.result()))
             return results
 
 
+class PersistentProcessExecutor():
+    """
+    常驻进程池，进程只创建一次并通过initializer初始化，
+    可以在多次execute之间复用，结果按提交顺序返回，子进程中记录的指标会合并到当前进程
+    """
+
+    def __init__(self, pool_size, initializer=None, initargs=()):
+        print('Init persistent process executor for {0}'.format(pool_size))
+        self._pool_size = pool_size
+        self._executor = ProcessPoolExecutor(max_workers=pool_size, initializer=initializer, initargs=initargs)
+
+    def execute(self, task, list):
+        metrics_task = partial(run_with_metrics, task, get_metric_labels())
+        ans = [self._executor.submit(metrics_task, i) for i in list]
+        return [collect_result(res.result()) for res in ans]
+
+    def close(self):
+        print('Close persistent process executor')
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 class ThreadRunner():
     """
     异步多线程
@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# 当前进程写入但读取方可能还没有读取的共享内存，
+# Windows下所有句柄关闭后共享内存就被回收，写入方要等读取方读取完之后才能关闭
+_opened_shared_memory_list = []
+
+
+def dump_frame_to_shared_memory(data):
+    """
+    把dataframe的数值列写入共享内存，返回一个很小的描述信息用于进程间传递，
+    非数值列（如时间字符串）和索引直接放在描述信息中。
+    写入方的句柄保持打开，读取方读取完之后由写入方调用release_shared_memory关闭
+
+    Parameters
+    ----------
+    data: dataframe
+
+    Returns
+    -------
+    descriptor: dict
+
+    """
+    numeric_columns = []
+    other_columns = {}
+    total_size = 0
+    for column in data.columns:
+        if pd.api.types.is_numeric_dtype(data[column]) and not pd.api.types.is_extension_array_dtype(data[column]):
+            values = data[column].to_numpy()
+            numeric_columns.append((column, values.dtype.str, total_size))
+            total_size = total_size + values.nbytes
+        else:
+            other_columns[column] = data[column].tolist()
+    descriptor = {
+        'name': '',
+        'length': len(data),
+        'columns': data.columns.tolist(),
+        'index': data.index.tolist(),
+        'index_name': data.index.name,
+        'numeric_columns': numeric_columns,
+        'other_columns': other_columns
+    }
+    if total_size > 0:
+        shm = shared_memory.SharedMemory(create=True, size=total_size)
+        for column, dtype, offset in numeric_columns:
+            values = data[column].to_numpy()
+            target = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=offset)
+            target[:] = values
+        descriptor['name'] = shm.name
+        if os.name == 'posix':
+            # 共享内存由读取方释放，这里不再跟踪，避免进程退出时被提前回收
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        _opened_shared_memory_list.append(shm)
+    return descriptor
+
+
+def release_shared_memory():
+    """
+    关闭当前进程写入共享内存时保留的句柄，只能在读取方已经读取完之后调用
+
+    Returns
+    -------
+
+    """
+    while len(_opened_shared_memory_list) > 0:
+        _opened_shared_memory_list.pop().close()
+
+
+def load_frame_from_shared_memory(descriptor):
+    """
+    根据描述信息从共享内存还原dataframe，读取后释放共享内存
+
+    Parameters
+    ----------
+    descriptor: dict
+
+    Returns
+    -------
+    data: dataframe
+
+    """
+    data = {}
+    if descriptor['name'] != '':
+        shm = shared_memory.SharedMemory(name=descriptor['name'])
+        try:
+            for column, dtype, offset in descriptor['numeric_columns']:
+                data[column] = np.ndarray((descriptor['length'],), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+    data.update(descriptor['other_columns'])
+    index = pd.Index(descriptor['index'], name=descriptor['index_name'])
+    return pd.DataFrame(data, columns=descriptor['columns'], index=index)
+
+
+if __name__ == '__main__':
+    df = pd.DataFrame({'a': [1.0, 2.0], 'b': [1, 2], 'time': ['09:30:00.000', '09:30:03.000']})
+    print(load_frame_from_shared_memory(dump_frame_to_shared_memory(df)))
+    release_shared_memory()
@@ -0,0 +1,396 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+parentdir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, parentdir)
+# 和单元测试共用的随机数据
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_data import get_second, format_second, create_bar_data, create_raw_stock_tick_data
+
+"""
+离线性能基准：
+用固定随机种子生成股票tick、期货tick和3秒k线数据，不依赖生产数据、数据库和网络，
+对数据处理、因子计算、文件读写和回测的关键路径计时，结果保存为json，可以和基线结果比较
+
+运行：python benchmark.py run -o result.json
+比较：python benchmark.py compare baseline.json result.json -t 0.2
+"""
+
+BENCHMARK_DATE = '2022-06-20'
+BENCHMARK_PRODUCT = 'IF'
+BENCHMARK_INSTRUMENT = 'IF2207'
+
+
+def create_second_list(start, end, interval=3):
+    """
+    交易时间内的秒数，去掉午休
+
+    Parameters
+    ----------
+    start: string HH:MM:SS
+    end: string HH:MM:SS
+    interval: int
+
+    Returns
+    -------
+    ndarray
+
+    """
+    seconds = np.arange(get_second(start), get_second(end) + 1, interval)
+    return seconds[(seconds <= get_second('11:30:00')) | (seconds >= get_second('13:00:00'))]
+
+
+def create_stock_tick_data(date, stock, seed):
+    """
+    股票tick数据，列和StockTickDataColumnTransform一致，
+    时间在3秒网格上，部分快照提前1到2秒，价格是随机游走
+
+    Parameters
+    ----------
+    date
+    stock
+    seed
+
+    Returns
+    -------
+
+    """
+    from data.process import StockTickDataColumnTransform
+    rng = np.random.default_rng(seed)
+    seconds = create_second_list('09:15:00', '15:00:00')
+    seconds = seconds[rng.random(len(seconds)) < 0.95]
+    seconds = seconds - np.where(rng.random(len(seconds)) < 0.1, rng.integers(1, 3, len(seconds)), 0)
+    seconds = np.unique(seconds)
+    n = len(seconds)
+    close = 10 + rng.random() * 50
+    price = np.round(close * np.exp(np.cumsum(rng.normal(0, 0.0005, n))), 2)
+    volume = rng.integers(0, 50, n) * 100
+    amount = volume * price
+    data = {
+        'tscode': stock,
+        'exchange_tscode': stock + '.SZ',
+        'date': date.replace('-', ''),
+        'time': format_second(seconds),
+        'price': price,
+        'volume': volume,
+        'amount': amount,
+        'transaction_number': rng.integers(0, 20, n),
+        'iopv': 0.0,
+        'transaction_flag': '',
+        'bs_flag': '',
+        'daily_accumulated_volume': np.cumsum(volume),
+        'daily_amount': np.cumsum(amount),
+        'high': np.maximum.accumulate(price),
+        'low': np.minimum.accumulate(price),
+        'open': price[0],
+        'close': close
+    }
+    for i in range(1, 11):
+        data['ask_price' + str(i)] = np.round(price + 0.01 * i, 2)
+    for i in range(1, 11):
+        data['ask_volume' + str(i)] = rng.integers(1, 100, n) * 100
+    for i in range(1, 11):
+        data['bid_price' + str(i)] = np.round(price - 0.01 * i, 2)
+    for i in range(1, 11):
+        data['bid_volume' + str(i)] = rng.integers(1, 100, n) * 100
+    data['weighted_average_ask_price'] = price + 0.05
+    data['weighted_average_bid_price'] = price - 0.05
+    data['total_ask_volume'] = rng.integers(1, 1000, n) * 100
+    data['total_bid_volume'] = rng.integers(1, 1000, n) * 100
+    data['unwighted_index'] = 0.0
+    data['total_varieties'] = 0
+    data['total_increase_varieties'] = 0
+    data['total_falling_varieties'] = 0
+    data['total_equal_varieties'] = 0
+    return pd.DataFrame(data, columns=StockTickDataColumnTransform().get_columns())
+
+
+def create_future_tick_data(date, seed):
+    """
+    期货原始tick数据，每秒两笔，用于生成3秒k线
+
+    Parameters
+    ----------
+    date
+    seed
+
+    Returns
+    -------
+
+    """
+    rng = np.random.default_rng(seed)
+    seconds = np.repeat(create_second_list('09:29:00', '15:00:00', 1), 2) + np.tile([0, 0.5], len(create_second_list('09:29:00', '15:00:00', 1)))
+    n = len(seconds)
+    datetime_list = list(map(lambda second: date + ' {0:02d}:{1:02d}:{2:02d}.{3:09d}'.format(
+        int(second) // 3600, int(second) % 3600 // 60, int(second) % 60, int(round((second - int(second)) * 1000000000))), seconds))
+    return pd.DataFrame({
+        'datetime': datetime_list,
+        'last_price': 4000 + np.round(np.cumsum(rng.normal(0, 0.5, n)), 1),
+        'volume': np.cumsum(rng.integers(0, 3, n)),
+        'open_interest': 100000 + np.cumsum(rng.integers(-5, 6, n)).astype('float64'),
+        'date': date
+    })
+
+
+def create_future_bar_data(date_list, seed, product=BENCHMARK_PRODUCT, instrument=BENCHMARK_INSTRUMENT):
+    """
+    整理后的期货3秒k线，列和因子计算的输入一致
+
+    Parameters
+    ----------
+    date_list
+    seed
+    product
+    instrument
+
+    Returns
+    -------
+
+    """
+    seconds = create_second_list('09:30:00', '15:00:00')
+    datetime_list = []
+    for date in date_list:
+        datetime_list = datetime_list + list(map(lambda time: date + ' ' + time, format_second(seconds, '')))
+    data = create_bar_data(len(datetime_list), seed, scale=0.5, noise=0.3, decimals=1, max_volume=50)
+    data.insert(0, 'datetime', datetime_list)
+    data['date'] = data['datetime'].str[0:10]
+    data['product'] = product
+    data['instrument'] = instrument
+    return data
+
+
+def create_date_list(n):
+    return list(map(lambda date: date.strftime('%Y-%m-%d'), pd.bdate_range(BENCHMARK_DATE, periods=n)))
+
+
+class SyntheticStockDataAccess():
+    """
+    和StockDataAccess接口一致，返回生成的股票数据
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    def access(self, *args):
+        date = args[0]
+        stock = args[1]
+        columns = args[2] if len(args) > 2 else []
+        if (date, stock) not in self._cache:
+            self._cache[(date, stock)] = create_stock_tick_data(date, stock, int(date.replace('-', '')) + int(stock))
+        data = self._cache[(date, stock)]
+        return data.loc[:, columns] if len(columns) > 0 else data.copy()
+
+
+def install_constituent_index(stock_count):
+    """
+    用生成的成分股替换进程内的成分股索引，因子初始化时不需要读取配置文件和数据库
+
+    Parameters
+    ----------
+    stock_count
+
+    Returns
+    -------
+
+    """
+    from data import constituent
+    stock_list = list(map(lambda i: '{0:06d}'.format(i + 1), range(stock_count)))
+    stocks_abstract = {'20100101_20301231': stock_list}
+    constituent.constituent_index = constituent.ConstituentIndex({product: stocks_abstract for product in constituent.STOCKS_ABSTRACT_FILE_DICT.keys()})
+
+
+def benchmark_stock_tick_factor(factor_class, stock_count):
+    install_constituent_index(stock_count)
+    factor = factor_class()
+    factor._data_access = SyntheticStockDataAccess()
+    # 数据预先生成，只统计因子计算
+    for stock in factor.get_stock_list_by_date(BENCHMARK_PRODUCT, BENCHMARK_DATE):
+        factor._data_access.access(BENCHMARK_DATE, stock)
+    return lambda: factor.caculate_by_date([BENCHMARK_DATE, BENCHMARK_INSTRUMENT, BENCHMARK_PRODUCT])
+
+
+def benchmark_volume_price_factor(factor_class, params, day_count):
+    factor = factor_class(params)
+    data = create_future_bar_data(create_date_list(day_count), 2023)
+    return lambda: factor.caculate(data.copy())
+
+
+def benchmark_future_tick_processor(day_count):
+    from data.process import FutureTickDataProcessorPhase1
+    data = pd.concat(list(map(lambda date: create_future_tick_data(date, int(date.replace('-', ''))), create_date_list(day_count))), ignore_index=True)
+    return lambda: FutureTickDataProcessorPhase1().process(data.copy())
+
+
+def benchmark_stock_tick_enricher(stock_count):
+    from data.process import StockTickDataEnricher
+    data_list = list(map(lambda i: create_stock_tick_data(BENCHMARK_DATE, '{0:06d}'.format(i + 1), i), range(stock_count)))
+    return lambda: list(map(lambda data: StockTickDataEnricher().process(data.copy()), data_list))
+
+
+def benchmark_stock_tick_cleaner(row_count):
+    from data.process import StockTickDataCleaner
+    data = create_raw_stock_tick_data(2023, row_count)
+    return lambda: StockTickDataCleaner().process(data.copy())
+
+
+def benchmark_compress_io(day_count):
+    from common.localio import read_decompress, save_compress
+    data = create_future_bar_data(create_date_list(day_count), 2023)
+    path = tempfile.mkdtemp() + os.path.sep + 'benchmark.pkl'
+    def run():
+        save_compress(data, path)
+        return read_decompress(path)
+    return run
+
+
+def benchmark_back_test(day_count):
+    from mlearn.model_evaluation import BackTestEvaluator
+    class Config():
+        def get_target(self):
+            return 'ret.10'
+    data_list = []
+    for i, product in enumerate(['IC', 'IH', 'IF']):
+        data = create_future_bar_data(create_date_list(day_count), i, product, product + '2207')
+        rng = np.random.default_rng(i)
+        data['ret.10'] = rng.normal(0, 0.001, len(data))
+        data['predict_y'] = data['ret.10'] + rng.normal(0, 0.001, len(data))
+        data_list.append(data[['datetime', 'product', 'predict_y', 'ret.10']])
+    evaluator = BackTestEvaluator('benchmark', '1.0', pd.concat(data_list, ignore_index=True), Config(), None)
+    return evaluator.caculate_backtest_result
+
+
+def get_benchmark_list():
+    """
+    所有基准，(名称, 准备函数)，准备函数返回被计时的函数
+
+    Returns
+    -------
+
+    """
+    from factor.spot_goods_factor import TotalCommissionRatioFactor, SpreadFactor
+    from factor.volume_price_factor import CloseMinusMovingAverageFactor, LinearDeviationFactor, QuadraticDeviationFactor, AdxFactor, PriceVarianceRatioFactor
+    benchmark_list = [
+        ('stock_tick_factor.total_commission_ratio', lambda: benchmark_stock_tick_factor(TotalCommissionRatioFactor, 50)),
+        ('stock_tick_factor.spread', lambda: benchmark_stock_tick_factor(SpreadFactor, 50))
+    ]
+    for factor_class in [CloseMinusMovingAverageFactor, LinearDeviationFactor, QuadraticDeviationFactor, AdxFactor, PriceVarianceRatioFactor]:
+        for params in [[10], [100], [1000]]:
+            benchmark_list.append(('volume_price_factor.{0}.{1}'.format(factor_class.__name__, params[0]),
+                                   (lambda factor_class, params: lambda: benchmark_volume_price_factor(factor_class, params, 20))(factor_class, params)))
+    benchmark_list = benchmark_list + [
+        ('process.future_tick_processor_phase1', lambda: benchmark_future_tick_processor(5)),
+        ('process.stock_tick_enricher', lambda: benchmark_stock_tick_enricher(20)),
+        ('process.stock_tick_cleaner', lambda: benchmark_stock_tick_cleaner(50000)),
+        ('localio.save_and_read_compress', lambda: benchmark_compress_io(20)),
+        ('mlearn.back_test', lambda: benchmark_back_test(20))
+    ]
+    return benchmark_list
+
+
+def run_benchmark(name_filter='', repeat=3):
+    """
+    运行基准，单个基准失败时记录错误并继续
+
+    Parameters
+    ----------
+    name_filter: string 只运行名称包含该字符串的基准
+    repeat: int 重复次数
+
+    Returns
+    -------
+    dict
+
+    """
+    result = {
+        'meta': {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'repeat': repeat
+        },
+        'benchmarks': {}
+    }
+    for name, prepare in get_benchmark_list():
+        if name_filter not in name:
+            continue
+        try:
+            func = prepare()
+            cost_list = []
+            for i in range(repeat):
+                start_time = time.perf_counter()
+                func()
+                cost_list.append(time.perf_counter() - start_time)
+            result['benchmarks'][name] = {'status': 'ok', 'min': min(cost_list), 'median': statistics.median(cost_list)}
+        except Exception as e:
+            result['benchmarks'][name] = {'status': 'error', 'error': '{0}: {1}'.format(type(e).__name__, str(e))}
+        print('{0}: {1}'.format(name, result['benchmarks'][name]))
+    return result
+
+
+def compare_benchmark(baseline, current, threshold=0.2):
+    """
+    和基线比较，最小耗时增加超过threshold的记为退化
+
+    Parameters
+    ----------
+    baseline: dict
+    current: dict
+    threshold: float
+
+    Returns
+    -------
+    list: 退化的基准名称
+
+    """
+    regression_list = []
+    for name, item in current['benchmarks'].items():
+        base_item = baseline['benchmarks'].get(name)
+        if base_item is None or base_item['status'] != 'ok' or item['status'] != 'ok':
+            print('{0:<60} skipped'.format(name))
+            continue
+        ratio = item['min'] / base_item['min']
+        is_regression = ratio > 1 + threshold
+        if is_regression:
+            regression_list.append(name)
+        print('{0:<60} {1:>10.4f} {2:>10.4f} {3:>8.2f}x {4}'.format(name, base_item['min'], item['min'], ratio, 'REGRESSION' if is_regression else ''))
+    return regression_list
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmark')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='Run benchmarks')
+    run_parser.add_argument('--output', '-o', type=str, default='benchmark.json', help='Result json file')
+    run_parser.add_argument('--filter', '-k', type=str, default='', help='Only run benchmarks whose name contains the string')
+    run_parser.add_argument('--repeat', '-r', type=int, default=3, help='Repeat times')
+    compare_parser = subparsers.add_parser('compare', help='Compare with baseline')
+    compare_parser.add_argument('baseline', type=str, help='Baseline json file')
+    compare_parser.add_argument('current', type=str, help='Current json file')
+    compare_parser.add_argument('--threshold', '-t', type=float, default=0.2, help='Allowed slowdown ratio')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        result = run_benchmark(args.filter, args.repeat)
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r') as f:
+            current = json.load(f)
+        sys.exit(1 if len(compare_benchmark(baseline, current, args.threshold)) > 0 else 0)
@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+# -*- coding:utf8 -*-
+import numpy as np
+import pandas as pd
+
+"""
+单元测试和性能基准共用的随机数据，固定随机种子，不依赖测试文件和生产数据
+"""
+
+def get_second(time):
+    return int(time[0:2]) * 3600 + int(time[3:5]) * 60 + int(time[6:8])
+
+
+def format_second(seconds, suffix='.000'):
+    return list(map(lambda second: '{0:02d}:{1:02d}:{2:02d}{3}'.format(second // 3600, second % 3600 // 60, second % 60, suffix), seconds))
+
+
+def create_bar_data(n, seed=2023, scale=2, noise=1, decimals=None, flat_slice=None, max_volume=100):
+    """
+    随机游走的k线，open在close附近波动，high不低于open和close，low不高于open和close
+
+    Parameters
+    ----------
+    n: int 行数
+    seed: int
+    scale: float close每个bar变化的标准差
+    noise: float open，high，low和close偏离的标准差
+    decimals: int 价格保留的小数位数，为None时不取整，取整后窗口内会出现重复的极值
+    flat_slice: slice 这段close和前一个bar相同，构造持平的价格
+    max_volume: int
+
+    Returns
+    -------
+    dataframe: open，close，high，low，volume，interest
+
+    """
+    rng = np.random.default_rng(seed)
+    round_price = (lambda price: price) if decimals is None else (lambda price: np.round(price, decimals))
+    close = round_price(4000 + np.cumsum(rng.normal(0, scale, n)))
+    if flat_slice is not None:
+        close[flat_slice] = close[flat_slice.start - 1]
+    open = round_price(close + rng.normal(0, noise, n))
+    high = np.maximum(open, close) + round_price(np.abs(rng.normal(0, noise, n)))
+    low = np.minimum(open, close) - round_price(np.abs(rng.normal(0, noise, n)))
+    return pd.DataFrame({
+        'open': open,
+        'close': close,
+        'high': high,
+        'low': low,
+        'volume': rng.integers(0, max_volume, n).astype('float64'),
+        'interest': 100000 + np.cumsum(rng.integers(-5, 6, n)).astype('float64')
+    })
+
+
+def create_raw_stock_tick_data(seed, n=5000):
+    """
+    清洗前的股票tick数据，大量重复时间，部分成交量和价格为0，包含一个非法时间和一个空的价格
+
+    Parameters
+    ----------
+    seed
+    n: int 行数
+
+    Returns
+    -------
+
+    """
+    rng = np.random.default_rng(seed)
+    seconds = np.sort(rng.integers(get_second('09:00:00'), get_second('15:30:00'), n))
+    seconds = np.repeat(seconds, rng.integers(1, 4, n))[0:n]
+    times = format_second(seconds)
+    times[10] = '0::.0'
+    data = pd.DataFrame({
+        'tscode': '000028.SZ',
+        'time': times,
+        'price': rng.integers(0, 3, n) * 10.0,
+        'volume': rng.integers(0, 3, n) * rng.integers(0, 2, n) * 100,
+        'transaction_number': rng.integers(0, 3, n),
+        'iopv': 0.0,
+        'total_varieties': 0,
+        'total_increase_varieties': 0,
+        'total_falling_varieties': 0,
+        'total_equal_varieties': 0
+    })
+    data.loc[n // 2, 'price'] = np.nan
+    return data
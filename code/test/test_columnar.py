@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+import pandas as pd
+import numpy as np
+
+from data.columnar import StockTickColumnarStore, open_column
+
+"""
+列式存储测试，写入临时目录后读取，比较列的类型和空值，不依赖测试文件
+"""
+
+@pytest.fixture()
+def init_data():
+    stock_data_dict = {
+        '000001': pd.DataFrame({
+            'tscode': ['000001', '000001', '000001'],
+            'time': ['09:30:00', None, '09:30:06'],
+            'datetime': pd.to_datetime(['2017-11-06 09:30:00', None, '2017-11-06 09:30:06']),
+            'price': [10.1, np.nan, 10.2],
+            'volume': [100, 200, 300]
+        }),
+        '000002': pd.DataFrame({
+            'tscode': ['000002', '000002'],
+            'time': ['09:30:03', '09:30:09'],
+            'datetime': pd.to_datetime(['2017-11-06 09:30:03', '2017-11-06 09:30:09']),
+            'price': [20.1, 20.2],
+            'volume': [10, 20]
+        })
+    }
+    return stock_data_dict
+
+
+def test_round_trip(tmp_path, init_data):
+    store = StockTickColumnarStore(str(tmp_path) + os.path.sep)
+    store.write('20171106', init_data)
+    assert store.has_date('20171106')
+    assert sorted(store.get_stock_list('20171106')) == ['000001', '000002']
+    for stock, expected in init_data.items():
+        data = store.read('20171106', stock)
+        assert list(data.columns) == list(expected.columns)
+        assert data['time'].isnull().tolist() == expected['time'].isnull().tolist()
+        assert data['time'].dropna().tolist() == expected['time'].dropna().tolist()
+        assert data['datetime'].dtype == expected['datetime'].dtype
+        assert data['datetime'].isnull().tolist() == expected['datetime'].isnull().tolist()
+        assert data['volume'].dtype == expected['volume'].dtype
+        assert np.allclose(data['price'].values, expected['price'].values, equal_nan=True)
+    # 只读取需要的列
+    data = store.read('20171106', '000002', ['time', 'price'])
+    assert list(data.columns) == ['time', 'price']
+    with pytest.raises(FileNotFoundError):
+        store.read('20171106', '000003')
+
+
+def test_reuse_column_file(tmp_path, init_data):
+    store = StockTickColumnarStore(str(tmp_path) + os.path.sep)
+    store.write('20171106', init_data)
+    store.read('20171106', '000001', ['price'])
+    hits = open_column.cache_info().hits
+    store.read('20171106', '000002', ['price'])
+    assert open_column.cache_info().hits == hits + 1
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_columnar.py"])
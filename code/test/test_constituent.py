@@ -0,0 +1,64 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from data.constituent import ConstituentIndex, get_constituent_index
+from factor.base_factor import init_stock_tick_worker
+
+"""
+成分股索引测试，和原来遍历摘要key和拼接字符串过滤的结果比较
+"""
+
+@pytest.fixture()
+def init_abstract():
+    stocks_abstract = {
+        '20220101_20220331': ['600519', '000001', '601318'],
+        '20220601_20221231': ['600519', '601318', '300750'],
+        '20220401_20220531': ['600519', '000001', '300750']
+    }
+    invalid_list = [('2022-02-07', '000001'), ('2022-06-20', '300750'), ('2022-06-20', '688981')]
+    return stocks_abstract, invalid_list
+
+
+def get_stock_list_by_loop(stocks_abstract, date):
+    date = date.replace('-', '')
+    for key in stocks_abstract.keys():
+        start_date = key.split('_')[0]
+        end_date = key.split('_')[1]
+        if date >= start_date and date <= end_date:
+            return stocks_abstract[key]
+
+
+def test_constituent_index(init_abstract):
+    stocks_abstract, invalid_list = init_abstract
+    constituent_index = ConstituentIndex({'IF': stocks_abstract}, invalid_list)
+    invalid_set = set(map(lambda invalid: invalid[0] + invalid[1], invalid_list))
+    for date in ['2021-12-31', '2022-01-01', '2022-02-07', '2022-03-31', '2022-04-01', '2022-05-31', '2022-06-20', '2022-12-31', '2023-01-01']:
+        stock_list = constituent_index.get_stock_list('IF', date)
+        assert stock_list == get_stock_list_by_loop(stocks_abstract, date)
+        assert constituent_index.get_stock_list('IF', date.replace('-', '')) == stock_list
+        if stock_list:
+            expected = list(filter(lambda stock: (date + stock) not in invalid_set, stock_list))
+            assert constituent_index.filter_valid_stock_list(date, stock_list) == expected
+            assert constituent_index.filter_valid_stock_list(date, stock_list + ['688981']) == list(filter(lambda stock: (date + stock) not in invalid_set, stock_list + ['688981']))
+    assert not constituent_index.is_valid('2022-02-07', '000001')
+    assert constituent_index.is_valid('2022-02-08', '000001')
+
+
+def get_stock_list_in_worker(date):
+    return get_constituent_index().get_stock_list('IF', date)
+
+
+def test_constituent_index_in_spawned_worker(init_abstract):
+    stocks_abstract, invalid_list = init_abstract
+    constituent_index = ConstituentIndex({'IF': stocks_abstract}, invalid_list)
+    # spawn启动的子进程不继承父进程的全局变量，索引通过initializer传入，不会重新加载
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'), initializer=init_stock_tick_worker,
+                             initargs=([], constituent_index)) as executor:
+        assert executor.submit(get_stock_list_in_worker, '2022-06-20').result() == constituent_index.get_stock_list('IF', '2022-06-20')
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_constituent.py"])
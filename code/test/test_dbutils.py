@@ -0,0 +1,68 @@
+import os
+import multiprocessing
+
+import pytest
+
+from sqlalchemy import text
+
+from common.persistence import dbutils
+from common.persistence.dao import BaseDao
+
+"""
+数据库engine和会话复用测试，用sqlite代替mysql
+"""
+
+@pytest.fixture()
+def init_engine(tmp_path, monkeypatch):
+    dbutils.dispose_engine()
+    monkeypatch.setattr(dbutils, 'DB_CONNECTION', 'sqlite:///' + str(tmp_path / 'test.db'))
+    with dbutils.session_scope() as session:
+        session.execute(text('create table future_instrument_config (product varchar(10), instrument varchar(10), date varchar(10), is_main int)'))
+    yield
+    dbutils.dispose_engine()
+
+
+def is_engine_rebuilt():
+    inherited_engine = dbutils.engine_registry['registry']['engine']
+    with dbutils.session_scope() as session:
+        count = session.execute(text('select count(*) from future_instrument_config')).fetchall()[0][0]
+    return dbutils.get_engine() is not inherited_engine and dbutils.engine_registry['registry']['pid'] == os.getpid() and count == 1
+
+
+def test_engine_reuse(init_engine):
+    engine = dbutils.get_engine()
+    assert dbutils.get_engine() is engine
+    # 会话不共享，关闭一个会话不影响其他会话中未提交的数据
+    session = dbutils.create_session()
+    other_session = dbutils.create_session()
+    assert session is not other_session
+    session.execute(text("insert into future_instrument_config values ('IF', 'IF2201', '2022-01-03', 0)"))
+    other_session.close()
+    session.commit()
+    session.execute(text("delete from future_instrument_config"))
+    session.commit()
+    session.close()
+    with dbutils.session_scope() as session:
+        session.execute(text("insert into future_instrument_config values ('IF', 'IF2201', '2022-01-04', 0)"))
+    # 结束时关闭会话，连接归还连接池
+    assert dbutils.get_engine().pool.checkedout() == 0
+    with pytest.raises(ValueError):
+        with dbutils.session_scope() as session:
+            session.execute(text("insert into future_instrument_config values ('IF', 'IF2201', '2022-01-05', 0)"))
+            raise ValueError()
+    with dbutils.session_scope() as session:
+        assert session.execute(text('select count(*) from future_instrument_config')).fetchall()[0][0] == 1
+    # DAO结束使用时关闭自己的会话
+    with BaseDao() as dao:
+        assert dao._session.execute(text('select count(*) from future_instrument_config')).fetchall()[0][0] == 1
+        assert dbutils.get_engine().pool.checkedout() == 1
+    assert dbutils.get_engine().pool.checkedout() == 0
+    # fork出的子进程重建engine
+    with multiprocessing.get_context('fork').Pool(1) as pool:
+        assert pool.apply(is_engine_rebuilt)
+    assert dbutils.get_engine() is engine
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_dbutils.py"])
@@ -0,0 +1,101 @@
+import pytest
+from contextlib import contextmanager
+
+import pandas as pd
+import numpy as np
+
+from common.constants import FUTURE_TICK_COUNT_PER_DAY
+from factor import factor_caculator
+from factor.factor_caculator import FactorCaculator, get_warm_up_days, get_redo_days
+from factor.volume_price_factor import CloseMinusMovingAverageFactor, OnBalanceVolumeFactor
+
+"""
+因子增量计算测试，期货数据随机生成，主力合约区间不查询数据库
+"""
+
+DATE_LIST = ['2022-11-01', '2022-11-02', '2022-11-03', '2022-11-04', '2022-11-07', '2022-11-08']
+
+
+class CountingFactor(CloseMinusMovingAverageFactor):
+    caculate_count = 0
+
+    def caculate(self, data):
+        CountingFactor.caculate_count = CountingFactor.caculate_count + 1
+        return CloseMinusMovingAverageFactor.caculate(self, data)
+
+
+class DateRangeResult():
+
+    def __init__(self, date_range):
+        self._date_range = date_range
+
+    def fetchall(self):
+        return [self._date_range]
+
+
+class DateRangeSession():
+    """只返回主力合约区间的会话"""
+
+    def __init__(self, date_range_dict):
+        self._date_range_dict = date_range_dict
+
+    def execute(self, sql, params):
+        return DateRangeResult(self._date_range_dict.get(params['instrument'], (None, None)))
+
+    @contextmanager
+    def scope(self):
+        yield self
+
+
+@pytest.fixture()
+def init_data(monkeypatch):
+    rng = np.random.default_rng(2023)
+    data_list = []
+    for date in DATE_LIST:
+        datetime = pd.date_range(date + ' 09:30:00', periods=100, freq='3s').strftime('%Y-%m-%d %H:%M:%S.000000000')
+        close = 4000 + np.cumsum(rng.normal(0, 1, 100))
+        data_list.append(pd.DataFrame({'datetime': datetime, 'open': close, 'close': close, 'high': close + 1, 'low': close - 1, 'volume': 1.0}))
+    data = pd.concat(data_list, ignore_index=True)
+    # IF2212在2022-11-02到2022-11-04是主力合约，IF2303没有做过主力合约
+    session = DateRangeSession({'IF2212': ('2022-11-02', '2022-11-04')})
+    monkeypatch.setattr(factor_caculator, 'session_scope', session.scope)
+    monkeypatch.setattr(factor_caculator, 'read_decompress', lambda path: data.copy())
+    CountingFactor.caculate_count = 0
+    return data
+
+
+def test_warm_up_days():
+    # 整理后的期货数据为3秒一个bar
+    assert FUTURE_TICK_COUNT_PER_DAY == 4800
+    assert get_warm_up_days([CloseMinusMovingAverageFactor([20, 50])]) == 1
+    assert get_warm_up_days([CloseMinusMovingAverageFactor([20]), CloseMinusMovingAverageFactor([4800])]) == 2
+    assert get_warm_up_days([CloseMinusMovingAverageFactor([20]), OnBalanceVolumeFactor()]) is None
+    assert get_redo_days([CloseMinusMovingAverageFactor([20])]) == 1
+
+
+def test_caculate_by_instrument(init_data):
+    caculator = FactorCaculator()
+    factor_list = [CountingFactor([10])]
+    # 全量计算只保留主力合约区间
+    instrument, data = caculator.caculate_by_instrument([factor_list, 'IF2212', 'IF'])
+    assert sorted(data['date'].unique().tolist()) == DATE_LIST[1:4]
+    assert CountingFactor.caculate_count == 1
+    # 已有数据到主力合约区间的最后一天，之后的日期不需要计算
+    instrument, data = caculator.caculate_by_instrument([factor_list, 'IF2212', 'IF', '2022-11-04'])
+    assert len(data) == 0 and CountingFactor.caculate_count == 1
+    # 重新计算最后一天和新的日期，用之前的数据预热
+    instrument, data = caculator.caculate_by_instrument([factor_list, 'IF2212', 'IF', '2022-11-03'])
+    assert sorted(data['date'].unique().tolist()) == ['2022-11-03', '2022-11-04']
+    assert CountingFactor.caculate_count == 2
+    expected = CountingFactor([10]).caculate(init_data.assign(date=init_data['datetime'].str[0:10], product='IF', instrument='IF2212'))
+    key = CountingFactor([10]).get_key(10)
+    assert np.allclose(data[key].values, expected.loc[data.index, key].values)
+    # 没有做过主力合约的合约不计算
+    CountingFactor.caculate_count = 0
+    instrument, data = caculator.caculate_by_instrument([factor_list, 'IF2303', 'IF'])
+    assert len(data) == 0 and CountingFactor.caculate_count == 0
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_factor_caculator.py"])
@@ -0,0 +1,120 @@
+import pytest
+
+import pandas as pd
+import numpy as np
+
+from data import constituent
+from data.constituent import ConstituentIndex
+from factor.base_factor import StockTickFactor, StockTickDifferenceFactor, StockTickMeanFactor
+from factor.factor_dependency import sort_by_dependency, prepare_target_factor_data, get_target_factor_cache
+
+"""
+衍生因子依赖测试，目标因子数据随机生成，不读取因子文件
+"""
+
+class RatioFactor(StockTickFactor):
+    factor_code = 'FCT_99_001_RATIO'
+    version = '1.0'
+    load_count = 0
+
+    def __init__(self, data=None):
+        StockTickFactor.__init__(self)
+        self._data = data
+
+    def get_key(self):
+        return self.factor_code
+
+    def load(self, product, is_organized=False, instrument_list=[], date_list=[], start_date='', end_date=''):
+        RatioFactor.load_count = RatioFactor.load_count + 1
+        return self._data
+
+
+class RatioDifferenceFactor(StockTickDifferenceFactor):
+    factor_code = 'FCT_99_002_RATIO_DIFFERENCE'
+    version = '1.0'
+
+    def __init__(self, params, target_factor):
+        StockTickFactor.__init__(self)
+        self._params = params
+        self._target_factor = target_factor
+
+    def get_target_factor(self):
+        return self._target_factor
+
+
+class RatioMeanFactor(StockTickMeanFactor):
+    factor_code = 'FCT_99_003_RATIO_MEAN'
+    version = '1.0'
+
+    def __init__(self, params, target_factor):
+        StockTickFactor.__init__(self)
+        self._params = params
+        self._target_factor = target_factor
+
+    def get_target_factor(self):
+        return self._target_factor
+
+
+@pytest.fixture()
+def init_data(monkeypatch):
+    monkeypatch.setattr(constituent, 'constituent_index', ConstituentIndex({}))
+    RatioFactor.load_count = 0
+    rng = np.random.default_rng(2023)
+    data_list = []
+    for date in ['2022-01-04', '2022-01-05', '2022-01-06']:
+        data_list.append(pd.DataFrame({
+            'datetime': [date + ' 09:30:{:02d}.000'.format(i) for i in range(50)],
+            'date': date,
+            'product': 'IF',
+            'instrument': 'IF2201',
+            RatioFactor.factor_code: rng.normal(0, 1, 50)
+        }))
+    yield pd.concat(data_list, ignore_index=True)
+    get_target_factor_cache().clear()
+
+
+def caculate_difference_by_mask(original_data, date_list, param):
+    result_list = []
+    for date in date_list:
+        temp_data = original_data[original_data['date'] == date]
+        value = temp_data[RatioFactor.factor_code]
+        result_list.append((value - value.shift(param)).fillna(value - value.iloc[0]))
+    return pd.concat(result_list)
+
+
+def test_sort_by_dependency(init_data):
+    target_factor = RatioFactor()
+    difference_factor = RatioDifferenceFactor([5], target_factor)
+    mean_factor = RatioMeanFactor([5], target_factor)
+    factor_list = sort_by_dependency([mean_factor, target_factor, difference_factor])
+    assert factor_list == [target_factor, mean_factor, difference_factor]
+    # 目标因子不在计算链中时保持原来的顺序
+    assert sort_by_dependency([mean_factor, difference_factor]) == [mean_factor, difference_factor]
+
+
+def test_target_factor_data(init_data):
+    target_factor = RatioFactor(init_data)
+    factor_list = [RatioDifferenceFactor([5], target_factor), RatioMeanFactor([5], target_factor)]
+    # 目标因子不在计算链中，每个品种只加载一次
+    prepare_target_factor_data(factor_list, 'IF')
+    data = init_data[['datetime', 'date', 'product', 'instrument']]
+    for i in range(2):
+        factor_list[0].caculate(factor_list[1].caculate(data))
+    assert RatioFactor.load_count == 1
+    loaded_result = factor_list[0].caculate(data)
+    expected = caculate_difference_by_mask(init_data, ['2022-01-04', '2022-01-05', '2022-01-06'], 5)
+    assert np.allclose(loaded_result['FCT_99_002_RATIO_DIFFERENCE.5'].values, expected.values)
+    # 目标因子已经在计算链中时直接使用内存中的数据
+    get_target_factor_cache().clear()
+    chained_result = factor_list[0].caculate(init_data)
+    assert RatioFactor.load_count == 1
+    assert np.allclose(chained_result['FCT_99_002_RATIO_DIFFERENCE.5'].values, expected.values)
+    # 衍生因子修改的是拷贝，缓存的目标因子数据不变
+    prepare_target_factor_data(factor_list, 'IF')
+    factor_list[1].caculate(data)
+    assert get_target_factor_cache().get_data_by_date(target_factor, 'IF')['2022-01-04'].columns.tolist() == init_data.columns.tolist()
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_factor_dependency.py"])
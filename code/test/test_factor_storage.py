@@ -0,0 +1,133 @@
+import pytest
+
+import pandas as pd
+import numpy as np
+
+from factor.factor_storage import FactorPartitionStore, ResultSink, PartitionResultSink
+
+"""
+因子分区存储测试，测试数据随机生成
+"""
+
+@pytest.fixture()
+def init_data():
+    rng = np.random.default_rng(2023)
+    data_list = []
+    for instrument, date_list in [('IF2201', ['2022-01-04', '2022-01-05']), ('IF2202', ['2022-01-05', '2022-01-06'])]:
+        for date in date_list:
+            n = 100
+            data_list.append(pd.DataFrame({
+                'datetime': [date + ' 09:30:{:02d}.000'.format(i % 60) for i in range(n)],
+                'close': 4000 + rng.normal(0, 1, n),
+                'volume': rng.integers(0, 100, n),
+                'date': date,
+                'instrument': instrument,
+                'FCT_01_001_WILLIAM.10': rng.normal(0, 1, n)
+            }))
+    return pd.concat(data_list, ignore_index=True)
+
+
+def test_write_and_read(init_data, tmp_path):
+    store = FactorPartitionStore('IF', 'FCT_01_001_WILLIAM-1.0[10]', str(tmp_path) + '/')
+    assert not store.exists()
+    store.write(init_data)
+    store = FactorPartitionStore('IF', 'FCT_01_001_WILLIAM-1.0[10]', str(tmp_path) + '/')
+    assert store.exists()
+    assert store.get_last_date_dict() == {'IF2201': '2022-01-05', 'IF2202': '2022-01-06'}
+    catalog = store.get_catalog()
+    assert catalog['partitions']['IF2201']['2022-01-04']['rows'] == 100
+    assert catalog['partitions']['IF2201']['2022-01-04']['max_datetime'] == '2022-01-04 09:30:59.000'
+    data = store.read()
+    assert data['close'].equals(init_data['close'])
+    assert data['datetime'].tolist() == init_data['datetime'].tolist()
+    assert data['volume'].dtype == init_data['volume'].dtype
+    # 按合约和日期过滤
+    data = store.read(instrument_list=['IF2202'], date_list=['2022-01-05'], columns=['datetime', 'close'])
+    expected = init_data[(init_data['instrument'] == 'IF2202') & (init_data['date'] == '2022-01-05')]
+    assert data.columns.tolist() == ['datetime', 'close']
+    assert np.array_equal(data['close'].values, expected['close'].values)
+    assert len(store.read(start_date='2022-01-06')) == 100
+    assert store.verify() == []
+
+
+def test_missing_string(init_data, tmp_path):
+    data = init_data.copy()
+    data['time'] = data['datetime'].str[11:]
+    data.loc[data.index[1::7], 'time'] = np.nan
+    data.loc[data.index[3], 'time'] = None
+    store = FactorPartitionStore('IF', 'FCT_01_001_WILLIAM-1.0[10]', str(tmp_path) + '/')
+    store.write(data)
+    result = store.read()
+    # 空值读取后还是空值，不会变成'nan'
+    assert result['time'].isnull().tolist() == data['time'].isnull().tolist()
+    assert result['time'].dropna().tolist() == data['time'].dropna().tolist()
+    assert not (result['time'] == 'nan').any()
+    assert result['datetime'].tolist() == data['datetime'].tolist()
+    assert store.read(date_list=['2022-01-04'], columns=['time'])['time'].isnull().sum() == data[data['date'] == '2022-01-04']['time'].isnull().sum()
+
+
+def test_overwrite_and_delete(init_data, tmp_path):
+    store = FactorPartitionStore('IF', 'FCT_01_001_WILLIAM-1.0[10]', str(tmp_path) + '/')
+    store.write(init_data)
+    update_data = init_data[init_data['date'] == '2022-01-05'].copy()
+    update_data['close'] = 0.0
+    store.write(update_data)
+    assert (store.read(date_list=['2022-01-05'])['close'] == 0).all()
+    assert (store.read(date_list=['2022-01-04'])['close'] != 0).all()
+    store.delete('IF2202', '2022-01-06')
+    assert store.get_last_date_dict()['IF2202'] == '2022-01-05'
+    assert store.verify() == []
+
+
+def test_result_sink(init_data, tmp_path):
+    columns = ['datetime', 'FCT_01_001_WILLIAM.10']
+    assert ResultSink(columns).get_result().columns.tolist() == columns
+    result_sink = ResultSink(columns)
+    expected = pd.DataFrame(columns=columns)
+    for (instrument, date), data in init_data.groupby(['instrument', 'date'], sort=True):
+        result_sink.append(data)
+        expected = pd.concat([expected, data])
+    # 只合并一次，结果和逐个concat一致，因子列排在前面
+    result = result_sink.get_result()
+    assert result_sink.get_result() is result
+    assert result.columns.tolist() == expected.columns.tolist()
+    assert result.index.tolist() == expected.index.tolist()
+    assert np.array_equal(result['close'].values.astype(float), expected['close'].values.astype(float))
+    assert result['close'].dtype == init_data['close'].dtype
+    # 按分区直接写入
+    store = FactorPartitionStore('IF', 'FCT_01_001_WILLIAM-1.0[10]', str(tmp_path) + '/')
+    result_sink = PartitionResultSink(store)
+    for instrument, data in init_data.groupby('instrument', sort=True):
+        result_sink.append(data)
+    assert result_sink.get_rows() == len(init_data)
+    assert result_sink.get_result()['close'].equals(init_data['close'])
+
+
+def test_result_sink_with_different_columns(init_data, tmp_path):
+    columns = ['datetime', 'FCT_01_001_WILLIAM.10']
+    data_list = [data.copy() for instrument, data in init_data.groupby('instrument', sort=True)]
+    # 第一个合约有股票数据的time列，第二个合约没有股票数据，也没有time列
+    data_list[0]['time'] = data_list[0]['datetime'].str[11:]
+    store = FactorPartitionStore('IF', 'FCT_01_001_WILLIAM-1.0[10]', str(tmp_path) + '/with_time/')
+    result_sink = PartitionResultSink(store, columns)
+    for data in data_list:
+        result_sink.append(data)
+    result = result_sink.get_result()
+    assert result['time'].tolist()[:len(data_list[0])] == data_list[0]['time'].tolist()
+    assert result['time'].iloc[len(data_list[0]):].isnull().all()
+    assert np.array_equal(result['FCT_01_001_WILLIAM.10'].values, init_data['FCT_01_001_WILLIAM.10'].values)
+    # 顺序相反时，新的列加入表结构，之前写入的分区读取时为空值
+    store = FactorPartitionStore('IF', 'FCT_01_001_WILLIAM-1.0[10]', str(tmp_path) + '/without_time/')
+    result_sink = PartitionResultSink(store, columns)
+    for data in reversed(data_list):
+        result_sink.append(data)
+    result = result_sink.get_result()
+    assert result.columns.tolist()[:2] == columns and 'time' in result.columns
+    assert result['time'].tolist()[:len(data_list[0])] == data_list[0]['time'].tolist()
+    assert result['time'].iloc[len(data_list[0]):].isnull().all()
+    assert result_sink.get_rows() == len(init_data)
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_factor_storage.py"])
@@ -61,6 +61,29 @@ def test_weighted_moving_average(init_data):
     # print(data[data['weighted_moving_average'] != data['weighted_moving_average.close.weight.10']].iloc[0:10][['weighted_moving_average', 'weighted_moving_average.close.weight.10']])
     assert len(data[np.around(data['weighted_moving_average'], 2) != np.around(data['weighted_moving_average.close.weight.10'], 2)]) == 0
 
+def test_weighted_moving_average_consistency(init_data):
+    """
+    和逐窗口计算的结果比较。
+    原来的实现在close上做rolling apply，只用窗口的index从target和weight列取值，target参数一直是生效的，
+    但是close窗口内有空值时结果也为空值；现在只有target或者weight窗口内有空值时才为空值
+    """
+    data = init_data
+    for target in ['close', 'open']:
+        indicator = WeightedMovingAverage([10], target=target, weight='weight')
+        data = indicator.enrich(data)
+        expected = data[target].rolling(10).apply(lambda window: (window.values * data.loc[window.index, 'weight'].values).sum() / data.loc[window.index, 'weight'].values.sum())
+        assert len(data[np.isnan(data[indicator.get_key(10)])]) == 9
+        assert np.allclose(data[indicator.get_key(10)].values[9:], expected.values[9:], rtol=1e-10)
+    # close的空值不影响其他target的结果
+    data = init_data.copy()
+    data.loc[20, 'close'] = np.nan
+    indicator = WeightedMovingAverage([10], target='open', weight='weight')
+    data = indicator.enrich(data)
+    assert not np.isnan(data[indicator.get_key(10)].values[20:30]).any()
+    indicator = WeightedMovingAverage([10], target='close', weight='weight')
+    data = indicator.enrich(data)
+    assert np.isnan(data[indicator.get_key(10)].values[20:30]).all()
+
 def test_standard_deviation(init_data):
     data = init_data
     data = StandardDeviation([10]).enrich(data)
@@ -143,8 +166,8 @@ def test_linear_regression(init_data):
     assert len(data[np.around(data['linear_regression'], 2) != np.around(
         data['linear_regression.close.10'], 2)]) == 0
 
-def caculation_function(model, window, variable):
-    return model.coef_
+def caculation_function(result):
+    return result['slope']
 
 def test_polynomial_regression(init_data):
     data = init_data
@@ -158,12 +181,8 @@ def test_polynomial_regression(init_data):
     assert len(data[np.around(data['polynomial_regression'], 2) != np.around(
         data['polynomial_regression.close.10'], 2)]) == 0
 
-def caculation_function_1(model, poly, window):
-    x = np.linspace(1, len(window), len(window)).reshape(-1, 1)
-    X = poly.transform(x.reshape(-1, 1))
-    estimated_values = model.predict(X)
-    estimated_value = estimated_values[-1]
-    return estimated_value
+def caculation_function_1(result):
+    return result['fitted']
 
 def test_adx(init_data):
     """
@@ -0,0 +1,249 @@
+import math
+from math import sqrt
+
+import pytest
+
+import pandas as pd
+import numpy as np
+
+from factor.kernel import true_range, trend_sign, safe_log, log_ratio, rolling_linear_regression, rolling_polynomial_regression, warm_up_rolling_moments, rolling_moments
+from factor import indicator
+from factor.indicator import TR, OBV, MovingAverage, ATR, Variance, StandardDeviation, Skewness, Kurtosis, IndicatorCache, set_indicator_cache
+from factor.volume_price_factor import CloseMinusMovingAverageFactor, PriceMomentumFactor, PriceVolumeFitFactor, AtrRatioFactor, LinearDeviationFactor
+from synthetic_data import create_bar_data
+
+"""
+向量化内核的回归测试，和原来逐行计算的结果比较，
+测试数据随机生成，不依赖测试文件
+"""
+
+@pytest.fixture()
+def init_data():
+    # 构造持平的价格
+    return create_bar_data(500, flat_slice=slice(100, 105))
+
+
+def test_true_range(init_data):
+    data = init_data
+    data['current_amp'] = data['high'] - data['low']
+    data['last_rise'] = abs(data['high'] - data['close'].shift(1))
+    data['last_fall'] = abs(data['low'] - data['close'].shift(1))
+    expected = data.apply(lambda x: max(x['current_amp'], x['last_rise'], x['last_fall']), axis=1)
+    assert np.array_equal(true_range(data['high'], data['low'], data['close']), expected.values)
+    assert np.array_equal(TR().enrich(data)['tr'].values, expected.values)
+
+
+def test_obv(init_data):
+    data = init_data
+    last_close = data['close'].shift(1)
+    expected_sign = list(map(lambda close, last: 1 if close > last else (-1 if close < last else 0), data['close'], last_close))
+    assert np.array_equal(trend_sign(data['close']), np.array(expected_sign))
+    data = OBV().enrich(data)
+    assert np.array_equal(data['obv'].values, np.cumsum(np.array(expected_sign) * data['volume'].values))
+
+
+def test_safe_log():
+    values = np.array([1.0, math.e, 10.0, 0, -1.0, np.nan])
+    result = safe_log(values)
+    assert np.array_equal(result[0:3], np.array([math.log(1.0), math.log(math.e), math.log(10.0)]))
+    assert np.isnan(result[3:]).all()
+    assert np.allclose(log_ratio(np.array([2.0, 3.0]), np.array([1.0, 3.0])), np.array([math.log(2.0), 0]))
+
+
+def test_close_minus_moving_average(init_data):
+    data = init_data
+    param = 10
+    factor = CloseMinusMovingAverageFactor([param])
+    data = factor.caculate(data)
+    moving_average_key = MovingAverage([param]).get_key(param)
+    atr_key = ATR([2 * param]).get_key(2 * param)
+    def formula(item):
+        numerator = math.log((item['close'] / item[moving_average_key]), math.e)
+        denominator = sqrt(param) * item[atr_key]
+        return 0 if denominator == 0 else numerator / denominator
+    expected = data.apply(formula, axis=1).fillna(0)
+    assert np.allclose(data[factor.get_key(param)].values, expected.values, rtol=1e-12, atol=1e-15)
+
+
+def test_price_momentum(init_data):
+    data = init_data
+    param = 10
+    factor = PriceMomentumFactor([param])
+    data = factor.caculate(data)
+    expected = data['mean'].rolling(param).apply(lambda item: math.log(item.tolist()[-1] / item.tolist()[0]))
+    assert np.allclose(data['log' + str(param)].values[param - 1:], expected.values[param - 1:], rtol=1e-12)
+
+
+def test_price_volume_fit_log(init_data):
+    data = init_data
+    data = PriceVolumeFitFactor([10]).caculate(data)
+    assert np.array_equal(data['log_price'].values, data['close'].apply(lambda item: math.log(item)).values)
+    assert np.array_equal(data['log_volume'].values, data['volume'].apply(lambda item: 0 if item == 0 else math.log(item)).values)
+
+
+def test_rolling_linear_regression(init_data):
+    data = init_data
+    window = 20
+    result = rolling_linear_regression(data['close'], window)
+    for i in [window - 1, 200, len(data) - 1]:
+        y = data['close'].values[i - window + 1: i + 1]
+        slope, intercept = np.polyfit(np.linspace(1, window, window), y, 1)
+        assert result['slope'][i] == pytest.approx(slope, rel=1e-8)
+        assert result['intercept'][i] == pytest.approx(intercept, rel=1e-8)
+        assert result['fitted'][i] == pytest.approx(slope * window + intercept, rel=1e-10)
+    assert np.isnan(result['slope'][0:window - 1]).all()
+
+
+def test_rolling_polynomial_regression(init_data):
+    data = init_data
+    window = 20
+    for order in [2, 3]:
+        result = rolling_polynomial_regression(data['close'], window, order)
+        for i in [window - 1, 200, len(data) - 1]:
+            y = data['close'].values[i - window + 1: i + 1]
+            x = np.linspace(1, window, window)
+            estimated_values = np.polyval(np.polyfit(x, y, order), x)
+            residual_std = (((y - estimated_values) ** 2).sum() / (window - 1)) ** 0.5
+            assert result['fitted'][i] == pytest.approx(estimated_values[-1], rel=1e-10)
+            assert result['residual_std'][i] == pytest.approx(residual_std, rel=1e-6)
+
+
+def fill_warm_up_by_loop(values, window, method):
+    """原来rolling之后逐个补空值的计算"""
+    values = pd.Series(values)
+    result = getattr(values.rolling(window), method)()
+    temp_arr = values[np.isnan(result)].tolist()
+    filled_data_arr = np.zeros(len(temp_arr))
+    for i in range(len(temp_arr)):
+        if i == 0:
+            filled_data_arr[i] = temp_arr[i] if method == 'mean' else 0
+        else:
+            filled_data_arr[i] = getattr(np, method)(temp_arr[:i + 1])
+    result[np.isnan(result)] = filled_data_arr
+    return result.values
+
+
+def test_warm_up_rolling_moments(init_data):
+    values = init_data['close'].values.copy()
+    values[300] = np.nan
+    for window in [1, 2, 20, 100, 800]:
+        result = warm_up_rolling_moments(values, window)
+        assert np.allclose(result['mean'], fill_warm_up_by_loop(values, window, 'mean'), rtol=1e-10, equal_nan=True)
+        # 包含持平的价格，方差为0
+        assert np.allclose(result['std'], fill_warm_up_by_loop(values, window, 'std'), atol=1e-6, equal_nan=True)
+    assert len(warm_up_rolling_moments([], 20)['std']) == 0
+
+
+def caculate_moments_by_window(values, window):
+    """逐个窗口直接计算的总体中心矩，作为精确的参照"""
+    result = {name: np.full(len(values), np.nan) for name in ['mean', 'variance', 'skewness', 'kurtosis']}
+    for i in range(window - 1, len(values)):
+        temp_arr = values[i - window + 1: i + 1]
+        mean = temp_arr.mean()
+        m2 = ((temp_arr - mean) ** 2).mean()
+        m3 = ((temp_arr - mean) ** 3).mean()
+        m4 = ((temp_arr - mean) ** 4).mean()
+        result['mean'][i] = mean
+        result['variance'][i] = m2 * window / (window - 1)
+        if m2 == 0:
+            result['skewness'][i] = 0
+            result['kurtosis'][i] = -3
+        else:
+            result['skewness'][i] = sqrt(window * (window - 1)) * m3 / ((window - 2) * m2 ** 1.5)
+            result['kurtosis'][i] = ((window * window - 1) * m4 / (m2 * m2) - 3 * (window - 1) ** 2) / ((window - 2) * (window - 3))
+    return result
+
+
+def test_rolling_moments(init_data):
+    values = init_data['close'].values.copy()
+    values[300] = np.nan
+    window_list = [5, 20, 100]
+    result = rolling_moments(values, window_list)
+    for window in window_list:
+        expected = caculate_moments_by_window(values, window)
+        for name in ['mean', 'variance', 'skewness', 'kurtosis']:
+            assert np.allclose(result[window][name], expected[name], rtol=1e-6, atol=1e-8, equal_nan=True)
+        assert np.allclose(result[window]['std'], np.sqrt(expected['variance']), equal_nan=True)
+        # 窗口内有空值时为空值
+        assert np.isnan(result[window]['variance'][300: 300 + window]).all()
+    # 持平的价格
+    assert result[5]['variance'][104] == 0 and result[5]['skewness'][104] == 0 and result[5]['kurtosis'][104] == -3
+    assert np.isnan(rolling_moments(values[:10], [20])[20]['mean']).all()
+    # 同一个目标列和窗口的方差和标准差，偏度和峰度分别共用一次计算
+    cache = IndicatorCache()
+    set_indicator_cache(cache)
+    try:
+        data = StandardDeviation([20]).enrich(Variance([20]).enrich(init_data.copy()))
+        data = Kurtosis([20]).enrich(Skewness([20]).enrich(data))
+    finally:
+        set_indicator_cache(None)
+    assert cache.get_hit_count() == 2 and cache.get_miss_count() == 2
+    assert data['variance.close.20'].equals(init_data['close'].rolling(20).var())
+    assert data['standard_deviation.close.20'].equals(init_data['close'].rolling(20).std())
+    assert np.allclose(data['kurtosis.close.20'], rolling_moments(init_data['close'], [20])[20]['kurtosis'], equal_nan=True)
+
+
+def test_higher_moments_in_one_pass(init_data, monkeypatch):
+    call_list = []
+    monkeypatch.setattr(indicator, 'rolling_moments', lambda values, window_list: call_list.append(list(window_list)) or rolling_moments(values, window_list))
+    # 偏度的所有窗口一次计算，方差不使用rolling_moments
+    data = Skewness([5, 20, 100]).enrich(init_data.copy())
+    data = Variance([5, 20, 100]).enrich(data)
+    assert call_list == [[5, 20, 100]]
+    expected = rolling_moments(init_data['close'], [5, 20, 100])
+    for window in [5, 20, 100]:
+        assert np.array_equal(data['skewness.close.' + str(window)].values, expected[window]['skewness'], equal_nan=True)
+
+
+def test_indicator_cache(init_data):
+    factor_list = [CloseMinusMovingAverageFactor([10]), AtrRatioFactor([10]), LinearDeviationFactor([10]), CloseMinusMovingAverageFactor([10])]
+    expected = init_data.copy()
+    for factor in factor_list:
+        expected = factor.caculate(expected)
+    cache = IndicatorCache()
+    set_indicator_cache(cache)
+    try:
+        data = init_data.copy()
+        for factor in factor_list:
+            data = factor.caculate(data)
+    finally:
+        set_indicator_cache(None)
+    assert cache.get_hit_count() > 0
+    assert list(data.columns) == list(expected.columns)
+    for column in expected.columns:
+        assert data[column].equals(expected[column])
+    # 源数据变化后不能命中
+    cache = IndicatorCache()
+    set_indicator_cache(cache)
+    try:
+        data = MovingAverage([10]).enrich(init_data.copy())
+        # 原地修改指标列不影响缓存
+        data.loc[:, 'moving_average.close.10'] = 0
+        assert MovingAverage([10]).enrich(data)['moving_average.close.10'].equals(init_data['close'].rolling(10).mean())
+        data['close'] = data['close'] + 1
+        assert MovingAverage([10]).enrich(data)['moving_average.close.10'].equals(data['close'].rolling(10).mean())
+        assert cache.get_hit_count() == 1
+        # 原地修改源数据列后增加版本号
+        data.loc[:, 'close'] = data['close'] * 2
+        cache.bump_version(['close'])
+        assert MovingAverage([10]).enrich(data)['moving_average.close.10'].equals(data['close'].rolling(10).mean())
+        assert cache.get_hit_count() == 1
+        # 指纹不读取列的内容
+        data = init_data.copy()
+        assert cache.get_fingerprint(data, ['close', 'high']) == cache.get_fingerprint(data, ['close', 'high'])
+        assert cache.get_fingerprint(data, ['close']) != cache.get_fingerprint(init_data.copy(), ['close'])
+        # 依赖衍生列的指标不缓存，原地修改后结果正确，也不保留衍生列
+        data = pd.DataFrame({'x': [1.0, np.nan, 3.0, 4.0, 5.0]})
+        hit_count = cache.get_hit_count()
+        Variance([3], 'x').enrich(data)
+        data.loc[data['x'].isnull(), 'x'] = 100.0
+        assert Variance([3], 'x').enrich(data)['variance.x.3'].equals(data['x'].rolling(3).var())
+        assert cache.get_hit_count() == hit_count
+        assert all(map(lambda identity: identity[0] in ['close', 'high'], cache._source_dict.keys()))
+    finally:
+        set_indicator_cache(None)
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_kernel.py"])
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from common.aop import timing
+from common.metrics import get_metrics_collector, metric_context, stage_timer, MetricsCollector
+from framework.localconcurrent import ProcessExcecutor
+
+"""
+指标收集测试
+"""
+
+@timing
+def square(x):
+    with metric_context(date='2022-01-0' + str(x)):
+        with stage_timer('execute_caculation'):
+            get_metrics_collector().increase('rows', x)
+    return x * x
+
+
+@pytest.fixture()
+def collector():
+    get_metrics_collector().reset()
+    yield get_metrics_collector()
+    get_metrics_collector().reset()
+
+
+def test_metrics_collector(collector, tmp_path):
+    with metric_context(factor='SpreadFactor', product='IF'):
+        assert square(2) == 4
+        collector.increase('rows', 3)
+    assert collector.get_counter('rows', factor='SpreadFactor', product='IF', date='2022-01-02') == 2
+    assert collector.get_counter('rows', factor='SpreadFactor', product='IF') == 3
+    collector.dump(str(tmp_path / 'metrics' / 'test'))
+    with open(str(tmp_path / 'metrics' / 'test.json')) as file:
+        summary = json.load(file)
+    assert set(map(lambda timer: timer['name'], summary['timers'])) == {'stage', 'method'}
+    prometheus = (tmp_path / 'metrics' / 'test.prom').read_text()
+    assert '# TYPE quantitative_stage_seconds histogram' in prometheus
+    assert 'quantitative_stage_seconds_count{date="2022-01-02",factor="SpreadFactor",product="IF",stage="execute_caculation"} 1' in prometheus
+    assert 'quantitative_method_seconds_bucket{factor="SpreadFactor",method="square",product="IF",le="+Inf"} 1' in prometheus
+    assert 'quantitative_rows_total{factor="SpreadFactor",product="IF"} 3' in prometheus
+
+
+def test_merge_worker_metrics(collector):
+    with metric_context(factor='SpreadFactor'):
+        results = ProcessExcecutor(2).execute(square, [1, 2, 3])
+    assert sorted(results) == [1, 4, 9]
+    # 子进程中的指标合并到当前进程，并带上提交任务时的标签
+    for x in [1, 2, 3]:
+        assert collector.get_counter('rows', factor='SpreadFactor', date='2022-01-0' + str(x)) == x
+    summary = collector.get_summary()
+    method_timer = list(filter(lambda timer: timer['name'] == 'method', summary['timers']))
+    assert len(method_timer) == 1 and method_timer[0]['count'] == 3
+    other = MetricsCollector()
+    other.merge(collector.snapshot())
+    other.merge(collector.snapshot())
+    assert other.get_counter('rows', factor='SpreadFactor', date='2022-01-03') == 6
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_metrics.py"])
@@ -0,0 +1,77 @@
+import pytest
+
+import pandas as pd
+import numpy as np
+
+from common.exception.exception import InvalidStatus, ValidationFailed
+from factor.indicator import MovingAverage, ExpMovingAverage, StandardDeviation, Skewness, ATR, RSI, ADX, OBV
+from factor.online_engine import OnlineFactorEngine, replay
+from factor.rolling_state import RollingMeanState, RollingVarianceState, EwmState
+from factor.volume_price_factor import CloseMinusMovingAverageFactor, PriceMomentumFactor, AdxFactor, MinAdxFactor, ResidualMinAdxFactor, \
+    IntradayIntensityFactor, AtrRatioFactor, VolumeMomentumFactor, OnBalanceVolumeFactor, DeltaOnBalanceVolumeFactor, ThresholdRsiFactor, \
+    WilliamFactor
+from synthetic_data import create_bar_data
+
+"""
+实时增量计算测试，回放随机生成的3秒bar，和批量计算的结果比较，不依赖测试文件
+"""
+
+@pytest.fixture()
+def init_data():
+    # 构造持平的价格
+    data = create_bar_data(1500, decimals=1, flat_slice=slice(100, 130))
+    data.insert(0, 'datetime', pd.date_range('2022-11-01 09:30:00', periods=len(data), freq='3s').strftime('%Y-%m-%d %H:%M:%S'))
+    return data
+
+
+def test_rolling_state(init_data):
+    values = init_data['close'].values.copy()
+    values[300] = np.nan
+    for window in [1, 2, 20, 100]:
+        mean_state = RollingMeanState(window)
+        variance_state = RollingVarianceState(window)
+        mean = np.array([mean_state.update(value) for value in values])
+        variance = np.array([variance_state.update(value)[0] for value in values])
+        assert np.allclose(mean, pd.Series(values).rolling(window).mean().values, rtol=1e-12, equal_nan=True)
+        assert np.allclose(variance, pd.Series(values).rolling(window).var().values, rtol=1e-6, atol=1e-8, equal_nan=True)
+        # 窗口内都是持平的价格时方差为0
+        if 1 < window <= 30:
+            assert variance[129] == 0
+    for span in [2, 14, 100]:
+        ewm_state = EwmState(span)
+        ewm = np.array([ewm_state.update(value) for value in values])
+        assert np.allclose(ewm, pd.Series(values).ewm(span=span, adjust=False).mean().values, rtol=1e-12, equal_nan=True)
+
+
+def test_indicator_update(init_data):
+    for indicator in [MovingAverage([5, 50]), ExpMovingAverage([10]), StandardDeviation([20]), ATR([14]), RSI([14]), ADX([14]), OBV()]:
+        expected = indicator.enrich(init_data.copy())
+        indicator.init_state(init_data.iloc[:500])
+        result = pd.DataFrame([indicator.update(bar) for bar in init_data.iloc[500:].to_dict('records')])
+        for column in result.columns:
+            assert np.allclose(result[column].values, expected[column].values[500:], rtol=1e-9, atol=1e-9, equal_nan=True)
+    with pytest.raises(InvalidStatus):
+        Skewness([20]).init_state(init_data)
+
+
+def test_replay(init_data):
+    factor_list = [CloseMinusMovingAverageFactor([20, 50]), PriceMomentumFactor([10, 20]), AdxFactor([14]), MinAdxFactor([20]), ResidualMinAdxFactor([20]),
+                   IntradayIntensityFactor([20]), AtrRatioFactor([20]), VolumeMomentumFactor([20]), OnBalanceVolumeFactor(),
+                   DeltaOnBalanceVolumeFactor([20]), ThresholdRsiFactor([14])]
+    result = replay(factor_list, init_data, 500)
+    assert len(result) == len(init_data) - 500
+    assert CloseMinusMovingAverageFactor([20]).get_key(20) in result.columns and OnBalanceVolumeFactor().get_key() in result.columns
+    # 没有实现增量计算的因子
+    with pytest.raises(InvalidStatus):
+        OnlineFactorEngine([WilliamFactor([10])]).init_state(init_data)
+    # 增量计算的结果不一致时报错
+    factor = AtrRatioFactor([20])
+    update = factor.update
+    factor.update = lambda bar: {key: value + 1 for key, value in update(bar).items()}
+    with pytest.raises(ValidationFailed):
+        replay([factor], init_data, 500)
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_online_engine.py"])
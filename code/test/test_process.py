@@ -0,0 +1,245 @@
+import pytest
+
+from datetime import datetime
+
+import pandas as pd
+import numpy as np
+
+from common import constants
+from common.constants import OFF_TIME_IN_SECOND, STOCK_TRANSACTION_START_TIME, STOCK_VALID_DATA_STARTTIME
+from common.timeutils import datetime_advance, date_alignment, time_carry, time_advance, add_milliseconds_suffix
+from data.process import FutureTickDataProcessorPhase1, StockTickDataEnricher, StockTickDataCleaner
+from synthetic_data import create_raw_stock_tick_data
+
+"""
+数据处理测试，和原来逐个时间区间循环的实现比较，测试数据随机生成
+"""
+
+def process_by_loop(data):
+    """
+    原来的实现，逐个时间区间过滤和拼接
+    """
+    columns = ['datetime', 'open', 'close', 'high', 'low', 'volume', 'interest']
+    date = data.iloc[1]['date']
+    data['datetime'] = data.apply(lambda item: date_alignment(str(item['datetime'])), axis=1)
+    data['delta_volume'] = data['volume'] - data['volume'].shift(1)
+    first_index = data.head(1).index.tolist()[0]
+    data.loc[first_index, 'delta_volume'] = data.loc[first_index, 'volume']
+    data['cur_price'] = data['last_price']
+    data = data[data['delta_volume'] > 0]
+    cur_time = date + ' 09:29:00.000000000'
+    end_time = date + ' 15:00:00.000000000'
+    is_open = True
+    organized_data = pd.DataFrame(columns=columns)
+    while cur_time < end_time:
+        if is_open:
+            next_time = datetime_advance(cur_time, 63)
+            is_open = False
+        else:
+            next_time = datetime_advance(cur_time, 3)
+        temp_data = data[(data['datetime'] >= cur_time) & (data['datetime'] < next_time)]
+        last_record = None
+        if len(temp_data) == 0:
+            if len(organized_data) > 0:
+                last_record = organized_data.iloc[-1].copy()
+                last_record['datetime'] = next_time
+                last_record['volume'] = 0
+                close = last_record['close']
+                last_record['open'] = close
+                last_record['low'] = close
+                last_record['high'] = close
+        else:
+            min_index = temp_data.index.min()
+            max_index = temp_data.index.max()
+            last_record = pd.Series({'datetime': next_time,
+                                     'open': temp_data.loc[min_index]['cur_price'],
+                                     'close': temp_data.loc[max_index]['cur_price'],
+                                     'high': temp_data['cur_price'].max(),
+                                     'low': temp_data['cur_price'].min(),
+                                     'volume': temp_data['delta_volume'].sum(),
+                                     'interest': temp_data.loc[max_index]['open_interest']})
+        if last_record is not None:
+            cur_index = 1 if len(organized_data) == 0 else organized_data.index.max() + 1
+            organized_data = pd.concat([organized_data, pd.DataFrame([last_record], [cur_index])])
+        cur_time = next_time
+    return organized_data
+
+
+def create_tick_data(date, seed):
+    rng = np.random.default_rng(seed)
+    second_list = []
+    # 开盘前、集合竞价、上午、午休、下午和收盘后都有数据，中间有长时间没有成交
+    for start, end in [(9 * 3600 + 28 * 60, 9 * 3600 + 31 * 60), (9 * 3600 + 40 * 60, 11 * 3600 + 30 * 60 + 5),
+                       (12 * 3600, 12 * 3600 + 10), (13 * 3600, 13 * 3600 + 30 * 60), (14 * 3600 + 50 * 60, 15 * 3600 + 10)]:
+        second_list.append(np.sort(rng.uniform(start, end, int((end - start) / 2))))
+    seconds = np.concatenate(second_list)
+    n = len(seconds)
+    datetime_list = list(map(lambda second: date + ' {0:02d}:{1:02d}:{2:02d}.{3:09d}'.format(
+        int(second) // 3600, int(second) % 3600 // 60, int(second) % 60, int((second - int(second)) * 1000000000)), seconds))
+    volume = np.cumsum(rng.integers(0, 3, n) * rng.integers(0, 2, n))
+    return pd.DataFrame({
+        'datetime': datetime_list,
+        'last_price': 4000 + np.round(np.cumsum(rng.normal(0, 0.5, n)), 1),
+        'volume': volume,
+        'open_interest': 100000 + np.cumsum(rng.integers(-5, 6, n)).astype('float64'),
+        'date': date
+    }, index=range(10, 10 + n))
+
+
+def test_future_tick_data_processor_phase1():
+    for date, seed in [('2022-06-20', 1), ('2022-06-21', 2)]:
+        data = create_tick_data(date, seed)
+        expected = process_by_loop(data.copy())
+        result = FutureTickDataProcessorPhase1().process(data.copy())
+        assert result.index.tolist() == expected.index.tolist()
+        assert result['datetime'].tolist() == expected['datetime'].tolist()
+        for column in ['open', 'close', 'high', 'low', 'volume', 'interest']:
+            assert np.array_equal(result[column].to_numpy(dtype='float64'), expected[column].to_numpy(dtype='float64'))
+
+
+def test_future_tick_data_processor_phase1_by_multiple_dates():
+    data_list = [create_tick_data('2022-06-20', 1), create_tick_data('2022-06-21', 2)]
+    data = pd.concat(data_list, ignore_index=True)
+    result = FutureTickDataProcessorPhase1().process(data)
+    for date_data in data_list:
+        expected = FutureTickDataProcessorPhase1().process(date_data)
+        date_result = result[result['datetime'].str[0:10] == date_data['date'].iloc[0]]
+        assert date_result['datetime'].tolist() == expected['datetime'].tolist()
+        assert np.array_equal(date_result[['open', 'close', 'high', 'low', 'volume', 'interest']].to_numpy(),
+                              expected[['open', 'close', 'high', 'low', 'volume', 'interest']].to_numpy())
+
+
+
+def enrich_by_loop(data):
+    """
+    原来的实现，逐行对齐时间，逐个缺失区间补数据
+    """
+    pre_data = data[data['time'] < STOCK_TRANSACTION_START_TIME]
+    last_close = data[data['close'] > 0].iloc[0]['close']
+    opening = (data['time'] >= add_milliseconds_suffix(STOCK_TRANSACTION_START_TIME)) & (data['time'] <= add_milliseconds_suffix(STOCK_VALID_DATA_STARTTIME))
+    for column in ['price', 'open', 'high', 'low']:
+        data.loc[opening & (data[column] == 0), column] = last_close
+    data = data[data['time'] >= STOCK_TRANSACTION_START_TIME].copy()
+    for index, row_data in data.iterrows():
+        cur_time = datetime.strptime(data.loc[index, 'time'], '%H:%M:%S.%f')
+        if cur_time.second % 3 == 0:
+            continue
+        hour, minute, second = time_carry(cur_time.hour, cur_time.minute, (int((cur_time.second + 3) / 3)) * 3)
+        new_time = '{0:02d}:{1:02d}:{2:02d}.000'.format(hour, minute, second)
+        if len(data[data['time'] == new_time]) == 0:
+            data.loc[index, 'time'] = new_time
+    temp_data = data[data['volume'] > 0]
+    if len(temp_data) > 0:
+        time = temp_data.iloc[-1]['time']
+        end_time = constants.STOCK_TRANSACTION_END_TIME + '.000'
+        if time > end_time:
+            data = data.drop(data.index[data['time'] == end_time])
+            data.loc[(data['time']) == time, 'time'] = end_time
+            data = data.drop(data.index[data['time'] > end_time])
+    data['realtime'] = data.apply(lambda item: datetime.strptime(item['time'], '%H:%M:%S.%f'), axis=1)
+    data['delta_time'] = data.shift(-1)['realtime'] - data['realtime']
+    data['delta_time_sec'] = data['delta_time'].apply(lambda item: item.total_seconds() - OFF_TIME_IN_SECOND if item.total_seconds() >= OFF_TIME_IN_SECOND else item.total_seconds())
+    miss_list = []
+    for index, row_data in data[data['delta_time_sec'] > 3].iterrows():
+        step = 3
+        item = data.loc[index].copy()
+        cur_time = item['time']
+        while step < row_data['delta_time_sec']:
+            item['time'] = time_advance(cur_time, step)
+            item['volume'] = 0
+            item['amount'] = 0
+            miss_list.append(item.copy())
+            step = step + 3
+    data = pd.concat([pre_data, data, pd.DataFrame(miss_list)])
+    return data.sort_values(by=['time'], kind='stable').reset_index(drop=True)
+
+
+def create_stock_tick_data(seed, shift_ratio=0.2):
+    rng = np.random.default_rng(seed)
+    second_list = []
+    second = 9 * 3600 + 24 * 60
+    # 快照基本在3秒网格上，部分提前1到2秒，中间有长时间没有数据和午休
+    while second < 15 * 3600 + 6:
+        if rng.random() < 0.75:
+            shift = int(rng.integers(1, 3)) if rng.random() < shift_ratio and second > 9 * 3600 + 30 * 60 + 3 else 0
+            second_list.append(second - shift)
+        second = second + (3 if rng.random() < 0.95 else 3 * int(rng.integers(2, 20)))
+        if 11 * 3600 + 30 * 60 < second < 13 * 3600:
+            second = 13 * 3600
+    seconds = np.array(second_list)
+    n = len(seconds)
+    price = 10 + np.round(np.cumsum(rng.normal(0, 0.01, n)), 2)
+    # 开盘后一段时间价格为0
+    price[(seconds >= 9 * 3600 + 30 * 60) & (seconds < 9 * 3600 + 30 * 60 + 30)] = 0
+    return pd.DataFrame({
+        'time': list(map(lambda second: '{0:02d}:{1:02d}:{2:02d}.000'.format(second // 3600, second % 3600 // 60, second % 60), seconds)),
+        'price': price,
+        'open': price,
+        'high': price,
+        'low': price,
+        'close': 10.0,
+        'volume': rng.integers(0, 5, n) * 100,
+        'amount': rng.random(n)
+    })
+
+
+def test_stock_tick_data_enricher():
+    for seed in [1, 2]:
+        data = create_stock_tick_data(seed)
+        expected = enrich_by_loop(data.copy())
+        result = StockTickDataEnricher().process(data.copy())
+        assert list(result.columns) == list(expected.columns)
+        assert result['time'].tolist() == expected['time'].tolist()
+        for column in expected.columns:
+            assert result[column].astype(str).tolist() == expected[column].astype(str).tolist()
+
+
+def test_stock_tick_data_enricher_on_grid():
+    # 同一个3秒区间有多个快照时，补充的数据仍然在网格上
+    data = create_stock_tick_data(3, 0.6)
+    result = StockTickDataEnricher().process(data.copy())
+    result = result[result['time'] >= STOCK_TRANSACTION_START_TIME]
+    fill_data = result[result['amount'] == 0]
+    assert len(fill_data) > 0
+    assert (fill_data['time'].str[6:8].astype(int) % 3 == 0).all()
+    assert not result['time'].duplicated().any()
+
+
+def clean_by_loop(data):
+    """
+    原来的实现，逐个重复时间删除
+    """
+    data = data.drop(columns=['iopv', 'total_varieties', 'total_increase_varieties', 'total_falling_varieties', 'total_equal_varieties'])
+    data = data.drop(data.index[data['time'] < constants.STOCK_START_TIME + '.000'])
+    data = data.drop(data.index[(data['time'] > constants.STOCK_TRANSACTION_END_TIME + '.000') & (data['price'] == 0)])
+    data = data.drop(data.index[(data['time'] > constants.STOCK_TRANSACTION_END_TIME + '.000') & (data['transaction_number'] == 0)])
+    data = data.drop(data.index[(data['time'] > constants.STOCK_TRANSACTION_NOON_END_TIME + '.000') & (data['time'] < constants.STOCK_TRANSACTION_NOON_START_TIME + '.000')])
+    data = data.drop(data.index[data['time'] == '0::.0'])
+    data['count'] = data.groupby(['time'])['time'].transform('count')
+    index_to_be_serverd = data.index[(data['count'] > 1) & (data['volume'] > 0) & (data['time'] >= constants.STOCK_OPEN_CALL_AUACTION_2ND_STAGE_END_TIME)]
+    for index in index_to_be_serverd:
+        time_to_handled = data.loc[index]['time']
+        data = data.drop(data.index[(data['time'] == time_to_handled) & (data['volume'] == 0)])
+    data['count'] = data.groupby(['time'])['time'].transform('count')
+    index_to_be_removed = data.index[(data['count'] > 1) & (data['volume'] == 0) & (data['time'] >= constants.STOCK_OPEN_CALL_AUACTION_2ND_STAGE_END_TIME)]
+    handled_time_set = set()
+    for index in index_to_be_removed:
+        cur_time = data.loc[index]['time']
+        if cur_time not in handled_time_set:
+            data = data.drop(index)
+            handled_time_set.add(cur_time)
+    return data
+
+
+def test_stock_tick_data_cleaner():
+    for seed in [1, 2]:
+        data = create_raw_stock_tick_data(seed)
+        expected = clean_by_loop(data.copy())
+        result = StockTickDataCleaner().process(data.copy())
+        assert len(result) < len(data)
+        assert result.index.tolist() == expected.index.tolist()
+        assert result.equals(expected)
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_process.py"])
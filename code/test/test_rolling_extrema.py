@@ -0,0 +1,81 @@
+import pytest
+
+import pandas as pd
+import numpy as np
+
+from factor.rolling_extrema import rolling_extrema, rolling_max, rolling_min, RollingExtrema
+from factor.volume_price_factor import WilliamFactor, NDayHighFactor, NDayLowFactor
+from synthetic_data import create_bar_data
+
+"""
+滑动极值测试，和pandas rolling以及逐个窗口的计算比较，
+测试数据随机生成，不依赖测试文件
+"""
+
+@pytest.fixture()
+def init_data():
+    # 保留一位小数，构造窗口内重复的极值
+    return create_bar_data(500, decimals=1, flat_slice=slice(100, 105))[['close', 'high', 'low']]
+
+
+def caculate_lag_by_window(values, window, method):
+    """逐个窗口计算极值距离当前的bar数，重复的极值取最近的一个"""
+    result = np.full(len(values), np.nan)
+    for i in range(window - 1, len(values)):
+        temp_arr = values[i - window + 1: i + 1]
+        if np.isnan(temp_arr).any():
+            continue
+        result[i] = window - 1 - np.flatnonzero(temp_arr == getattr(temp_arr, method)())[-1]
+    return result
+
+
+def n_day_high_by_loop(window):
+    """原来rolling apply逐个窗口的计算"""
+    price_list = window.tolist()
+    cur_price = price_list[-1]
+    n = len(window) + 1
+    for i in range(len(window)):
+        if i > 0 and price_list[-(i+1)] > cur_price:
+            n = i
+            cur_price = price_list[-(i+1)]
+    return 100*(n-1)/len(window) - 50
+
+
+def test_rolling_extrema(init_data):
+    values = init_data['close'].values.copy()
+    values[300] = np.nan
+    window_list = [1, 2, 7, 50, 500, 501]
+    result = rolling_extrema(values, window_list)
+    for window in window_list:
+        assert np.array_equal(result[window]['max'], pd.Series(values).rolling(window).max().values, equal_nan=True)
+        assert np.array_equal(result[window]['min'], pd.Series(values).rolling(window).min().values, equal_nan=True)
+        assert np.array_equal(result[window]['argmax'], caculate_lag_by_window(values, window, 'max'), equal_nan=True)
+        assert np.array_equal(result[window]['argmin'], caculate_lag_by_window(values, window, 'min'), equal_nan=True)
+        assert np.array_equal(rolling_max(values, window), result[window]['max'], equal_nan=True)
+        assert np.array_equal(rolling_min(values, window), result[window]['min'], equal_nan=True)
+    # 逐个bar更新的结果和批量计算一致
+    rolling_state = RollingExtrema(window_list)
+    stream_result = [rolling_state.update(value) for value in values]
+    for window in window_list:
+        for name in ['max', 'min', 'argmax', 'argmin']:
+            assert np.array_equal(np.array([row[window][name] for row in stream_result], dtype='float64'), result[window][name], equal_nan=True)
+
+
+def test_extrema_factor(init_data):
+    data = init_data.copy()
+    data = WilliamFactor([10]).caculate(data)
+    expected = (init_data['close'] - (init_data['high'].rolling(10).max() + init_data['low'].rolling(10).min())/2)/(init_data['high'].rolling(10).max() - init_data['low'].rolling(10).min())
+    assert np.allclose(data[WilliamFactor().get_key(10)].values, expected.fillna(0).values)
+    data = NDayHighFactor([20]).caculate(data)
+    expected = init_data['close'].rolling(20).apply(n_day_high_by_loop).fillna(0)
+    assert np.allclose(data[NDayHighFactor().get_key(20)].values, expected.values)
+    # 最新的价格就是窗口内的最低价时为50
+    data = NDayLowFactor([20]).caculate(data)
+    is_low = init_data['close'] == init_data['close'].rolling(20).min()
+    assert (data.loc[is_low, NDayLowFactor().get_key(20)] == 50).all()
+    assert (data[NDayLowFactor().get_key(20)].values[:19] == 0).all()
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_rolling_extrema.py"])
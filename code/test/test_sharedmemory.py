@@ -0,0 +1,53 @@
+import pytest
+
+import pandas as pd
+import numpy as np
+
+from framework import sharedmemory
+from framework.localconcurrent import PersistentProcessExecutor
+from framework.sharedmemory import dump_frame_to_shared_memory, load_frame_from_shared_memory, release_shared_memory
+
+"""
+共享内存传递dataframe测试，结果在常驻进程中写入，在当前进程中读取
+"""
+
+def create_frame(seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'datetime': ['2022-11-01 09:30:0' + str(i) for i in range(5)],
+        'close': rng.random(5),
+        'volume': rng.integers(0, 100, 5),
+        'time': ['09:30:00', None, '09:30:06', '09:30:09', '09:30:12']
+    }, index=pd.Index(range(10, 15), name='id'))
+
+
+def dump_task(seed):
+    return dump_frame_to_shared_memory(create_frame(seed))
+
+
+def release_task(arg):
+    # 返回关闭前保留的句柄数
+    count = len(sharedmemory._opened_shared_memory_list)
+    release_shared_memory()
+    return count
+
+
+def test_round_trip():
+    with PersistentProcessExecutor(1) as executor:
+        descriptor_list = executor.execute(dump_task, [1, 2, 3])
+        # 父进程读取之前，写入方的句柄一直保持打开
+        for seed, descriptor in zip([1, 2, 3], descriptor_list):
+            data = load_frame_from_shared_memory(descriptor)
+            expected = create_frame(seed)
+            assert data.index.equals(expected.index)
+            assert list(data.columns) == list(expected.columns)
+            assert np.array_equal(data['close'].values, expected['close'].values)
+            assert data['volume'].dtype == expected['volume'].dtype
+            assert data['time'].isnull().tolist() == expected['time'].isnull().tolist()
+        assert executor.execute(release_task, [0]) == [3]
+        assert executor.execute(release_task, [0]) == [0]
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_sharedmemory.py"])
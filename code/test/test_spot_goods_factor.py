@@ -0,0 +1,114 @@
+import pytest
+
+from datetime import datetime
+
+import pandas as pd
+import numpy as np
+
+from common.commonutils import local_divide
+from data import constituent
+from data.constituent import ConstituentIndex
+from factor.base_factor import get_second_of_day, safe_divide
+from factor.spot_goods_factor import TotalCommissionRatioFactor, UntradedStockRatioFactor, RisingFallingAmountRatioFactor
+
+"""
+现货因子向量化计算测试，和原来逐行apply的实现比较，股票数据随机生成，包含空值和分母为0的情形
+"""
+
+@pytest.fixture()
+def init_data(monkeypatch):
+    # 成分股索引不从配置文件加载
+    monkeypatch.setattr(constituent, 'constituent_index', ConstituentIndex({}, []))
+    rng = np.random.default_rng(2023)
+    time_list = ['09:25:00.000'] + ['09:30:{0:02d}.000'.format(second) for second in range(0, 12, 3)]
+    data_list = []
+    for stock in ['000001', '000002', '600519']:
+        data = pd.DataFrame({
+            'tscode': stock,
+            'date': '2022-11-01',
+            'time': time_list,
+            'weighted_average_bid_price': np.round(rng.uniform(9, 11, len(time_list)), 2),
+            'weighted_average_ask_price': np.round(rng.uniform(9, 11, len(time_list)), 2),
+            'total_bid_volume': rng.integers(0, 3, len(time_list)) * 100.0,
+            'total_ask_volume': rng.integers(0, 3, len(time_list)) * 100.0,
+            'volume': rng.integers(0, 2, len(time_list)) * 100.0,
+            'amount': rng.integers(0, 5, len(time_list)) * 1000.0,
+            'price': np.round(rng.uniform(9, 11, len(time_list)), 2),
+            'delta_price': rng.integers(-1, 2, len(time_list)) * 0.01
+        })
+        data_list.append(data)
+    data = pd.concat(data_list, ignore_index=True)
+    # 09:30:03所有股票都没有委托和成交，分母为0
+    is_empty = data['time'] == '09:30:03.000'
+    data.loc[is_empty, ['total_bid_volume', 'total_ask_volume', 'amount']] = 0.0
+    # 09:30:06有股票缺少委托价格
+    data.loc[(data['time'] == '09:30:06.000') & (data['tscode'] == '000001'), 'weighted_average_bid_price'] = np.nan
+    return data
+
+
+def ratio_by_loop(data, numerator, denominator):
+    """原来逐行apply的实现"""
+    data_group_by = data.rename(columns={'time': 'cur_time'}).groupby('cur_time')[[numerator, denominator]].sum(min_count=1)
+    return data_group_by.apply(lambda x: 0 if x[denominator] == 0 else x[numerator] / x[denominator], axis=1)
+
+
+def test_get_second_of_day():
+    time_series = pd.Series(['09:30:00.000', '11:29:57.500', '13:00:03.000', '14:59:59.999', '00:00:00.000'])
+    expected = list(map(lambda time: (datetime.strptime(time, '%H:%M:%S.%f') - datetime.strptime('00:00:00', '%H:%M:%S')).seconds, time_series))
+    second_of_day = get_second_of_day(time_series)
+    assert second_of_day.dtype == 'int64'
+    assert second_of_day.tolist() == expected
+    # 空值的时间结果为空值
+    second_of_day = get_second_of_day(pd.Series(['09:30:03.000', None, np.nan]))
+    assert second_of_day[0] == 34203
+    assert np.isnan(second_of_day[1:]).all()
+
+
+def test_safe_divide():
+    numerator = np.array([1.0, 0.0, -3.0, np.nan, np.nan, 2.0, 5.0, np.inf])
+    denominator = np.array([2.0, 0.0, 0.0, 0.0, 4.0, np.nan, -0.5, 1.0])
+    expected = np.array(list(map(lambda item: local_divide(item[0], item[1]), zip(numerator, denominator))), dtype='float64')
+    result = safe_divide(numerator, denominator)
+    assert np.array_equal(result, expected, equal_nan=True)
+    # 分母为0时为0，分子为空值时也一样
+    assert result[1] == 0 and result[2] == 0 and result[3] == 0
+    assert np.isnan(result[4]) and np.isnan(result[5])
+    # Series和标量
+    assert np.array_equal(safe_divide(pd.Series([1.0, 2.0]), 0), np.array([0.0, 0.0]))
+    assert np.array_equal(safe_divide(pd.Series([1.0, 2.0]), pd.Series([2, 4])), np.array([0.5, 0.5]))
+
+
+def test_ratio_factor(init_data):
+    data = init_data.copy()
+    data['ask_commission_amount'] = data['total_ask_volume'] * data['weighted_average_ask_price']
+    data['bid_commission_amount'] = data['total_bid_volume'] * data['weighted_average_bid_price']
+    data['total_commission_amount'] = data['ask_commission_amount'] + data['bid_commission_amount']
+    data = data[data['time'] > '09:30:00.000']
+    factor = TotalCommissionRatioFactor()
+    date, result = factor.execute_caculation('2022-11-01', init_data.copy())
+    expected = ratio_by_loop(data, 'bid_commission_amount', 'total_commission_amount')
+    assert result['time'].tolist() == expected.index.tolist()
+    assert np.array_equal(result[factor.get_key()].values, expected.values, equal_nan=True)
+    assert result.loc['09:30:03.000', factor.get_key()] == 0
+
+    data = init_data.copy()
+    data['total_count'] = 1
+    data['untraded_count'] = (data['volume'] == 0).astype('int64')
+    factor = UntradedStockRatioFactor()
+    date, result = factor.execute_caculation('2022-11-01', init_data.copy())
+    expected = ratio_by_loop(data[data['time'] > '09:30:00.000'], 'untraded_count', 'total_count')
+    assert np.allclose(result[factor.get_key()].values, expected.values)
+
+    data = init_data.copy()
+    data['diff_amount'] = np.where(data['delta_price'] > 0, data['amount'], np.where(data['delta_price'] < 0, -data['amount'], 0))
+    data['total_amount'] = data['amount']
+    factor = RisingFallingAmountRatioFactor()
+    date, result = factor.execute_caculation('2022-11-01', init_data.copy())
+    expected = ratio_by_loop(data[data['time'] > '09:30:00.000'], 'diff_amount', 'total_amount')
+    assert np.allclose(result[factor.get_key()].values, expected.values)
+    assert result.loc['09:30:03.000', factor.get_key()] == 0
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_spot_goods_factor.py"])
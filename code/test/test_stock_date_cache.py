@@ -0,0 +1,143 @@
+import pytest
+
+import pandas as pd
+import numpy as np
+
+from data import constituent
+from data.constituent import ConstituentIndex
+from factor import base_factor
+from factor.base_factor import StockDateCache, StockTickFactorGroup, TimewindowStockTickFactor, init_stock_tick_worker, caculate_by_date_in_worker, \
+    load_worker_result, distribute_cache_memory_budget
+from factor.spot_goods_factor import TotalCommissionRatioFactor
+
+"""
+跨天股票数据缓存测试，数据随机生成，不读取股票文件
+"""
+
+class RandomDataAccess():
+
+    def __init__(self):
+        self.access_count = 0
+
+    def access(self, date, stock):
+        self.access_count = self.access_count + 1
+        rng = np.random.default_rng(int(date.replace('-', '')) + int(stock))
+        return pd.DataFrame({'date': date, 'tscode': stock, 'price': rng.random(1000), 'volume': rng.random(1000)})
+
+
+class NextDateCalendar():
+
+    def get_next_n_transaction_date(self, date, n):
+        return {'2022-01-04': '2022-01-05', '2022-01-05': '2022-01-06'}.get(date, '')
+
+
+class WindowFactor(TimewindowStockTickFactor):
+
+    factor_code = 'WINDOW_FACTOR'
+    version = '1.0'
+
+
+def create_cache(memory_budget, timewindow_size=None, prefetch=False):
+    cache = StockDateCache(memory_budget, timewindow_size, prefetch)
+    cache._data_access = RandomDataAccess()
+    return cache
+
+
+def test_stock_date_cache():
+    data_size = int(RandomDataAccess().access('2022-01-04', '000001').memory_usage(deep=True).sum())
+    cache = create_cache(3 * data_size)
+    expected = cache.get_stock_data('2022-01-04', '000001')
+    assert cache.get_stock_data('2022-01-04', '000001') is expected
+    assert cache.get_hit_count() == 1 and cache.get_miss_count() == 1
+    for date in ['2022-01-05', '2022-01-06', '2022-01-07']:
+        cache.get_stock_data(date, '000001')
+    # 超出内存上限，淘汰最近最少使用的数据
+    assert cache.get_total_size() <= 3 * data_size
+    assert cache.get_eviction_count() == 1
+    assert ('000001', '2022-01-04') not in cache._stock_data_cache
+    assert cache.get_stock_data('2022-01-04', '000001').equals(expected)
+    assert cache._data_access.access_count == 5
+
+
+def test_stock_date_cache_by_timewindow():
+    data_size = int(RandomDataAccess().access('2022-01-04', '000001').memory_usage(deep=True).sum())
+    cache = create_cache(4 * data_size, 1)
+    cache.get_stock_data('2022-01-04', '000001')
+    cache.get_stock_data('2022-01-05', '000001')
+    cache.get_stock_data('2022-01-06', '000001')
+    # 最近使用过，但是在时间窗之外，优先淘汰
+    cache.get_stock_data('2022-01-04', '000001')
+    cache.get_stock_data('2022-01-06', '000002')
+    cache.get_stock_data('2022-01-06', '000003')
+    assert cache.get_eviction_count() == 1
+    assert ('000001', '2022-01-04') not in cache._stock_data_cache
+    assert ('000001', '2022-01-05') in cache._stock_data_cache
+    assert len(cache.get_stock_data_cache()['000001']) == 2
+    cache.remove_stock_data('2022-01-05', '000001')
+    assert cache.get_total_size() == 3 * data_size
+
+
+def test_prefetch(monkeypatch):
+    monkeypatch.setattr(base_factor, 'get_trading_calendar', lambda: NextDateCalendar())
+    data_size = int(RandomDataAccess().access('2022-01-04', '000001').memory_usage(deep=True).sum())
+    cache = create_cache(10 * data_size, prefetch=True)
+    cache.get_stock_data('2022-01-04', '000001')
+    # 下一个交易日的数据已经在后台加载，取数据时使用预取的结果，不会再次读取
+    cache._prefetch_dict[('000001', '2022-01-05')].result()
+    assert cache._data_access.access_count == 2
+    assert cache.get_stock_data('2022-01-05', '000001').equals(RandomDataAccess().access('2022-01-05', '000001'))
+    assert ('000001', '2022-01-05') not in cache._prefetch_dict
+    cache._prefetch_dict[('000001', '2022-01-06')].result()
+    assert cache._data_access.access_count == 3
+    # 没有下一个交易日时不预取
+    cache.get_stock_data('2022-01-06', '000001')
+    assert len(cache._prefetch_dict) == 0 and cache._data_access.access_count == 3
+    cache.clear()
+
+
+def test_distribute_cache_memory_budget(monkeypatch):
+    monkeypatch.setattr(constituent, 'constituent_index', ConstituentIndex({}, []))
+    window_factor = WindowFactor()
+    other_window_factor = WindowFactor()
+    factor_list = [StockTickFactorGroup([window_factor, TotalCommissionRatioFactor()]), other_window_factor]
+    # 每个进程都有两个缓存，所有进程的缓存加起来不超过总的上限
+    assert distribute_cache_memory_budget(factor_list, 10, 4000) == 200
+    assert window_factor.get_stock_date_cache().get_memory_budget() == 200
+    assert other_window_factor.get_stock_date_cache().get_memory_budget() == 200
+    assert distribute_cache_memory_budget([TotalCommissionRatioFactor()], 10, 4000) == 4000
+
+
+class CachedFactor():
+
+    def __init__(self):
+        self.clear_count = 0
+
+    def caculate_by_date(self, *args):
+        return args[0][0], pd.DataFrame({'date': [args[0][0]], 'value': [1.0]})
+
+    def clear_cache(self):
+        self.clear_count = self.clear_count + 1
+
+
+def test_clear_cache_in_worker():
+    data_size = int(RandomDataAccess().access('2022-01-04', '000001').memory_usage(deep=True).sum())
+    cache = create_cache(10 * data_size)
+    cache.get_stock_data('2022-01-04', '000001')
+    cache.clear()
+    assert cache.get_total_size() == 0 and len(cache.get_stock_data_cache()) == 0
+    # 常驻进程切换合约时清空因子的缓存
+    factor = CachedFactor()
+    init_stock_tick_worker([factor])
+    try:
+        for batch, instrument in [(1, 'IF2212'), (1, 'IF2212'), (2, 'IF2212'), (3, 'IF2301')]:
+            date, result = caculate_by_date_in_worker([batch, 0, ['2022-11-01', instrument, 'IF']])
+            assert load_worker_result(result)['value'].tolist() == [1.0]
+        assert factor.clear_count == 2
+    finally:
+        init_stock_tick_worker([])
+        base_factor.release_shared_memory()
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_stock_date_cache.py"])
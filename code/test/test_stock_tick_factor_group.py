@@ -0,0 +1,83 @@
+import pytest
+
+import pandas as pd
+import numpy as np
+
+from factor.base_factor import StockTickFactor, StockTickFactorGroup
+
+"""
+现货因子合并计算测试，股票数据随机生成，合并计算和逐个因子计算的结果比较
+"""
+
+class RandomStockTickFactor(StockTickFactor):
+    """不读取股票文件，按天随机生成股票数据的计算结果，部分日期没有数据"""
+
+    def __init__(self, factor_code, seed, missing_date=''):
+        self.factor_code = factor_code
+        self._params = [1]
+        self._seed = seed
+        self._missing_date = missing_date
+
+    def caculate_by_date(self, *args):
+        date = args[0][0]
+        if date == self._missing_date:
+            return date, pd.DataFrame()
+        rng = np.random.default_rng(self._seed + int(date.replace('-', '')))
+        # 包含没有对齐到3秒的时间
+        time = ['09:30:{0:02d}.000'.format(second) for second in range(0, 20)]
+        return date, pd.DataFrame({'time': time, self.get_key(1): rng.random(len(time))})
+
+
+class InProcessWorkerPool():
+    """在当前进程按天计算，代替常驻进程池"""
+
+    def caculate_by_date(self, factor, params_list):
+        if isinstance(factor, StockTickFactorGroup):
+            return list(map(lambda params: (params[0], list(map(lambda member: member.caculate_by_date(params)[1], factor.get_factor_list()))), params_list))
+        return list(map(factor.caculate_by_date, params_list))
+
+
+@pytest.fixture()
+def init_data():
+    data_list = []
+    for date in ['2022-11-01', '2022-11-02', '2022-11-03']:
+        datetime = pd.date_range(date + ' 09:30:00', periods=8, freq='3s').strftime('%Y-%m-%d %H:%M:%S.000000000')
+        data_list.append(pd.DataFrame({'product': 'IF', 'instrument': 'IF2212', 'date': date, 'datetime': datetime, 'close': np.arange(8.0)}))
+    return pd.concat(data_list, ignore_index=True)
+
+
+def test_group_caculate(init_data):
+    factor_list = [RandomStockTickFactor('stock_factor_a', 1), RandomStockTickFactor('stock_factor_b', 2, '2022-11-02'), RandomStockTickFactor('stock_factor_c', 3)]
+    worker_pool = InProcessWorkerPool()
+    group = StockTickFactorGroup(factor_list)
+    group.set_worker_pool(worker_pool)
+    result = group.caculate(init_data.copy())
+    assert result.columns.tolist() == group.get_factor_columns(init_data)
+    # 和逐个因子单独计算的结果一致，没有股票数据的日期不会重建索引，只比较值
+    result = result.reset_index(drop=True)
+    for factor in factor_list:
+        factor.set_worker_pool(worker_pool)
+        expected = factor.caculate(init_data.copy())
+        pd.testing.assert_series_equal(result[factor.get_key(1)], expected[factor.get_key(1)].reset_index(drop=True))
+    # 和顺序计算相比，只有股票数据的time列不再加后缀
+    expected = init_data.copy()
+    for factor in factor_list[:2]:
+        expected = factor.caculate(expected)
+    result = StockTickFactorGroup(factor_list[:2])
+    result.set_worker_pool(worker_pool)
+    result = result.caculate(init_data.copy()).reset_index(drop=True)
+    expected = expected.reset_index(drop=True)
+    assert set(expected.columns) - set(result.columns) == {'time_x', 'time_y', 'second_remainder_x', 'second_remainder_y'}
+    columns = result.columns.tolist()
+    columns.remove('time')
+    columns.remove('second_remainder')
+    pd.testing.assert_frame_equal(result[columns], expected[columns])
+    # 保留的time列来自第一个有股票数据的因子
+    is_matched = expected['time_x'].notnull()
+    assert (result.loc[is_matched, 'time'] == expected.loc[is_matched, 'time_x']).all()
+    assert result['time'].notnull().sum() == 21
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_stock_tick_factor_group.py"])
@@ -0,0 +1,50 @@
+import pytest
+
+import numpy as np
+
+from common.persistence.trading_calendar import TradingCalendar
+
+"""
+交易日历测试，和原来按SQL查询结果切片的逻辑比较，不依赖数据库
+"""
+
+@pytest.fixture()
+def init_calendar():
+    date_list = ['2022-01-04', '2022-01-05', '2022-01-06', '2022-01-07', '2022-01-10', '2022-01-11', '2022-01-12']
+    main_instrument_dict = {('IF', '2022-01-04'): 'IF2201', ('IF', '2022-01-05'): 'IF2201', ('IH', '2022-01-04'): 'IH2201'}
+    return date_list, TradingCalendar(date_list + ['2022-01-06'], main_instrument_dict)
+
+
+def test_transaction_date(init_calendar):
+    date_list, calendar = init_calendar
+    for current_date in ['2022-01-01', '2022-01-04', '2022-01-08', '2022-01-11', '2022-01-12', '2022-02-01']:
+        for n in [1, 2, 3, 6]:
+            next_list = list(filter(lambda date: date > current_date, date_list))
+            last_list = list(filter(lambda date: date < current_date, date_list))
+            last_list.reverse()
+            assert calendar.get_next_n_transaction_date(current_date, n) == (next_list[n - 1] if len(next_list) > n else '')
+            assert calendar.get_next_n_transaction_date_list(current_date, n) == (next_list[:n] if len(next_list) > n else [])
+            assert calendar.get_last_n_transaction_date(current_date, n) == (last_list[n - 1] if len(last_list) > n else '')
+            assert calendar.get_last_n_transaction_date_list(current_date, n) == (list(reversed(last_list[:n])) if len(last_list) > n else [])
+
+
+def test_shift(init_calendar):
+    date_list, calendar = init_calendar
+    dates = np.array(['2022-01-04', '2022-01-08', '2022-01-12', '2022-01-01'])
+    assert calendar.shift(dates, 1).tolist() == ['2022-01-05', '2022-01-10', '', '2022-01-04']
+    assert calendar.shift(dates, -1).tolist() == ['', '2022-01-07', '2022-01-11', '']
+    assert calendar.shift(dates, 2).tolist() == ['2022-01-06', '2022-01-11', '', '2022-01-05']
+
+
+def test_filter_date_and_main_instrument(init_calendar):
+    date_list, calendar = init_calendar
+    assert calendar.filter_date('2022-01-05', '2022-01-11') == ['2022-01-04', '2022-01-05', '2022-01-11', '2022-01-12']
+    assert calendar.filter_date('', '2022-01-11') == ['2022-01-11', '2022-01-12']
+    assert calendar.filter_date('2022-01-05') == ['2022-01-04', '2022-01-05']
+    assert calendar.get_main_instrument('IF', '2022-01-05') == 'IF2201'
+    assert calendar.get_main_instrument('IC', '2022-01-05') == ''
+
+
+if __name__ == '__main__':
+   # -s：打印print，-v打印用例执行的详细过程
+   pytest.main(["-s","-v","test_trading_calendar.py"])
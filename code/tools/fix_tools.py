@@ -26,6 +26,7 @@ from data.validation import StockFilterCompressValidator, FutureTickDataValidato
 from framework.localconcurrent import ProcessRunner
 from common.timeutils import date_alignment, add_milliseconds_suffix, datetime_advance, time_advance
 from data.access import StockDataAccess
+from data.constituent import get_constituent_index
 from common.timeutils import add_milliseconds_suffix, time_difference
 from common.log import get_logger
 from common.pandasutils import get_index_dict_by_value
@@ -107,9 +108,7 @@ def fix_stock_tick_data(year, month, date_list=[]):
     """
     root_path = STOCK_TICK_DATA_PATH
     file_prefix = STOCK_FILE_PREFIX
-    stocks_abstract_50 = pd.read_pickle(CONFIG_PATH + os.path.sep + '50_stocks_abstract.pkl')
-    stocks_abstract_300 = pd.read_pickle(CONFIG_PATH + os.path.sep + '300_stocks_abstract.pkl')
-    stocks_abstract_500 = pd.read_pickle(CONFIG_PATH + os.path.sep + '500_stocks_abstract.pkl')
+    constituent_index = get_constituent_index()
     month_folder_path = root_path + file_prefix + year + os.path.sep + file_prefix + year + month
     if len(date_list) == 0:
         date_list = list_files_in_path(month_folder_path)
@@ -117,9 +116,9 @@ def fix_stock_tick_data(year, month, date_list=[]):
     for date in date_list:
         if not re.match('[0-9]{8}', date):
             continue
-        stocks_50 = get_index_stock_list(date, stocks_abstract_50)
-        stocks_300 = get_index_stock_list(date, stocks_abstract_300)
-        stocks_500 = get_index_stock_list(date, stocks_abstract_500)
+        stocks_50 = constituent_index.get_stock_list('IH', date)
+        stocks_300 = constituent_index.get_stock_list('IF', date)
+        stocks_500 = constituent_index.get_stock_list('IC', date)
         stock_list = list(set(stocks_50 + stocks_300 + stocks_500))
         exists_stock_file_list = list_files_in_path(month_folder_path + os.path.sep + date)
         exists_stock_list = list(map(lambda item: item.split('.')[0], exists_stock_file_list))
@@ -27,6 +27,7 @@ from common.timeutils import date_format_transform
 from data.validation import StockFilterCompressValidator, FutureTickDataValidator, StockTickDataValidator, DtoStockValidationResult
 from framework.localconcurrent import ProcessRunner
 from data.access import create_stock_file_path
+from data.constituent import get_constituent_index
 from common.log import get_logger
 
 
@@ -46,9 +47,7 @@ def filter_stock_data(year, month, date_list=[], stock_file_list=[]):
     """
     root_path = STOCK_TICK_DATA_PATH
     file_prefix = STOCK_FILE_PREFIX
-    stocks_abstract_50 = pd.read_pickle(CONFIG_PATH + os.path.sep + '50_stocks_abstract.pkl')
-    stocks_abstract_300 = pd.read_pickle(CONFIG_PATH + os.path.sep + '300_stocks_abstract.pkl')
-    stocks_abstract_500 = pd.read_pickle(CONFIG_PATH + os.path.sep + '500_stocks_abstract.pkl')
+    constituent_index = get_constituent_index()
     month_folder_path = root_path + file_prefix + year + os.path.sep + file_prefix + year + month
     if len(date_list) == 0:
         date_list = list_files_in_path(month_folder_path)
@@ -57,9 +56,9 @@ def filter_stock_data(year, month, date_list=[], stock_file_list=[]):
         if not re.match('[0-9]{8}', date):
             continue
         print('Handle date %s' % date)
-        stocks_50 = get_index_stock_list(date, stocks_abstract_50)
-        stocks_300 = get_index_stock_list(date, stocks_abstract_300)
-        stocks_500 = get_index_stock_list(date, stocks_abstract_500)
+        stocks_50 = constituent_index.get_stock_list('IH', date)
+        stocks_300 = constituent_index.get_stock_list('IF', date)
+        stocks_500 = constituent_index.get_stock_list('IC', date)
         if len(stock_file_list) == 0:
             stock_file_list = list_files_in_path(month_folder_path + os.path.sep + date)
         for stock_file in stock_file_list:
@@ -435,15 +434,19 @@ def create_future_k_line_by_instrument(process_code,  checked_set, product, inst
     data = DataCleaner().process(data)
     data['date'] = data['datetime'].str[0:10]
     date_list = sorted(list(set(data['date'].tolist())))
+    date_list = list(filter(lambda date: instrument + date.replace('-', '') not in checked_set, date_list))
+    if len(date_list) == 0:
+        return
+    # 所有未处理的日期一次生成k线
+    k_line_data = FutureTickDataProcessorPhase1().process(data[data['date'].isin(date_list)])
+    k_line_data_by_date = dict(list(k_line_data.groupby(k_line_data['datetime'].str[0:10])))
     for date in date_list:
         date_replace = date.replace('-', '')
-        if instrument + date_replace in checked_set:
-            continue
-        date_data = data[data['date'] == date]
-        k_line_data = FutureTickDataProcessorPhase1().process(date_data)
+        date_k_line_data = k_line_data_by_date.get(date, k_line_data.iloc[0:0]).copy()
+        date_k_line_data.index = range(1, len(date_k_line_data) + 1)
         if not os.path.exists(FUTURE_TICK_TEMP_DATA_PATH + product + os.path.sep + instrument):
             os.makedirs(FUTURE_TICK_TEMP_DATA_PATH + product + os.path.sep + instrument)
-        save_compress(k_line_data, FUTURE_TICK_TEMP_DATA_PATH + product + os.path.sep + instrument + os.path.sep + date_replace + '.pkl')
+        save_compress(date_k_line_data, FUTURE_TICK_TEMP_DATA_PATH + product + os.path.sep + instrument + os.path.sep + date_replace + '.pkl')
         future_process_record = FutrueProcessRecord(process_code, instrument, date_replace, 0)
         session.add(future_process_record)
         session.commit()